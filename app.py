@@ -10,26 +10,36 @@ them to MatchMiner-compliant JSON formats.
 import time
 import os
 import json
+import gzip
+import hashlib
 import threading
-import subprocess
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional, Any
 
 # Third-party imports
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response
 from werkzeug.utils import secure_filename
 from urllib.parse import unquote
 from loguru import logger
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Local imports
 from utils.oncotree import (
     get_all_oncotree_data,
     get_children_of_term,
     build_diagnosis_result_from_path,
-    _read_oncotree_rows,
-    _row_path,
+    get_oncotree_index,
 )
 from utils.diagnosis_rules import DIAGNOSIS_DROPDOWN_RULES
+from utils.diagnosis_matcher import get_match_stats
+from utils.ai_cache import get_ai_cache
+from utils.ai_helper import submit_ai_call
+from utils.job_queue import get_job_queue, get_job_dispatcher
+from patient_data.ocr_service import get_page_images
 from patient_data.patient_data_config import patient_schema_keys, get_clinical_fields, is_clinical_field
 from patient_data.get_patient_clinical_data import get_oncotree_diagnosis, get_additional_info
 
@@ -89,62 +99,26 @@ class SequenceManager:
         return f"{date_prefix}-{next_seq:04d}"
 
 class BackgroundProcessor:
-    """Handles background script execution"""
-    
-    @staticmethod
-    def run_script_in_background(script_path: str, args: List[str], log_file: str, 
-                                start_msg: str, finish_msg: str) -> None:
-        """Run a script in the background with logging"""
-        def runner():
-            logger.info(start_msg)
-            try:
-                with open(log_file, 'a') as log_handle:
-                    process = subprocess.Popen(
-                        ['python', script_path] + args,
-                        stdout=log_handle,
-                        stderr=subprocess.STDOUT
-                    )
-                    process.wait()
-                logger.info(finish_msg)
-            except Exception as e:
-                logger.error(f"Background script failed: {str(e)}")
-        
-        threading.Thread(target=runner, daemon=True).start()
+    """Handles background conversion jobs"""
 
     @staticmethod
     def start_data_processing(unique_id: str, data_file: str) -> None:
-        """Start both clinical and genomic data processing in background"""
-        processing_configs = [
-            {
-                'script_path': Config.CLINICAL_SCRIPT,
-                'args': [data_file],
-                'log_file': Config.CLINICAL_LOG,
-                'start_msg': f"Starting clinical data conversion for {unique_id}",
-                'finish_msg': f"Completed clinical data conversion for {unique_id}",
-                'type': 'clinical'
-            },
-            {
-                'script_path': Config.GENOMIC_SCRIPT,
-                'args': [data_file],
-                'log_file': Config.GENOMIC_LOG,
-                'start_msg': f"Starting genomic data conversion for {unique_id}",
-                'finish_msg': f"Completed genomic data conversion for {unique_id}",
-                'type': 'genomic'
-            }
-        ]
-        
-        for config in processing_configs:
+        """Queue both clinical and genomic data processing; the job dispatcher runs them"""
+        job_queue = get_job_queue()
+        for job_type in ('clinical', 'genomic'):
             try:
-                BackgroundProcessor.run_script_in_background(
-                    script_path=config['script_path'],
-                    args=config['args'],
-                    log_file=config['log_file'],
-                    start_msg=config['start_msg'],
-                    finish_msg=config['finish_msg']
-                )
-                logger.info(f"Started background {config['type']} data processing for {unique_id}")
+                job_queue.enqueue(unique_id, job_type, data_file)
+                logger.info(f"Queued background {job_type} data processing for {unique_id}")
             except Exception as e:
-                logger.error(f"Failed to start {config['type']} data processing for {unique_id}: {str(e)}")
+                logger.error(f"Failed to queue {job_type} data processing for {unique_id}: {str(e)}")
+        get_job_dispatcher().wake()
+
+    @staticmethod
+    def start_ocr(unique_id: str) -> None:
+        """Queue OCR of the uploaded images; the review page polls /api/ocr/<mmid> for the text"""
+        get_job_queue().enqueue(unique_id, 'ocr', f"{unique_id}.txt")
+        logger.info(f"Queued OCR extraction for {unique_id}")
+        get_job_dispatcher().wake()
 
 class DataProcessor:
     """Handles data processing and file operations"""
@@ -199,11 +173,35 @@ class DataProcessor:
             raise
 
     @staticmethod
-    def process_uploaded_images(unique_id: str, image_files) -> Tuple[List[str], Optional[str]]:
-        """Process uploaded images: save files and run OCR extraction"""
+    def load_extracted_text(unique_id: str) -> Optional[str]:
+        """Read the extracted text saved for a submission, if any"""
+        file_path = os.path.join(Config.EXTRACTED_TEXT, f"{unique_id}.txt")
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def get_ocr_status(unique_id: str) -> Optional[Dict[str, Any]]:
+        """State of a submission's OCR job, with the extracted text once it has succeeded"""
+        job = get_job_queue().get_job(unique_id, 'ocr')
+        if not job:
+            return None
+        status = {'mmid': unique_id, 'state': job['state'], 'attempts': job['attempts'], 'error': job['error']}
+        if job['state'] == 'succeeded':
+            status['extracted_text'] = DataProcessor.load_extracted_text(unique_id) or ''
+        return status
+
+    @staticmethod
+    def process_uploaded_images(unique_id: str, image_files) -> List[str]:
+        """Process uploaded images: save files and queue OCR extraction in the background"""
         image_filenames = []
-        image_paths = []
-        
+
+        # Pages of an earlier upload for this ID must not end up in the new OCR run
+        for stale_path in get_page_images(unique_id):
+            os.remove(stale_path)
+
         # Save uploaded files
         for index, image_file in enumerate(image_files, 1):
             if image_file and image_file.filename:
@@ -212,41 +210,12 @@ class DataProcessor:
                 image_path = os.path.join(Config.IMAGE_FOLDER, image_filename)
                 image_file.save(image_path)
                 image_filenames.append(image_filename)
-                image_paths.append(image_path)
 
-        # Run OCR text extraction
-        if image_paths:
-            try:
-                # Run OCR extraction using the existing surya_ocr_text_extract.py script
-                result = subprocess.run(
-                    ['python', 'patient_data/surya_ocr_text_extract.py'] + image_paths + [unique_id],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                
-                # Log stderr if there's any output
-                if result.stderr:
-                    logger.warning(f"OCR script stderr for {unique_id}: {result.stderr}")
-                
-                # Read extracted text from the file created by the OCR script
-                extracted_text_file = os.path.join(Config.EXTRACTED_TEXT, f"{unique_id}.txt")
-                if os.path.exists(extracted_text_file):
-                    with open(extracted_text_file, 'r', encoding='utf-8') as f:
-                        extracted_text = f.read()
-                    logger.info(f"OCR extraction completed for {unique_id}")
-                    return image_filenames, extracted_text
-                else:
-                    logger.warning(f"Extracted text file not found for {unique_id}")
-                    return image_filenames, None
-            except subprocess.CalledProcessError as e:
-                logger.error(f"OCR processing failed for {unique_id}: {e.stderr}")
-                return image_filenames, None
-            except Exception as e:
-                logger.error(f"OCR processing failed for {unique_id}: {str(e)}")
-                return image_filenames, None
-            
-        return image_filenames, None
+        # OCR runs as a queued job on the resident OCR service, so the request returns right away
+        if image_filenames:
+            BackgroundProcessor.start_ocr(unique_id)
+
+        return image_filenames
 
 
 
@@ -268,6 +237,41 @@ class DataProcessor:
         else:
             logger.warning(f"No images were deleted for {unique_id}")
 
+class OncoTreePayloadCache:
+    """Caches the serialized OncoTree autocomplete payload per OncoTree file version"""
+
+    _index = None
+    _variants: Dict[str, Tuple[bytes, str]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_variants() -> Dict[str, Tuple[bytes, str]]:
+        """Return {content_encoding: (body, etag)}, rebuilding when the OncoTree index changes"""
+        index = get_oncotree_index()
+        if OncoTreePayloadCache._index is index:
+            return OncoTreePayloadCache._variants
+
+        with OncoTreePayloadCache._lock:
+            if OncoTreePayloadCache._index is not index:
+                body = json.dumps(index.autocomplete_data, separators=(',', ':')).encode('utf-8')
+                digest = hashlib.sha256(body).hexdigest()
+                variants = {'identity': (body, f'"{digest}"')}
+                variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+                if brotli is not None:
+                    variants['br'] = (brotli.compress(body), f'"{digest}-br"')
+                OncoTreePayloadCache._variants = variants
+                OncoTreePayloadCache._index = index
+                logger.info(f"Built OncoTree autocomplete payload: {len(body)} bytes, etag={digest[:12]}")
+            return OncoTreePayloadCache._variants
+
+    @staticmethod
+    def select_encoding(variants: Dict[str, Tuple[bytes, str]]) -> str:
+        """Pick the best pre-compressed variant the client accepts"""
+        for encoding in ('br', 'gzip'):
+            if encoding in variants and request.accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
 class DiagnosisProcessor:
     """Handles diagnosis processing and validation"""
     
@@ -390,25 +394,57 @@ def debug_oncotree():
         'level1_count': len(level1_list),
     })
 
+@app.route('/debug/diagnosis-matcher')
+def debug_diagnosis_matcher():
+    """Debug endpoint to check how free-text diagnoses were resolved by this worker"""
+    return jsonify(get_match_stats())
+
+@app.route('/debug/ai-cache')
+def debug_ai_cache():
+    """Debug endpoint to check AI response cache hit/miss metrics"""
+    cache = get_ai_cache()
+    return jsonify(cache.stats() if cache else {'enabled': False})
+
+@app.before_request
+def ensure_job_dispatcher():
+    # started lazily so that each gunicorn worker (not a preloading master) runs its own,
+    # resuming jobs queued before a restart
+    get_job_dispatcher()
+
+@app.route('/api/jobs/<mmid>')
+def job_status(mmid):
+    """Status of the clinical and genomic conversion jobs of a submission"""
+    jobs = get_job_queue().get_jobs(mmid)
+    if not jobs:
+        return jsonify({'error': f'No jobs found for {mmid}'}), 404
+    return jsonify({'mmid': mmid, 'jobs': jobs})
+
+@app.route('/api/ocr/<mmid>')
+def ocr_status(mmid):
+    """State of a submission's OCR job: queued, running, succeeded (with the text) or failed"""
+    status = DataProcessor.get_ocr_status(mmid)
+    if not status:
+        return jsonify({'error': f'No OCR job found for {mmid}'}), 404
+    return jsonify(status)
+
 @app.route('/api/oncotree-data')
 def get_oncotree_data():
     """API endpoint to get OncoTree data for client-side autocomplete"""
-    autocomplete_data = []
-    seen = set()
-    rows, level_columns = _read_oncotree_rows()
-    for row in rows:
-        path = _row_path(row, level_columns)
-        for index in range(1, len(path)):
-            key = (path[index - 1], path[index])
-            if key in seen:
-                continue
-            seen.add(key)
-            autocomplete_data.append({
-                'parent': path[index - 1],
-                'type': f'level{index + 1}',
-                'value': path[index]
-            })
-    return jsonify(autocomplete_data)
+    variants = OncoTreePayloadCache.get_variants()
+    encoding = OncoTreePayloadCache.select_encoding(variants)
+    body, etag = variants[encoding]
+
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={Config.ONCOTREE_DATA_MAX_AGE}, must-revalidate',
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
 
 @app.route('/get_oncotree_children/<path:parent_term>')
 def get_oncotree_children(parent_term: str):
@@ -495,6 +531,9 @@ def index():
             report_date = datetime.now().strftime('%Y-%m-%d')
             description = form_data.get('description', '')
 
+            # The description lookup is independent of OCR and diagnosis, so start it now and collect it below
+            additional_info_future = submit_ai_call(get_additional_info, unique_id, description) if description else None
+
             # Process uploaded images
             image_files = request.files.getlist('genomic_images')
             
@@ -503,13 +542,11 @@ def index():
             
             if has_new_images:
                 try:
-                    image_filenames, extracted_text = DataProcessor.process_uploaded_images(unique_id, image_files)
-                    logger.info(f"{unique_id} | Processed {len(image_filenames)} images ")
-                    
-                    # Store extracted text in session if available
-                    if extracted_text:
-                        session['extracted_text'] = extracted_text
-                        logger.info(f"{unique_id} | OCR extracted text :  Added to session -> key 'extracted_text', value : {{extracted_text}}")
+                    image_filenames = DataProcessor.process_uploaded_images(unique_id, image_files)
+                    logger.info(f"{unique_id} | Saved {len(image_filenames)} images, OCR queued")
+
+                    # The text of the previous images is stale; the review page fills in the new text
+                    session.pop('extracted_text', None)
                 except Exception as e:
                     logger.exception(f"Error processing images for {unique_id}: {str(e)}")
                     raise
@@ -593,7 +630,7 @@ def index():
             # Extract additional clinical/genomic info from AI
             if description:
                 logger.info(f"{unique_id} | Processing additional description")
-                additional_info_dict = get_additional_info(unique_id, description)
+                additional_info_dict = additional_info_future.result()
 
                 # Check for connection errors in the AI response
                 if isinstance(additional_info_dict, dict) and 'error' in additional_info_dict:
@@ -720,6 +757,11 @@ def review():
     session['dynamic_dropdowns'] = dynamic_dropdowns
     session['dynamic_texts'] = dynamic_texts
 
+    # OCR runs in the background; once it is done the text is shown directly, until then the page polls
+    ocr = DataProcessor.get_ocr_status(form_data.get('unique_id')) if form_data.get('genomic_images') else None
+    if ocr and ocr['state'] == 'succeeded' and not session.get('extracted_text'):
+        session['extracted_text'] = ocr['extracted_text']
+
     return render_template(
         'review.html',
         form_data=form_data,
@@ -729,6 +771,7 @@ def review():
         diagnosis_error=diagnosis_error,
         dynamic_dropdowns=dynamic_dropdowns,
         dynamic_texts=dynamic_texts,
+        ocr_state=ocr['state'] if ocr else None,
     )
 
 @app.route('/submit_review', methods=['POST'])
@@ -778,6 +821,12 @@ def submit_review():
         
         unique_id = form_data.get('unique_id')
         logger.info(f"Processing review submission for ID: {unique_id}")
+
+        # The genomic conversion reads the extracted text, and the images are deleted below
+        ocr = DataProcessor.get_ocr_status(unique_id) if form_data.get('genomic_images') else None
+        if ocr and ocr['state'] in ('queued', 'running'):
+            flash('Text extraction from the genomic report is still running, please wait for it to finish')
+            return redirect(url_for('review'))
         
         # Check if extracted text was modified during review
         original_text = session.get('extracted_text', '').strip()
@@ -33,9 +33,19 @@ class Config:
     CLINICAL_LOG = os.path.join(LOGS_DIR, 'get_patient_clinical_data.log')
     GENOMIC_LOG = os.path.join(LOGS_DIR, 'get_patient_genomic_data.log')
     APP_LOG = os.path.join(LOGS_DIR, 'app.log')
+    OCR_SERVICE_LOG = os.path.join(LOGS_DIR, 'ocr_service.log')
     
+    # Browser cache lifetime (seconds) for /api/oncotree-data; clients revalidate with the ETag afterwards
+    ONCOTREE_DATA_MAX_AGE = int(os.environ.get('ONCOTREE_DATA_MAX_AGE', 300))
+
     # Sequence file
     SEQUENCE_FILE = os.path.join(TEXT_FOLDER, '.sequence_counter.json')
+    JOB_QUEUE_PATH = os.path.join(BASE_DIR, 'patient_data', 'incoming', 'jobs.sqlite3')
+
+    # Unix socket of the resident OCR service (patient_data/ocr_service.py)
+    OCR_SERVICE_ADDRESS = os.path.join(BASE_DIR, 'cache', 'ocr_service.sock')
+    # Shared secret of the OCR service and its clients, generated on first use unless OCR_SERVICE_AUTHKEY is set
+    OCR_SERVICE_AUTHKEY_FILE = os.path.join(BASE_DIR, 'cache', 'ocr_service.key')
 
 GPU_SERVER_HOSTNAME = "http://gpu02.sbms.hku.hk"
 #Local_ai
@@ -55,4 +65,104 @@ CHAT_ENDPOINT = "v1/chat/completions"
 LLM_AI_MODEL = "neuralmagic/DeepSeek-R1-Distill-Qwen-32B-quantized.w4a16"
 
 ONCOTREE_TXT_FILE_PATH = "ref/oncotree_file.txt"
-GENE_LIST_FILE_PATH = "ref/genes.txt"
\ No newline at end of file
+GENE_LIST_FILE_PATH = "ref/genes.txt"
+CENSUS_GENE_LIST_FILE_PATH = "ref/census_gene_list.csv"
+# RefSeq accessions parsed from the census list, reused while the CSV's hash is unchanged
+CENSUS_CACHE_PATH = os.path.join(Config.BASE_DIR, 'cache', 'census_ref_seq_index.json')
+
+# Local diagnosis matcher: accept a local match scoring at or above DIAGNOSIS_MATCH_THRESHOLD and at least
+# DIAGNOSIS_MATCH_MARGIN above the best term on another branch (e.g. "clear cell carcinoma" is cervical,
+# renal or uterine), skip only the level-1 AI call at or above DIAGNOSIS_LEVEL1_MATCH_THRESHOLD,
+# otherwise use the AI
+DIAGNOSIS_MATCH_THRESHOLD = 0.85
+DIAGNOSIS_MATCH_MARGIN = 0.15
+DIAGNOSIS_LEVEL1_MATCH_THRESHOLD = 0.6
+REVIEWED_CLINICAL_DIR = "patient_data/reviewed/clinical"
+REVIEWED_GENOMIC_DIR = "patient_data/reviewed/genomic"
+# NDJSON/Parquet export of the reviewed corpus (patient_data/export_reviewed_corpus.py)
+REVIEWED_EXPORT_DIR = "patient_data/reviewed/export"
+
+# AI response cache (SQLite, shared by the app workers and the background scripts)
+AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+AI_CACHE_PATH = os.path.join(Config.BASE_DIR, 'cache', 'ai_response_cache.sqlite3')
+AI_CACHE_TTL_SECONDS = 30 * 24 * 3600
+AI_CACHE_MAX_ENTRIES = 20000
+AI_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# AI HTTP client: connection pool, timeouts (seconds), retries on 5xx/connection errors, circuit breaker
+AI_CONNECT_TIMEOUT = 5
+AI_READ_TIMEOUT = 300
+AI_POOL_MAXSIZE = 10
+AI_MAX_RETRIES = 2
+AI_RETRY_BACKOFF = 0.5
+AI_RETRY_BACKOFF_MAX = 8
+AI_CIRCUIT_FAILURE_THRESHOLD = 5
+AI_CIRCUIT_RESET_TIMEOUT = 30
+# Max in-flight AI requests per process (each gunicorn worker / background script has its own limit)
+AI_MAX_CONCURRENT_REQUESTS = 4
+# Stream chat completions and stop reading once the answer's JSON is complete
+AI_STREAM_RESPONSES = True
+
+# Worker processes per job type run by the web app (each gunicorn worker has its own pool).
+# OCR job workers only wait on the OCR service, which does the actual work
+OCR_JOB_WORKERS = 2
+CLINICAL_CONVERSION_WORKERS = 2
+GENOMIC_CONVERSION_WORKERS = 2
+# Job queue: running jobs per type across all web workers (paces the GPU server),
+# attempts per job with exponential retry backoff (seconds), and how long a running job may take
+# before another worker assumes it was lost
+OCR_MAX_RUNNING_JOBS = 4
+CLINICAL_MAX_RUNNING_JOBS = 2
+GENOMIC_MAX_RUNNING_JOBS = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 30
+JOB_RETRY_BACKOFF_MAX = 600
+JOB_LEASE_SECONDS = 3600
+JOB_POLL_INTERVAL = 5
+
+# Parallel Foundation Medicine XML ingest (--workers): AI requests in flight across all workers
+FMI_INGEST_AI_CONCURRENCY = 4
+# Reports already ingested (by content hash and parser version) are skipped by --xml-dir runs
+FMI_MANIFEST_ENABLED = True
+FMI_MANIFEST_PATH = os.path.join(Config.BASE_DIR, 'cache', 'fmi_ingest_manifest.sqlite3')
+# Each distinct submitted diagnosis is resolved once per ingest run and shared by its workers; set
+# FMI_DIAGNOSIS_MEMO_PATH (e.g. cache/fmi_diagnosis_memo.sqlite3) to keep the results across runs
+FMI_DIAGNOSIS_MEMO_ENABLED = True
+FMI_DIAGNOSIS_MEMO_PATH = None
+# Seconds after which a diagnosis still being resolved counts as abandoned (its owner's PID may have
+# been reused); covers the level-1 and child AI calls of one diagnosis
+FMI_DIAGNOSIS_MEMO_CLAIM_TIMEOUT = 900
+
+# Genomic extraction: variant lines per AI request, and how many chunk requests run at once
+GENOMIC_CHUNK_SIZE = 8
+GENOMIC_CHUNK_PARALLELISM = 4
+# Convert regular HGVS/fusion lines with the rule-based parser; only the rest goes to the AI
+GENOMIC_RULE_PARSER_ENABLED = True
+
+# OCR service: backend ('surya', 'tesseract', 'mock', or 'auto' = Surya on the GPU if Config.USE_GPU
+# and CUDA allow, otherwise Tesseract, otherwise Surya on CPU, otherwise the mock), whether the web
+# app starts the service on demand, and timeouts (seconds). The socket only accepts clients that know
+# OCR_SERVICE_AUTHKEY; without it, a random key is kept in Config.OCR_SERVICE_AUTHKEY_FILE (mode 0600)
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+OCR_SERVICE_AUTHKEY = os.environ.get('OCR_SERVICE_AUTHKEY')
+OCR_SERVICE_AUTOSTART = True
+OCR_SERVICE_START_TIMEOUT = 300
+OCR_REQUEST_TIMEOUT = 600
+# Pages run through the OCR models together (GPU), and OCR worker processes on CPU (Tesseract, Surya)
+OCR_BATCH_SIZE = 8
+OCR_CPU_WORKERS = 2
+# OCR image preprocessing (patient_data/image_preprocess.py): pages are converted to grayscale,
+# deskewed by up to OCR_DESKEW_MAX_ANGLE degrees (0 = off), cropped to the text plus OCR_CROP_MARGIN
+# pixels, split into tiles when taller than OCR_TILE_MAX_ASPECT x their width (0 = off), and
+# scaled down to at most OCR_MAX_IMAGE_SIDE pixels
+OCR_PREPROCESS_ENABLED = True
+OCR_MAX_IMAGE_SIDE = 2048
+OCR_DESKEW_MAX_ANGLE = 5.0
+OCR_CROP_MARGIN = 16
+OCR_TILE_MAX_ASPECT = 2.0
+# Extracted text per page image, keyed by the SHA-256 of the image bytes and the OCR engine version,
+# so that re-uploaded reports are not read again
+OCR_CACHE_ENABLED = True
+OCR_CACHE_PATH = os.path.join(Config.BASE_DIR, 'cache', 'ocr_result_cache.sqlite3')
+OCR_CACHE_MAX_ENTRIES = 5000
+OCR_CACHE_MAX_BYTES = 64 * 1024 * 1024
@@ -0,0 +1,171 @@
+"""
+Pack the reviewed corpus (patient_data/reviewed/clinical and reviewed/genomic, one small JSON
+file per sample each) into files that load with one sequential read:
+
+    corpus.ndjson     one line per sample: {"sample_id", "clinical", "genomic", "source_mtime_ns"}
+    samples.parquet   one row per sample (the clinical fields)
+    variants.parquet  one row per variant, with its SAMPLE_ID
+
+The export is rebuilt incrementally: records of samples whose two JSON files kept their mtimes
+are reused from the previous corpus.ndjson, only new or changed files are read. The Parquet files
+need pyarrow and are skipped without it.
+
+    python patient_data/export_reviewed_corpus.py [--full]
+"""
+import sys
+import os
+import json
+import argparse
+import importlib.util
+from typing import Dict, Iterator, Optional, Tuple
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loguru import logger
+
+import config
+
+# Whether the Parquet outputs can be written (pandas and pyarrow)
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None and importlib.util.find_spec('pandas') is not None
+if not PARQUET_AVAILABLE:
+    logger.warning("pyarrow not available: the reviewed corpus is exported as NDJSON only")
+
+NDJSON_FILE = 'corpus.ndjson'
+SAMPLES_PARQUET_FILE = 'samples.parquet'
+VARIANTS_PARQUET_FILE = 'variants.parquet'
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_atomic(path: str, write) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def iter_corpus(ndjson_path: Optional[str] = None) -> Iterator[dict]:
+    """Stream the sample records of an exported corpus.ndjson"""
+    ndjson_path = ndjson_path or os.path.join(config.REVIEWED_EXPORT_DIR, NDJSON_FILE)
+    with open(ndjson_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def scan_reviewed_files(clinical_dir: str, genomic_dir: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """{sample_id: (clinical mtime_ns, genomic mtime_ns)} of the reviewed JSONs; None for a missing half"""
+    names = set()
+    for directory in (clinical_dir, genomic_dir):
+        if os.path.isdir(directory):
+            names.update(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+    return {
+        sample_id: (_mtime_ns(os.path.join(clinical_dir, f"{sample_id}.json")),
+                    _mtime_ns(os.path.join(genomic_dir, f"{sample_id}.json")))
+        for sample_id in sorted(names)
+    }
+
+
+def _columnar(records: list):
+    import pandas as pd
+
+    samples = pd.DataFrame([{'SAMPLE_ID': record['sample_id'], **record['clinical']} for record in records])
+    variants = pd.DataFrame([
+        {'SAMPLE_ID': record['sample_id'], **variant}
+        for record in records for variant in record['genomic']
+    ])
+    for frame in (samples, variants):
+        for column in frame.columns[frame.dtypes == object]:
+            # Parquet needs one type per column: mixed values (e.g. "0" and 0) are stored as JSON text
+            kinds = {type(value) for value in frame[column] if value is not None and value == value}
+            if len(kinds) > 1 or kinds - {str, bool}:
+                frame[column] = [None if value is None or value != value else
+                                 value if isinstance(value, str) else json.dumps(value) for value in frame[column]]
+    return samples, variants
+
+
+def export_reviewed_corpus(clinical_dir: Optional[str] = None, genomic_dir: Optional[str] = None,
+                           export_dir: Optional[str] = None, full: bool = False) -> dict:
+    """
+    Bring the export in `export_dir` up to date with the reviewed JSONs and return counts of the
+    samples read from their files ('parsed'), reused from the previous export ('reused') and
+    dropped because their files are gone ('removed'). `full` re-reads every file.
+    """
+    clinical_dir = clinical_dir or config.REVIEWED_CLINICAL_DIR
+    genomic_dir = genomic_dir or config.REVIEWED_GENOMIC_DIR
+    export_dir = export_dir or config.REVIEWED_EXPORT_DIR
+    os.makedirs(export_dir, exist_ok=True)
+    ndjson_path = os.path.join(export_dir, NDJSON_FILE)
+    parquet_paths = [os.path.join(export_dir, name) for name in (SAMPLES_PARQUET_FILE, VARIANTS_PARQUET_FILE)]
+
+    previous = {}
+    if not full and os.path.exists(ndjson_path):
+        previous = {record['sample_id']: record for record in iter_corpus(ndjson_path)}
+
+    records, stats = [], {'parsed': 0, 'reused': 0, 'removed': 0, 'failed': 0}
+    for sample_id, (clinical_mtime, genomic_mtime) in scan_reviewed_files(clinical_dir, genomic_dir).items():
+        mtimes = {'clinical': clinical_mtime, 'genomic': genomic_mtime}
+        record = previous.pop(sample_id, None)
+        if record is None or record['source_mtime_ns'] != mtimes:
+            try:
+                record = {
+                    'sample_id': sample_id,
+                    'clinical': _read_json(os.path.join(clinical_dir, f"{sample_id}.json"), {}),
+                    'genomic': _read_json(os.path.join(genomic_dir, f"{sample_id}.json"), []),
+                    'source_mtime_ns': mtimes,
+                }
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Skipping reviewed sample {sample_id}: {e}")
+                stats['failed'] += 1
+                continue
+            if clinical_mtime is None or genomic_mtime is None:
+                logger.warning(f"Reviewed sample {sample_id} has no {'clinical' if clinical_mtime is None else 'genomic'} JSON")
+            stats['parsed'] += 1
+        else:
+            stats['reused'] += 1
+        records.append(record)
+    stats['removed'] = len(previous)
+
+    changed = stats['parsed'] or stats['removed'] or stats['failed'] or not os.path.exists(ndjson_path)
+    if changed:
+        def write_ndjson(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                    f.write('\n')
+        _write_atomic(ndjson_path, write_ndjson)
+
+    if PARQUET_AVAILABLE and (changed or not all(os.path.exists(path) for path in parquet_paths)):
+        for frame, path in zip(_columnar(records), parquet_paths):
+            _write_atomic(path, lambda tmp_path: frame.to_parquet(tmp_path, index=False))
+
+    logger.info(f"Reviewed corpus export | {len(records)} samples in {export_dir}: {stats}")
+    return stats
+
+
+def main(full: bool = False):
+    stats = export_reviewed_corpus(full=full)
+    print(f"Exported {stats['parsed'] + stats['reused']} samples to {config.REVIEWED_EXPORT_DIR} "
+          f"({stats['parsed']} read, {stats['reused']} unchanged, {stats['removed']} removed, {stats['failed']} failed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the reviewed clinical/genomic JSONs as NDJSON and Parquet.")
+    parser.add_argument("--full", action="store_true", help="Re-read every reviewed JSON instead of only new or changed ones")
+    args = parser.parse_args()
+
+    main(args.full)
@@ -0,0 +1,263 @@
+"""
+Deterministic parser for the regular variant lines found in OCR'd genomic reports, e.g.
+
+    TP53 R337C NM_000546.4: c.1009C>T(p.R337C), 1009C>T, chr17:7574018 46.45%
+    ROS1 fusion GOPC(NM_020399)-ROS1(NM_002944) fusion (G8; R35)
+
+Lines it cannot turn into MatchMiner genomic entries are handed back so that only
+those go to the AI.
+"""
+import sys
+import os
+import re
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+
+HGVS_PATTERN = re.compile(
+    r'NM_\d+(?:\.\d+)?:\s*c\.(?P<cdna>[^\s(,]+)(?:\((?P<protein>p\.[^)\s]*)\))?'
+)
+FUSION_PATTERN = re.compile(
+    r'(?P<left>[A-Z][A-Z0-9-]*)\(NM_\d+(?:\.\d+)?\)\s*-\s*(?P<right>[A-Z][A-Z0-9-]*)\(NM_\d+(?:\.\d+)?\)\s*fusion',
+    re.IGNORECASE,
+)
+POSSIBLE_GENES_PATTERN = re.compile(r'Possible Gene\(s\):\s*(?P<genes>.+)$')
+GENE_ONLY_LINE_PATTERN = re.compile(r'^\(?(?P<gene>[A-Z][A-Z0-9-]+)\)?$')
+# a line continuing the previous gene starts with the protein change, e.g. "L93fs*30 NM_000546.4: ..."
+CONTINUATION_LINE_PATTERN = re.compile(r'^(?:p\.)?[A-Z*]\d+')
+# the usual "GENE ALTERATION NM_..." layout names the gene even when it is missing from the gene list
+GENE_ALTERATION_LINE_PATTERN = re.compile(r'^(?P<gene>[A-Z][A-Z0-9-]+)\s+(?:p\.)?[A-Z*]\d+\S*\s+NM_')
+VARIANT_LINE_PATTERN = re.compile(r'NM_\d+|\bfusion\b|amplification|\bloss\b|deletion', re.IGNORECASE)
+IDH_WILDTYPE_PATTERN = re.compile(r'^\s*IDH_WILDTYPE\s*:\s*(?P<value>true|false)\s*$', re.IGNORECASE | re.MULTILINE)
+
+# cDNA: c.4715+1G>A / c.-124C>T / c.1285del / c.1304dup / c.811_814del / c.100_101insA / c.12_14delinsG
+CDNA_INTRONIC_PATTERN = re.compile(r'^\d+(?P<offset>[+-]\d+)')
+CDNA_EDIT_PATTERN = re.compile(
+    r'^(?P<start>\d+)(?:_(?P<end>\d+))?(?P<edit>delins|del|dup|ins)(?P<seq>[ACGTN]*|\d*)$', re.IGNORECASE
+)
+
+# protein: p.R177H / p.Q582* / p.H429Tfs*39 / p.E746_A750del / p.*757Lext*? / p.M1? / p.R177=
+PROTEIN_SUBSTITUTION_PATTERN = re.compile(r'^p\.(?P<ref>[A-Z])(?P<pos>\d+)(?P<alt>[A-Z]|=)$')
+PROTEIN_NONSENSE_PATTERN = re.compile(r'^p\.[A-Z]\d+(?:\*|X)$')
+PROTEIN_FRAMESHIFT_PATTERN = re.compile(r'^p\.[A-Z]\d+[A-Z]?fs(?:\*\d+|\*\?)?$')
+PROTEIN_INFRAME_PATTERN = re.compile(r'^p\.[A-Z]\d+(?:_[A-Z]\d+)?(?P<edit>delins|del|dup|ins)[A-Z]*$')
+PROTEIN_NONSTOP_PATTERN = re.compile(r'^p\.(?:\*|X)\d+[A-Z]ext')
+PROTEIN_START_PATTERN = re.compile(r'^p\.M1(?:[A-Z?]|\?)')
+
+THREE_LETTER_AMINO_ACIDS = {
+    'Ala': 'A', 'Arg': 'R', 'Asn': 'N', 'Asp': 'D', 'Cys': 'C', 'Gln': 'Q', 'Glu': 'E', 'Gly': 'G',
+    'His': 'H', 'Ile': 'I', 'Leu': 'L', 'Lys': 'K', 'Met': 'M', 'Phe': 'F', 'Pro': 'P', 'Ser': 'S',
+    'Thr': 'T', 'Trp': 'W', 'Tyr': 'Y', 'Val': 'V', 'Ter': '*',
+}
+THREE_LETTER_PATTERN = re.compile('|'.join(THREE_LETTER_AMINO_ACIDS))
+
+_known_genes = None
+
+
+def get_known_genes() -> set:
+    global _known_genes
+    if _known_genes is None:
+        with open(config.GENE_LIST_FILE_PATH) as f:
+            _known_genes = {line.strip() for line in f if line.strip()}
+    return _known_genes
+
+
+def _to_one_letter(protein: str) -> str:
+    return THREE_LETTER_PATTERN.sub(lambda match: THREE_LETTER_AMINO_ACIDS[match.group(0)], protein)
+
+
+def _cdna_length_change(cdna: str):
+    """Net inserted minus deleted bases for del/dup/ins/delins edits, or None when it cannot be told"""
+    match = CDNA_EDIT_PATTERN.match(cdna)
+    if not match:
+        return None
+    start = int(match.group('start'))
+    end = int(match.group('end') or start)
+    edit = match.group('edit').lower()
+    seq = match.group('seq')
+    inserted = int(seq) if seq.isdigit() else len(seq)
+    if edit == 'del':
+        return -(end - start + 1)
+    if edit == 'dup':
+        return end - start + 1
+    if edit == 'ins':
+        return inserted or None
+    if not seq:
+        return None
+    return inserted - (end - start + 1)
+
+
+def classify_hgvs(cdna: str, protein: str = None):
+    """
+    Infer TRUE_VARIANT_CLASSIFICATION from the HGVS cDNA/protein change, or None if unsure.
+    """
+    if cdna.startswith('-'):
+        return "5'Flank"
+
+    intronic = CDNA_INTRONIC_PATTERN.match(cdna)
+    if intronic:
+        offset = abs(int(intronic.group('offset')))
+        if offset <= 2:
+            return 'Splice_Site'
+        if offset <= 8:
+            return 'Splice_Region'
+        return 'Intron'
+
+    if not protein or protein in ('p.?', 'p.(?)'):
+        return None
+    protein = _to_one_letter(protein)
+    length_change = _cdna_length_change(cdna)
+    cdna_edit = cdna.lower()
+
+    if PROTEIN_FRAMESHIFT_PATTERN.match(protein):
+        if length_change is not None:
+            return 'Frame_Shift_Del' if length_change < 0 else 'Frame_Shift_Ins'
+        if 'delins' in cdna_edit:
+            return None
+        if 'del' in cdna_edit:
+            return 'Frame_Shift_Del'
+        if 'dup' in cdna_edit or 'ins' in cdna_edit:
+            return 'Frame_Shift_Ins'
+        return None
+    if PROTEIN_NONSENSE_PATTERN.match(protein):
+        return 'Nonsense_Mutation'
+    if PROTEIN_NONSTOP_PATTERN.match(protein):
+        return 'Nonstop_Mutation'
+    if PROTEIN_START_PATTERN.match(protein):
+        return 'Translation_Start_Site'
+
+    inframe = PROTEIN_INFRAME_PATTERN.match(protein)
+    if inframe:
+        if length_change:
+            return 'In_Frame_Del' if length_change < 0 else 'In_Frame_Ins'
+        edit = inframe.group('edit')
+        if edit == 'del':
+            return 'In_Frame_Del'
+        if edit in ('ins', 'dup'):
+            return 'In_Frame_Ins'
+        return None
+
+    substitution = PROTEIN_SUBSTITUTION_PATTERN.match(protein)
+    if substitution:
+        if substitution.group('alt') in ('=', substitution.group('ref')):
+            return 'Silent'
+        return 'Missense_Mutation'
+    return None
+
+
+def _line_gene(line: str, pending_gene: str = None):
+    known_genes = get_known_genes()
+    first_token = line.split()[0].strip('():,') if line.split() else ''
+    if first_token in known_genes:
+        return first_token
+    gene_alteration = GENE_ALTERATION_LINE_PATTERN.match(line)
+    if gene_alteration:
+        return gene_alteration.group('gene')
+
+    possible_genes = POSSIBLE_GENES_PATTERN.search(line)
+    if possible_genes:
+        genes = [gene.strip() for gene in possible_genes.group('genes').split(',') if gene.strip()]
+        if len(set(genes)) == 1:
+            return genes[0]
+    if CONTINUATION_LINE_PATTERN.match(first_token):
+        return pending_gene
+    return None
+
+
+def _fusion_gene(line: str, partners: tuple):
+    # the gene the report lists the fusion under, e.g. ROS1 for "ROS1 fusion GOPC(...)-ROS1(...) fusion"
+    first_token = line.split()[0].strip('():,').upper()
+    if first_token in partners:
+        return first_token
+    possible_genes = POSSIBLE_GENES_PATTERN.search(line)
+    if possible_genes:
+        genes = {gene.strip() for gene in possible_genes.group('genes').split(',')} & set(partners)
+        if len(genes) == 1:
+            return genes.pop()
+    return None
+
+
+def parse_variant_line(line: str, pending_gene: str = None):
+    """
+    Parse one report line into MatchMiner genomic entries.
+    Returns a list of entries, or None if the line is not in a form this parser understands.
+    """
+    fusion = FUSION_PATTERN.search(line)
+    if fusion:
+        left, right = fusion.group('left').upper(), fusion.group('right').upper()
+        gene = _fusion_gene(line, (left, right))
+        if not gene:
+            return None
+        return [{
+            "WILDTYPE": False,
+            "TRUE_HUGO_SYMBOL": gene,
+            "VARIANT_CATEGORY": "SV",
+            "LEFT_PARTNER_GENE": left,
+            "RIGHT_PARTNER_GENE": right,
+        }]
+
+    hgvs_matches = HGVS_PATTERN.findall(line)
+    if len(hgvs_matches) != 1:
+        return None
+    cdna, protein = hgvs_matches[0]
+    gene = _line_gene(line, pending_gene)
+    classification = classify_hgvs(cdna, protein or None)
+    if not gene or not classification:
+        return None
+
+    entry = {
+        "WILDTYPE": False,
+        "TRUE_HUGO_SYMBOL": gene,
+        "VARIANT_CATEGORY": "MUTATION",
+        "TRUE_VARIANT_CLASSIFICATION": classification,
+    }
+    if protein and protein not in ('p.?', 'p.(?)'):
+        entry["TRUE_PROTEIN_CHANGE"] = _to_one_letter(protein)
+    return [entry]
+
+
+def parse_genomic_report(text: str):
+    """
+    Parse every variant line of an (annotated) OCR report.
+    Returns (entries, unparsed_text) where unparsed_text holds the variant lines that could not
+    be parsed, each preceded by the non-variant lines (e.g. a gene name) directly above it.
+    """
+    entries = []
+    unparsed_lines = []
+    context_lines = []
+    pending_gene = None
+
+    for line in text.strip().split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if not VARIANT_LINE_PATTERN.search(stripped):
+            gene_only = GENE_ONLY_LINE_PATTERN.match(stripped)
+            if gene_only and not stripped.startswith('('):
+                # an unknown symbol still ends the previous gene's block
+                pending_gene = gene_only.group('gene') if gene_only.group('gene') in get_known_genes() else None
+            context_lines.append(line)
+            continue
+
+        parsed = parse_variant_line(stripped, pending_gene)
+        if parsed is None:
+            unparsed_lines.extend(context_lines + [line])
+        else:
+            entries.extend(parsed)
+            if parsed[0]["VARIANT_CATEGORY"] == "MUTATION":
+                # a following line without a gene symbol (e.g. a second TP53 variant) belongs to this gene
+                pending_gene = parsed[0]["TRUE_HUGO_SYMBOL"]
+        context_lines = []
+
+    return entries, "\n".join(unparsed_lines)
+
+
+def parse_clinical_genomic_fields(clinical_text: str) -> list:
+    """
+    Genomic entries implied by the clinical data file: IDH_WILDTYPE adds IDH1 and IDH2 entries.
+    """
+    match = IDH_WILDTYPE_PATTERN.search(clinical_text or '')
+    if not match:
+        return []
+    wildtype = match.group('value').lower() == 'true'
+    return [{"WILDTYPE": wildtype, "TRUE_HUGO_SYMBOL": gene} for gene in ("IDH1", "IDH2")]
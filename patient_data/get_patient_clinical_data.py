@@ -3,8 +3,10 @@ import os
 import json 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
+import config
 import utils.ai_helper as ai
 import utils.oncotree as onct
+import utils.diagnosis_matcher as dm
 import argparse
 from datetime import datetime
 from loguru import logger
@@ -19,31 +21,51 @@ def get_oncotree_diagnosis(mmid, value):
     """
     Oncotree diagnosis mapping:
     1. If value is an exact OncoTree term at any level, resolve full hierarchy
-    2. Otherwise use AI to find level1, then the closest descendant term
+    2. Otherwise rank OncoTree terms locally and accept a match scoring >= config.DIAGNOSIS_MATCH_THRESHOLD
+       that leads the runner-up on another branch by config.DIAGNOSIS_MATCH_MARGIN
+    3. Otherwise use AI to find level1 (skipped when the local ranking already implies it),
+       then the closest descendant term
     """
     level_1_list, mapping_l1_all = onct.get_all_oncotree_data()
 
     exact_match = onct.resolve_diagnosis_hierarchy(value)
     if exact_match:
+        dm.record_match_path('exact')
         logger.info(
             f"MMID: {mmid} | Found exact match: {exact_match['primary_diagnosis']} "
             f"(path={exact_match['path']})"
         )
         return exact_match
 
-    logger.info(f"MMID: {mmid} | No exact match found, using AI for: {value}")
+    matcher = dm.get_diagnosis_matcher()
+    local_match = matcher.confident_match(value, config.DIAGNOSIS_MATCH_THRESHOLD, config.DIAGNOSIS_MATCH_MARGIN)
+    if local_match:
+        dm.record_match_path('local')
+        logger.info(
+            f"MMID: {mmid} | Found local match: {local_match['term']} "
+            f"(score={local_match['score']}, source={local_match['source']}, path={local_match['path']})"
+        )
+        return onct.build_diagnosis_result_from_path(local_match['path'])
 
-    result = ai.get_level1_diagnosis_from_free_text(mmid, {value}, level_1_list)
+    level1_diagnosis = matcher.match_level1(value, config.DIAGNOSIS_LEVEL1_MATCH_THRESHOLD)
+    if level1_diagnosis:
+        dm.record_match_path('local_level1')
+        logger.info(f"MMID: {mmid} | No confident local match, level1 from local ranking: {level1_diagnosis}")
+    else:
+        dm.record_match_path('ai')
+        logger.info(f"MMID: {mmid} | No exact or local match found, using AI for: {value}")
 
-    if isinstance(result, dict) and 'error' in result:
-        logger.error(f"MMID: {mmid} | AI service error: {result.get('message', 'Unknown error')}")
-        raise Exception(f"AI service error: {result.get('message', 'Unknown error')}")
+        result = ai.get_level1_diagnosis_from_free_text(mmid, {value}, level_1_list)
 
-    level1_diagnosis = onct.canonicalize_term(result.get('oncotree_diagnosis'), level_1_list)
+        if isinstance(result, dict) and 'error' in result:
+            logger.error(f"MMID: {mmid} | AI service error: {result.get('message', 'Unknown error')}")
+            raise Exception(f"AI service error: {result.get('message', 'Unknown error')}")
 
-    if not level1_diagnosis:
-        logger.debug(f"MMID: {mmid} | No level1 diagnosis found for: {value}")
-        return None
+        level1_diagnosis = onct.canonicalize_term(result.get('oncotree_diagnosis'), level_1_list)
+
+        if not level1_diagnosis:
+            logger.debug(f"MMID: {mmid} | No level1 diagnosis found for: {value}")
+            return None
 
     child_oncotree_values = mapping_l1_all.get(level1_diagnosis, set())
     if not child_oncotree_values:
@@ -139,15 +161,18 @@ def get_additional_info(mmid, additional_info):
     additional_info_dict = ai.get_additional_info(mmid, additional_info)
     return additional_info_dict
 
+def main(text_file: str):
+    logger.info(f"Starting get_patient_clinical_data.py for file: {text_file}")
+    response = convert_to_clinical_data_format(text_file)
+    current_dir = os.path.dirname(__file__)
+    output_file = os.path.join(current_dir, clinical_json_dir, f'{os.path.splitext(text_file)[0]}.json')
+    with open(output_file, "w") as json_file:
+        json.dump(response, json_file)
+    logger.info(f'JSON written to {output_file}')
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert plain text patient clinical data to matchminer compliant JSON structure.")
     parser.add_argument("text_file", type=str, help="Name of text file containing clinical data")
     args = parser.parse_args()
 
-    logger.info(f"Starting get_patient_clinical_data.py for file: {args.text_file}")
-    response = convert_to_clinical_data_format(args.text_file)
-    current_dir = os.path.dirname(__file__)
-    output_file = os.path.join(current_dir, clinical_json_dir, f'{os.path.splitext(args.text_file)[0]}.json')
-    with open(output_file, "w") as json_file:
-        json.dump(response, json_file)
-    logger.info(f'JSON written to {output_file}')
+    main(args.text_file)
@@ -1,18 +1,34 @@
 import sys
 import os
+import io
 import json
+import time
+import shutil
 import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from loguru import logger
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 from lxml import etree
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import config
 from patient_data.patient_data_config import patient_schema_keys, get_clinical_fields, is_clinical_field
+from utils.ingest_manifest import IngestManifest
+from utils.sqlite_store import hash_file
+from utils.diagnosis_memo import DiagnosisMemo
 
 logger.add("logs/get_patient_foundation_med_data.log", rotation="10 MB", retention="10 days", enqueue=True)
 
+# set during batch ingests, see use_diagnosis_memo
+_diagnosis_memo = None
+
+# bump when a change to the parser changes the JSON it writes (reports listed in the ingest manifest are then reprocessed)
+FMI_PARSER_VERSION = 1
+
 # Mapping from matchminer keys to XML tags
 mm_patient_to_xml_tag_map = {
     "SAMPLE_ID": "ReportId",
@@ -37,6 +53,20 @@ NAMESPACES = {
     'variant': 'http://foundationmedicine.com/compbio/variant-report-external'
 }
 
+# Clark-notation tags of the elements read by scan_foundation_med_xml
+_PMI_TAGS = ("ReportId", "DOB", "Gender", "SubmittedDiagnosis", "Pathologist", "CopiedPhysician1", "ReceivedDate")
+_RESULTS_PAYLOAD = f"{{{NAMESPACES['rr']}}}ResultsPayload"
+_VARIANT_REPORT = f"{{{NAMESPACES['variant']}}}variant-report"
+_BIOMARKERS = f"{{{NAMESPACES['variant']}}}biomarkers"
+_SHORT_VARIANT = f"{{{NAMESPACES['variant']}}}short-variant"
+_COPY_NUMBER_ALTERATION = f"{{{NAMESPACES['variant']}}}copy-number-alteration"
+_REARRANGEMENT = f"{{{NAMESPACES['variant']}}}rearrangement"
+_TMB_SCORE = etree.XPath('.//variant:tumor-mutation-burden/@score', namespaces=NAMESPACES)
+_MSI_STATUS = etree.XPath('.//variant:microsatellite-instability/@status', namespaces=NAMESPACES)
+# Narrative blocks of the FinalReport (gene interpretations, trials, references), which make up most
+# of a report: freed as they end without being read
+_NARRATIVE_TAGS = ("Genes", "Trials", "References")
+
 def supplement_mandatory_clinical_fields(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     patient_data["FIRST_NAME"] = "NA"
     patient_data["LAST_NAME"] = "NA"
@@ -47,10 +77,10 @@ def supplement_mandatory_clinical_fields(patient_data: Dict[str, Any]) -> Dict[s
     patient_data["TEST_NAME"] = "oncopanel"
     return patient_data
 
-def extract_variants_from_xml(root: etree.Element, gene_vus_mapping:dict ) -> list:
+def extract_variants_from_xml(short_variants: list, gene_vus_mapping:dict ) -> list:
     variants = []
 
-    for variant in root.xpath('//variant:short-variant', namespaces=NAMESPACES):
+    for variant in short_variants:
         gene = variant.get('gene')
         if not gene:
             continue
@@ -76,10 +106,10 @@ def extract_variants_from_xml(root: etree.Element, gene_vus_mapping:dict ) -> li
 
     return variants
 
-def extract_cnvs_from_xml(root: etree.Element, gene_vus_mapping:dict) -> list:
+def extract_cnvs_from_xml(copy_number_alterations: list, gene_vus_mapping:dict) -> list:
     cnvs = []
 
-    for cnv in root.xpath('//variant:copy-number-alteration', namespaces=NAMESPACES):
+    for cnv in copy_number_alterations:
         gene = cnv.get('gene')        
         cnv_type = cnv.get('type')
         copy_number_str = cnv.get('copy-number')
@@ -108,10 +138,10 @@ def extract_cnvs_from_xml(root: etree.Element, gene_vus_mapping:dict) -> list:
 
     return cnvs
 
-def extract_rearrangements_from_xml(root: etree.Element, gene_vus_mapping:dict) -> list:
+def extract_rearrangements_from_xml(rearrangements: list, gene_vus_mapping:dict) -> list:
     svs = []
 
-    for sv in root.xpath('//variant:rearrangement ', namespaces=NAMESPACES):
+    for sv in rearrangements:
         gene = sv.get('targeted-gene')        
         
         entry = {
@@ -171,21 +201,73 @@ def map_cnv_call(cnv_type: str, copy_number:str) -> Optional[str]:
     
     return None
 
-def parse_foundation_med_xml(xml_content: bytes, id: str) -> Dict[str, Any]:
-    
+def _text_nodes(element) -> list:
+    # what XPath `text()` returns for the element: its text and the tails of its children (incl. comments)
+    texts = [element.text] if element.text else []
+    texts.extend(child.tail for child in element if child.tail)
+    return texts
+
+
+def scan_foundation_med_xml(source) -> Dict[str, Any]:
+    """
+    Collect everything parse_foundation_med_xml needs in one streaming pass over the document
+    (`source` is the report's path, an open binary file or its bytes). Only the PMI, the
+    VariantProperties, the variant-report and the narrative blocks produce events; each of these
+    subtrees is read with lxml's own iterators when it ends and then freed together with its
+    preceding siblings, so that the report is never held in memory as a whole.
+
+    Returns the PMI text nodes by tag, the first variant-report's biomarkers (None if there are
+    none), the isVUS flag by gene and, under "variants", the attributes of the variant-reports'
+    short variants, copy number alterations and rearrangements by tag, in document order.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    pmi = {tag: [] for tag in _PMI_TAGS}
+    gene_vus_mapping = {}
+    variants = {_SHORT_VARIANT: [], _COPY_NUMBER_ALTERATION: [], _REARRANGEMENT: []}
+    biomarkers = None
+    tags = ("PMI", "VariantProperties", _VARIANT_REPORT) + _NARRATIVE_TAGS
+    for _, element in etree.iterparse(source, events=("end",), tag=tags):
+        tag = element.tag
+        if tag == _VARIANT_REPORT:
+            for variant_tag, found in variants.items():
+                found.extend(dict(variant.attrib) for variant in element.iter(variant_tag))
+            if biomarkers is None:
+                biomarkers_element = element.find(_BIOMARKERS)
+                if biomarkers_element is not None:
+                    biomarkers = {
+                        "tmb_score": _TMB_SCORE(biomarkers_element),
+                        "msi_status": _MSI_STATUS(biomarkers_element),
+                    }
+        elif tag == "PMI":
+            for child in element:
+                if child.tag in pmi:
+                    pmi[child.tag].extend(_text_nodes(child))
+        elif tag == "VariantProperties":
+            if _in_final_report(element):
+                for variant_property in element.iterchildren("VariantProperty"):
+                    gene_vus_mapping[variant_property.get('geneName')] = variant_property.get('isVUS')
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    return {"pmi": pmi, "biomarkers": biomarkers, "gene_vus_mapping": gene_vus_mapping, "variants": variants}
+
+
+def _in_final_report(variant_properties) -> bool:
+    # the ancestry of //rr:ResultsPayload//FinalReport//VariantProperties
+    ancestors = [ancestor.tag for ancestor in variant_properties.iterancestors()]
+    if "FinalReport" not in ancestors:
+        return False
+    return _RESULTS_PAYLOAD in ancestors[ancestors.index("FinalReport") + 1:]
+
+
+def parse_foundation_med_xml(source, id: str) -> Dict[str, Any]:
+    # source: the report's path, an open binary file or its bytes (see scan_foundation_med_xml)
     try:
-        root = etree.fromstring(xml_content)
+        scan = scan_foundation_med_xml(source)
         patient_data = {}
         
-        pmi_data = {
-            "ReportId": root.xpath('//PMI/ReportId/text()'),
-            "DOB": root.xpath('//PMI/DOB/text()'),
-            "Gender": root.xpath('//PMI/Gender/text()'),
-            "SubmittedDiagnosis": root.xpath('//PMI/SubmittedDiagnosis/text()'),
-            "Pathologist": root.xpath('//PMI/Pathologist/text()'),
-            "CopiedPhysician1": root.xpath('//PMI/CopiedPhysician1/text()'),
-            "ReceivedDate": root.xpath('//PMI/ReceivedDate/text()')
-        }           
+        pmi_data = scan["pmi"]
         
         # Map patient data
         for mm_key, xml_tag in mm_patient_to_xml_tag_map.items():
@@ -226,13 +308,14 @@ def parse_foundation_med_xml(xml_content: bytes, id: str) -> Dict[str, Any]:
                         patient_data[mm_key] = value   
         
         # Map biomarker data
-        biomarkers_nodes = root.xpath('//variant:variant-report/variant:biomarkers', namespaces=NAMESPACES)
-        biomarkers_element = biomarkers_nodes[0] if biomarkers_nodes else None
+        biomarkers = scan["biomarkers"]
+        if biomarkers is None:
+            raise ValueError("No biomarkers found in the variant report.")
 
-        tmb_score = biomarkers_element.xpath('.//variant:tumor-mutation-burden/@score', namespaces=NAMESPACES)
+        tmb_score = biomarkers["tmb_score"]
         patient_data["TUMOR_MUTATIONAL_BURDEN_PER_MEGABASE"] = float(tmb_score[0]) if tmb_score else None
 
-        msi_status = biomarkers_element.xpath('.//variant:microsatellite-instability/@status', namespaces=NAMESPACES)
+        msi_status = biomarkers["msi_status"]
         msi_status = msi_status[0] if msi_status else None
 
         if msi_status:
@@ -245,19 +328,13 @@ def parse_foundation_med_xml(xml_content: bytes, id: str) -> Dict[str, Any]:
         
         patient_data = supplement_mandatory_clinical_fields(patient_data)
 
-        variant_prop_nodes = root.xpath('//rr:ResultsPayload//FinalReport//VariantProperties/VariantProperty', namespaces=NAMESPACES)
-        gene_vus_mapping = {}
-        if variant_prop_nodes:  
-            for vp in variant_prop_nodes:
-                gene_name = vp.get('geneName')
-                is_vus = vp.get('isVUS')
-                gene_vus_mapping[gene_name] = is_vus
+        gene_vus_mapping = scan["gene_vus_mapping"]
 
         # Extract variants for genomic data
-        variants = extract_variants_from_xml(root, gene_vus_mapping)
-        cnv = extract_cnvs_from_xml(root, gene_vus_mapping)
+        variants = extract_variants_from_xml(scan["variants"][_SHORT_VARIANT], gene_vus_mapping)
+        cnv = extract_cnvs_from_xml(scan["variants"][_COPY_NUMBER_ALTERATION], gene_vus_mapping)
         variants.extend(cnv)
-        svs = extract_rearrangements_from_xml(root, gene_vus_mapping)
+        svs = extract_rearrangements_from_xml(scan["variants"][_REARRANGEMENT], gene_vus_mapping)
         variants.extend(svs)
 
         return {
@@ -272,56 +349,184 @@ def parse_foundation_med_xml(xml_content: bytes, id: str) -> Dict[str, Any]:
         logger.error(f"Error parsing XML for {id}: {str(e)}")
         raise
 
-def process_xml_file(xml_file_path: str):
-    """Process a single XML file and write clinical/genomic JSON outputs."""
-    logger.info(f'Reading XML file: {xml_file_path}')
+def extract_xml_file(xml_file_path: str) -> Tuple[str, Dict[str, Any], list]:
+    """Parse a single XML file into (sample_id, clinical_data, genomic_data)."""
+    default_id = os.path.splitext(os.path.basename(xml_file_path))[0]
 
-    if not os.path.exists(xml_file_path):
-        logger.error(f'XML file not found: {xml_file_path}')
-        return
+    # Parse XML and extract data, streaming the file rather than reading it into memory first
+    extracted_data = parse_foundation_med_xml(xml_file_path, default_id)
 
-    base_dir = os.path.dirname(__file__)
+    logger.info(f'Successfully parsed XML content from {xml_file_path}')
 
-    try:
-        with open(xml_file_path, 'rb') as file:
-            xml_content = file.read()
+    clinical_data = extracted_data.get("clinical_data", {})
+    genomic_data = extracted_data.get("genomic_data", [])
 
-        logger.info(f'Successfully read XML content from {xml_file_path}')
+    sample_id = clinical_data.get("SAMPLE_ID")
+    if not sample_id:
+        raise ValueError("Unable to determine sample ID for output filenames.")
+    return sample_id, clinical_data, genomic_data
 
-        default_id = os.path.splitext(os.path.basename(xml_file_path))[0]
 
-        # Parse XML and extract data
-        extracted_data = parse_foundation_med_xml(xml_content, default_id)
+def write_json_outputs(sample_id: str, clinical_data: Dict[str, Any], genomic_data: list,
+                       output_dir: Optional[str] = None) -> Tuple[str, str]:
+    """Write the clinical/genomic JSON of a sample and return their paths."""
+    output_dir = output_dir or os.path.join(os.path.dirname(__file__), "incoming")
+    clinical_dir = os.path.join(output_dir, "clinical_json")
+    genomic_dir = os.path.join(output_dir, "genomic_json")
+    os.makedirs(clinical_dir, exist_ok=True)
+    os.makedirs(genomic_dir, exist_ok=True)
 
-        clinical_data = extracted_data.get("clinical_data", {})
-        genomic_data = extracted_data.get("genomic_data", [])
+    clinical_path = os.path.join(clinical_dir, f"{sample_id}.json")
+    genomic_path = os.path.join(genomic_dir, f"{sample_id}.json")
 
-        sample_id = clinical_data.get("SAMPLE_ID")
-        if not sample_id:
-            raise ValueError("Unable to determine sample ID for output filenames.")
+    with open(clinical_path, "w", encoding="utf-8") as clinical_file:
+        json.dump(clinical_data, clinical_file, indent=2, ensure_ascii=False)
+    with open(genomic_path, "w", encoding="utf-8") as genomic_file:
+        json.dump(genomic_data, genomic_file, indent=2, ensure_ascii=False)
 
-        clinical_dir = os.path.join(base_dir, "incoming","clinical_json")
-        genomic_dir = os.path.join(base_dir,"incoming", "genomic_json")
-        os.makedirs(clinical_dir, exist_ok=True)
-        os.makedirs(genomic_dir, exist_ok=True)
+    logger.info(f"Clinical data saved to {clinical_path}")
+    logger.info(f"Genomic data saved to {genomic_path}")
+    return clinical_path, genomic_path
 
-        clinical_path = os.path.join(clinical_dir, f"{sample_id}.json")
-        genomic_path = os.path.join(genomic_dir, f"{sample_id}.json")
 
-        with open(clinical_path, "w", encoding="utf-8") as clinical_file:
-            json.dump(clinical_data, clinical_file, indent=2, ensure_ascii=False)
-        with open(genomic_path, "w", encoding="utf-8") as genomic_file:
-            json.dump(genomic_data, genomic_file, indent=2, ensure_ascii=False)
+def process_xml_file(xml_file_path: str, output_dir: Optional[str] = None):
+    """Process a single XML file and write clinical/genomic JSON outputs."""
+    logger.info(f'Reading XML file: {xml_file_path}')
 
-        logger.info(f"Clinical data saved to {clinical_path}")
-        logger.info(f"Genomic data saved to {genomic_path}")
+    if not os.path.exists(xml_file_path):
+        logger.error(f'XML file not found: {xml_file_path}')
+        return
 
+    try:
+        sample_id, clinical_data, genomic_data = extract_xml_file(xml_file_path)
+        return write_json_outputs(sample_id, clinical_data, genomic_data, output_dir)
     except Exception as e:
         logger.error(f'Error processing XML file {xml_file_path}: {str(e)}')
         raise
 
 
-def main(xml_file: Optional[str] = None, xml_dir: Optional[str] = None):
+def _init_ingest_worker(ai_slots, diagnosis_memo_path: Optional[str]) -> None:
+    # the AI call limit holds across all workers of the ingest, not per worker
+    from utils.ai_client import use_shared_concurrency_limit
+    use_shared_concurrency_limit(ai_slots)
+    use_diagnosis_memo(diagnosis_memo_path)
+
+
+def _timed_extract(xml_file_path: str):
+    # errors come back as text: lxml exceptions cannot be pickled back to the parent
+    start = time.monotonic()
+    try:
+        return extract_xml_file(xml_file_path), None, time.monotonic() - start
+    except Exception as e:
+        logger.error(f"Failed to process XML file: {xml_file_path}", exc_info=True)
+        return None, str(e), time.monotonic() - start
+
+
+def ingest_xml_files(xml_files: List[str], workers: int = 1, output_dir: Optional[str] = None,
+                     ai_concurrency: Optional[int] = None, force: bool = False) -> List[Dict[str, Any]]:
+    """
+    Process XML files and return one summary row per file: {'file', 'status' ('ok'/'skipped'/'failed'),
+    'sample_id', 'duration', 'error'}. With workers > 1 the files are parsed (and their diagnoses
+    resolved) in a process pool, while the outputs are still written here in file order, so the
+    result is the same as a serial run.
+
+    Reports whose content was already processed by this parser version are skipped unless `force`
+    is set (see utils.ingest_manifest), as long as their outputs are still on disk unchanged or were
+    since overwritten by a later, also skipped, report of the same sample.
+    """
+    output_dir = output_dir or os.path.join(os.path.dirname(__file__), "incoming")
+    memo_dir = None
+    memo_path = config.FMI_DIAGNOSIS_MEMO_PATH
+    if config.FMI_DIAGNOSIS_MEMO_ENABLED and not memo_path:
+        # batch-scoped: shared by the workers of this run only
+        memo_dir = tempfile.mkdtemp(prefix="fmi_diagnosis_memo_")
+        memo_path = os.path.join(memo_dir, "diagnosis_memo.sqlite3")
+    memo_path = memo_path if config.FMI_DIAGNOSIS_MEMO_ENABLED else None
+    manifest = IngestManifest(config.FMI_MANIFEST_PATH, FMI_PARSER_VERSION) if config.FMI_MANIFEST_ENABLED else None
+    summary = []
+
+    def record(path, start, sample_id=None, error=None, duration=None, status='ok'):
+        summary.append({
+            'file': os.path.basename(path),
+            'status': 'failed' if error else status,
+            'sample_id': sample_id,
+            'duration': round(time.monotonic() - start if duration is None else duration, 3),
+            'error': error,
+        })
+
+    content_hashes, up_to_date = {}, {}
+    if manifest:
+        for path in xml_files:
+            try:
+                content_hashes[path] = hash_file(path)
+            except OSError:
+                continue
+        # walk backwards: the last report of a sample decides the content of its outputs
+        skipped_samples = set()
+        for path in reversed(xml_files):
+            entry = None if force or path not in content_hashes else manifest.lookup(content_hashes[path], output_dir)
+            if entry and (entry['intact'] or entry['sample_id'] in skipped_samples):
+                up_to_date[path] = entry
+                skipped_samples.add(entry['sample_id'])
+    pending = [path for path in xml_files if path not in up_to_date]
+
+    executor = None
+    previous_memo = use_diagnosis_memo(memo_path)
+    if workers > 1 and len(pending) > 1:
+        context = multiprocessing.get_context('spawn')
+        ai_slots = context.BoundedSemaphore(ai_concurrency or config.FMI_INGEST_AI_CONCURRENCY)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=_init_ingest_worker, initargs=(ai_slots, memo_path))
+    try:
+        futures = {path: executor.submit(_timed_extract, path) for path in pending} if executor else {}
+        written = set()
+        for path in xml_files:
+            start = time.monotonic()
+            entry = up_to_date.get(path)
+            # a report processed earlier in this run may have overwritten a skipped report's outputs
+            if entry and (entry['sample_id'] not in written or manifest.lookup(content_hashes[path], output_dir)['intact']):
+                record(path, start, entry['sample_id'], status='skipped')
+                continue
+            try:
+                extracted, error, duration = futures[path].result() if path in futures else _timed_extract(path)
+                if error:
+                    record(path, start, error=error, duration=duration)
+                    continue
+                clinical_path, genomic_path = write_json_outputs(*extracted, output_dir)
+                written.add(extracted[0])
+                if manifest and path in content_hashes:
+                    manifest.record(content_hashes[path], output_dir, os.path.basename(path), extracted[0],
+                                    clinical_path, genomic_path)
+                record(path, start, extracted[0], duration=duration + time.monotonic() - start)
+            except Exception as e:
+                logger.error(f"Failed to process XML file: {path}: {e}")
+                record(path, start, error=str(e))
+    finally:
+        if executor:
+            executor.shutdown()
+        memo = _swap_diagnosis_memo(previous_memo)
+        if memo is not None:
+            logger.info(f"FMI ingest | Diagnosis memo: {memo.stats()}")
+        if memo_dir:
+            shutil.rmtree(memo_dir, ignore_errors=True)
+    return summary
+
+
+def print_ingest_summary(summary: List[Dict[str, Any]], elapsed: float) -> None:
+    width = max([len(row['file']) for row in summary] + [4])
+    print(f"{'file':<{width}}  {'status':<7}  {'seconds':>8}  sample_id / error")
+    for row in summary:
+        detail = row['error'] if row['status'] == 'failed' else row['sample_id']
+        print(f"{row['file']:<{width}}  {row['status']:<7}  {row['duration']:>8.2f}  {detail}")
+    counts = {status: sum(row['status'] == status for row in summary) for status in ('ok', 'skipped', 'failed')}
+    totals = (f"{len(summary)} file(s): {counts['ok']} ok, {counts['skipped']} skipped, "
+              f"{counts['failed']} failed in {elapsed:.1f}s")
+    print(totals)
+    logger.info(f"FMI ingest summary | {totals}")
+
+
+def main(xml_file: Optional[str] = None, xml_dir: Optional[str] = None, workers: int = 1,
+         output_dir: Optional[str] = None, force: bool = False):
     """Main entry point to process one XML file or all XML files in a directory."""
     base_dir = os.path.dirname(__file__)
 
@@ -341,28 +546,54 @@ def main(xml_file: Optional[str] = None, xml_dir: Optional[str] = None):
             logger.warning(f"No XML files found in directory: {xml_dir_path}")
             return
 
-        for path in xml_files:
-            try:
-                process_xml_file(path)
-            except Exception:
-                logger.error(f"Failed to process XML file: {path}", exc_info=True)
-        return
+        start = time.monotonic()
+        summary = ingest_xml_files(xml_files, workers, output_dir, force=force)
+        print_ingest_summary(summary, time.monotonic() - start)
+        return summary
 
     if not xml_file:
         logger.error("No XML file provided. Specify a file or use --xml-dir.")
         return
 
     xml_file_path = xml_file if os.path.isabs(xml_file) else os.path.join(base_dir, xml_file)
-    process_xml_file(xml_file_path)
+    process_xml_file(xml_file_path, output_dir)
+
+def diagnosis_memo_version() -> str:
+    """What a memoized diagnosis depends on besides the submitted text"""
+    return (f"oncotree mtime {os.stat(config.ONCOTREE_TXT_FILE_PATH).st_mtime_ns}; model {config.LLM_AI_MODEL}; "
+            f"thresholds {config.DIAGNOSIS_MATCH_THRESHOLD}/{config.DIAGNOSIS_LEVEL1_MATCH_THRESHOLD}; "
+            f"margin {config.DIAGNOSIS_MATCH_MARGIN}")
+
+
+def use_diagnosis_memo(db_path: Optional[str]) -> Optional[DiagnosisMemo]:
+    """
+    Resolve diagnoses through the DiagnosisMemo at `db_path` from now on (None: resolve every
+    call). Returns the memo used so far.
+    """
+    memo = None
+    if db_path:
+        memo = DiagnosisMemo(db_path, diagnosis_memo_version(), claim_timeout=config.FMI_DIAGNOSIS_MEMO_CLAIM_TIMEOUT)
+    return _swap_diagnosis_memo(memo)
+
+
+def _swap_diagnosis_memo(memo: Optional[DiagnosisMemo]) -> Optional[DiagnosisMemo]:
+    global _diagnosis_memo
+    previous, _diagnosis_memo = _diagnosis_memo, memo
+    return previous
+
 
 def get_oncotree_diagnosis(id, value):
     """
     Map free-text diagnosis to OncoTree term string.
-    Reuses the shared hierarchy resolver from get_patient_clinical_data.
+    Reuses the shared hierarchy resolver from get_patient_clinical_data; during a batch ingest each
+    distinct (normalized) diagnosis is resolved once, see use_diagnosis_memo.
     """
     from patient_data.get_patient_clinical_data import get_oncotree_diagnosis as resolve_oncotree_diagnosis
 
-    result = resolve_oncotree_diagnosis(id, value)
+    if _diagnosis_memo is not None:
+        result = _diagnosis_memo.resolve(value, lambda diagnosis: resolve_oncotree_diagnosis(id, diagnosis))
+    else:
+        result = resolve_oncotree_diagnosis(id, value)
     if not result:
         return None
     return result.get('primary_diagnosis')
@@ -371,7 +602,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract patient data from Foundation Medicine XML format.")
     parser.add_argument("--xml-file", type=str, help="Path to XML file containing Foundation Medicine data")
     parser.add_argument("--xml-dir", type=str, help="Directory containing multiple XML files to process")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for --xml-dir (AI calls across all workers are capped by FMI_INGEST_AI_CONCURRENCY)")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="Directory receiving clinical_json/ and genomic_json/ (default: patient_data/incoming)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every report of --xml-dir, including the ones the ingest manifest lists as up to date")
     args = parser.parse_args()
 
-    main(args.xml_file, args.xml_dir)
+    main(args.xml_file, args.xml_dir, args.workers, args.output_dir, args.force)
 
@@ -3,12 +3,15 @@ import os
 import json 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
+import config
 import utils.ai_helper as ai
 import get_gene_from_seq_id as gg
+from patient_data import genomic_variant_parser as gvp
 import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
-from utils.census import load_gene_to_ref_seq_mapping
+from utils.census import load_census_ref_seq_index
 
 extracted_text_dir = 'incoming/extracted_text'
 genomic_json_dir = 'incoming/genomic_json'
@@ -17,20 +20,25 @@ clinical_txt_dir = 'incoming/clinical_data'
 # Set up Loguru to log to a file
 logger.add("logs/get_patient_genomic_data.log", rotation="10 MB", retention="10 days", enqueue=True)
 
-# Load gene to ref_seq_idmapping from CSV
-gene_to_ref_seq_id_mapping = load_gene_to_ref_seq_mapping()
+# Load gene to ref_seq_id mapping from CSV, and its reverse index keyed on the unversioned accession
+gene_to_ref_seq_ids, ref_seq_to_gene = load_census_ref_seq_index()
+
+ref_seq_id_pattern = re.compile(r'NM_\d+(?:\.\d+)?')
+
+# A line reporting a variant call: RefSeq accession, fusion, or copy number change
+variant_line_pattern = gvp.VARIANT_LINE_PATTERN
 
 def get_and_append_gene_from_census(text:str):
     lines = text.strip().split('\n')
     modified_lines = []
 
     for line in lines:# For every line in genomic report (extracted via OCR)
-        matches = re.findall(r'NM_\d+(?:\.\d+)?', line) #get the ref_seq id via regex, might be multiple in case of fusion
+        matches = ref_seq_id_pattern.findall(line) #get the ref_seq id via regex, might be multiple in case of fusion
         genes = []
         for patient_ref_seq_id in matches:
-            mapped_genes = [key for key, val in gene_to_ref_seq_id_mapping.items() if val.split('.')[0] == patient_ref_seq_id.split('.')[0]] #lookup the gene name <-> ref_seq_id mapping downloaded from census excluding the version number
-            if mapped_genes:
-                genes.append(mapped_genes[0]) #should have a unique ref_seq_id -> gene match, so get the 1st lookedup entry
+            mapped_gene = ref_seq_to_gene.get(patient_ref_seq_id.split('.')[0]) #lookup the gene name <-> ref_seq_id mapping downloaded from census excluding the version number
+            if mapped_gene:
+                genes.append(mapped_gene)
         if genes:
             modified_lines.append(line + " Possible Gene(s): " + ", ".join(genes)) #append the gene names looked up from census to every line of extracted text.
         else:
@@ -42,7 +50,7 @@ def get_and_append_gene_from_ncbi(text:str):
     modified_lines = []
 
     for line in lines:
-        matches = re.findall(r'NM_\d+(?:\.\d+)?', line)
+        matches = ref_seq_id_pattern.findall(line)
         genes = []
         for ref_seq_id in matches:
             try:
@@ -58,17 +66,103 @@ def get_and_append_gene_from_ncbi(text:str):
     return modified_lines
 
         
-def get_patent_genomic_data(genomic_text:str, file_name:str):
-   try:
-       response = ai.get_patient_genomic_criteria(file_name, genomic_text)
-       return response
-   except Exception as e:
-       logger.error(f"Error in genomic data processing for {file_name}: {str(e)}")
-       # Return empty list as fallback for connection errors
-       return []
+def split_into_variant_chunks(text: str, chunk_size: int) -> list:
+    """
+    Split the annotated report into chunks of at most `chunk_size` variant lines.
+    Chunks only end right after a variant line, so the gene name/continuation lines
+    preceding a variant stay with it.
+    """
+    chunks = []
+    current_lines = []
+    variant_count = 0
+    for line in text.strip().split('\n'):
+        current_lines.append(line)
+        if variant_line_pattern.search(line):
+            variant_count += 1
+            if variant_count >= chunk_size:
+                chunks.append("\n".join(current_lines))
+                current_lines = []
+                variant_count = 0
+    if any(line.strip() for line in current_lines):
+        chunks.append("\n".join(current_lines))
+    return chunks
+
+def _flatten_genomic_entries(response) -> list:
+    # the model may answer with a list, a nested list (as in the prompt example), a single entry,
+    # or an object wrapping the list
+    if isinstance(response, dict):
+        if 'TRUE_HUGO_SYMBOL' in response:
+            return [response]
+        response = [value for value in response.values() if isinstance(value, list)]
+    if not isinstance(response, list):
+        return []
+    entries = []
+    for item in response:
+        if isinstance(item, dict):
+            entries.append(item)
+        elif isinstance(item, list):
+            entries.extend(_flatten_genomic_entries(item))
+    return entries
+
+def merge_genomic_results(responses: list) -> list:
+    """Merge per-chunk responses, keeping the first entry per (gene, category, protein change)"""
+    merged = []
+    seen = set()
+    for response in responses:
+        for entry in _flatten_genomic_entries(response):
+            key = (entry.get('TRUE_HUGO_SYMBOL'), entry.get('VARIANT_CATEGORY'), entry.get('TRUE_PROTEIN_CHANGE'))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(entry)
+    return merged
+
+def get_patent_genomic_data(genomic_text:str, file_name:str, clinical_text:str = ''):
+    """
+    Convert the annotated OCR text (plus clinical text) to MatchMiner genomic entries.
+    Regular HGVS/fusion lines and IDH_WILDTYPE are converted by the rule-based parser; only the
+    remaining lines go to the AI, split into variant-line chunks that are sent concurrently.
+    Raises if the AI conversion of any chunk fails.
+    """
+    parsed_entries = []
+    if config.GENOMIC_RULE_PARSER_ENABLED:
+        parsed_entries, genomic_text = gvp.parse_genomic_report(genomic_text) if genomic_text.strip() else ([], '')
+        parsed_entries += gvp.parse_clinical_genomic_fields(clinical_text)
+        # the clinical data file holds no genomic fields besides IDH_WILDTYPE
+        clinical_text = ''
+        remaining_variant_lines = sum(1 for line in genomic_text.split('\n') if variant_line_pattern.search(line))
+        logger.info(f"{file_name} | Rule-based parser produced {len(parsed_entries)} entries, "
+                    f"{remaining_variant_lines} variant lines left for the AI")
+        if not remaining_variant_lines:
+            return merge_genomic_results([parsed_entries])
+
+    chunks = split_into_variant_chunks(genomic_text, config.GENOMIC_CHUNK_SIZE) if genomic_text.strip() else []
+    if len(chunks) <= 1:
+        prompts = [genomic_text + "\n" + clinical_text if genomic_text.strip() else clinical_text]
+    else:
+        prompts = chunks + ([clinical_text] if clinical_text.strip() else [])
+        logger.info(f"{file_name} | Split genomic report into {len(chunks)} chunks of up to {config.GENOMIC_CHUNK_SIZE} variant lines")
+
+    def convert_chunk(index_prompt):
+        index, prompt = index_prompt
+        try:
+            return ai.get_patient_genomic_criteria(file_name, prompt)
+        except Exception as e:
+            logger.error(f"Error in genomic data processing for {file_name} (chunk {index + 1}/{len(prompts)}): {str(e)}")
+            # a missing chunk would silently drop its variants: fail the conversion so that it is retried
+            raise
+
+    if len(prompts) == 1:
+        responses = [convert_chunk((0, prompts[0]))]
+    else:
+        with ThreadPoolExecutor(max_workers=config.GENOMIC_CHUNK_PARALLELISM) as executor:
+            responses = list(executor.map(convert_chunk, enumerate(prompts)))
+    return merge_genomic_results([parsed_entries] + responses)
 
 def main(text_file: str):
     combined_content = ""
+    ocr_content = ""
+    clinical_content = ""
     current_dir = os.path.dirname(__file__)
 
     # read OCR extracted content
@@ -77,8 +171,8 @@ def main(text_file: str):
     
     if os.path.exists(OCR_TXT_FILE_PATH):
         with open(OCR_TXT_FILE_PATH, 'r') as file:
-            ocr_content = file.read()        
-            modified_lines = get_and_append_gene_from_census(ocr_content)
+            modified_lines = get_and_append_gene_from_census(file.read())
+            ocr_content = modified_lines
             combined_content += modified_lines
             combined_content += "\n"
         logger.info(f'Successfully read OCR content from {OCR_TXT_FILE_PATH}')
@@ -106,7 +200,7 @@ def main(text_file: str):
         response = []
     else:
         logger.info(f"Combined content for {text_file}: {combined_content}")
-        response = get_patent_genomic_data(combined_content, text_file)
+        response = get_patent_genomic_data(ocr_content, text_file, clinical_content)
     output_file = os.path.join(current_dir, genomic_json_dir, f'{os.path.splitext(text_file)[0]}.json')
     with open(output_file, "w") as json_file: 
         json.dump(response, json_file)
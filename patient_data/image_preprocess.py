@@ -0,0 +1,154 @@
+"""
+Preprocessing of uploaded report images before OCR.
+
+Report screenshots and phone photos arrive at whatever resolution they were captured in. Each page
+is turned into one or more grayscale images of bounded size, so that OCR time and memory per page
+stay predictable:
+
+    grayscale -> crop margins -> deskew -> split very tall pages into tiles -> cap the longest side
+
+The skew angle is measured first but the page is only rotated once it has been scaled down to
+the resolution the tiles end up with, which keeps the (expensive) rotation cheap for large photos.
+"""
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import config
+
+# bump when a change to this module changes the images it produces (cached OCR results depend on it)
+PREPROCESS_VERSION = 1
+# pixels darker than this (0-255) count as ink
+INK_THRESHOLD = 160
+# skew is estimated on a copy at most this wide, and not corrected below MIN_SKEW_ANGLE degrees
+_SKEW_ANALYSIS_WIDTH = 1000
+_SKEW_ANGLE_STEP = 0.25
+MIN_SKEW_ANGLE = 0.3
+
+
+def _ink_mask(gray: np.ndarray) -> np.ndarray:
+    return gray < INK_THRESHOLD
+
+
+def estimate_skew(gray: np.ndarray, max_angle: float) -> float:
+    """
+    Angle (degrees) by which the text lines slope down to the right. For each candidate angle the
+    ink pixels are sheared onto the y axis; the angle whose row profile is sharpest (largest sum
+    of squares) lines the text rows up.
+    """
+    height, width = gray.shape
+    step = max(1, int(np.ceil(width / _SKEW_ANALYSIS_WIDTH)))
+    ys, xs = np.nonzero(_ink_mask(gray[::step, ::step]))
+    if len(ys) < 50:
+        return 0.0
+
+    angles = np.arange(-max_angle, max_angle + _SKEW_ANGLE_STEP / 2, _SKEW_ANGLE_STEP)
+    offset = int(np.ceil(xs.max() * np.tan(np.radians(max_angle)))) + 1
+    scores = []
+    for angle in angles:
+        rows = np.rint(ys - xs * np.tan(np.radians(angle))).astype(np.int64) + offset
+        profile = np.bincount(rows)
+        scores.append(np.dot(profile, profile))
+    return float(angles[int(np.argmax(scores))])
+
+
+def deskew(image: Image.Image, angle: float) -> Image.Image:
+    if abs(angle) < MIN_SKEW_ANGLE:
+        return image
+    # PIL rotates counter-clockwise, which levels lines sloping down to the right
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+
+def crop_margins(image: Image.Image, margin: int) -> Image.Image:
+    """Crop blank borders, keeping `margin` pixels around the ink"""
+    ink = _ink_mask(np.asarray(image))
+    rows = np.flatnonzero(ink.any(axis=1))
+    columns = np.flatnonzero(ink.any(axis=0))
+    if len(rows) == 0:
+        return image
+    box = (
+        max(0, columns[0] - margin),
+        max(0, rows[0] - margin),
+        min(image.width, columns[-1] + 1 + margin),
+        min(image.height, rows[-1] + 1 + margin),
+    )
+    return image.crop(box) if box != (0, 0, image.width, image.height) else image
+
+
+def split_tall_image(image: Image.Image, max_aspect: float) -> list:
+    """
+    Split a page taller than `max_aspect` times its width into tiles of about that shape. Each cut
+    is moved to the row with the least ink near it, so that text lines are not cut in half.
+    """
+    if not max_aspect or image.height <= image.width * max_aspect:
+        return [image]
+    tile_height = image.width * max_aspect
+    tile_count = int(np.ceil(image.height / tile_height))
+    tile_height = image.height / tile_count
+    ink_per_row = _ink_mask(np.asarray(image)).sum(axis=1)
+    window = int(tile_height * 0.1)
+
+    cuts = [0]
+    for tile in range(1, tile_count):
+        target = int(tile * tile_height)
+        start = max(cuts[-1] + 1, target - window)
+        near = ink_per_row[start:target + window + 1]
+        # cut in the middle of the first run of least-ink rows (usually the gap between two lines)
+        first = int(np.argmin(near))
+        run = np.flatnonzero(near[first:] != near[first])
+        last = first + (int(run[0]) if len(run) else len(near) - first) - 1
+        cuts.append(start + (first + last) // 2)
+    cuts.append(image.height)
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in zip(cuts, cuts[1:])]
+
+
+def cap_size(image: Image.Image, max_side: int, tile_max_aspect: float = 0) -> Image.Image:
+    """
+    Scale down to at most `max_side` pixels on the longest side. A page that will be split into
+    tiles (see split_tall_image) only has its width capped, since each tile is capped on its own.
+    """
+    tall = tile_max_aspect and image.height > image.width * tile_max_aspect
+    longest = image.width if tall else max(image.size)
+    if longest <= max_side:
+        return image
+    scale = max_side / longest
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def preprocess_image(image: Image.Image, max_side: int = None, deskew_max_angle: float = None,
+                     crop_margin: int = None, tile_max_aspect: float = None) -> list:
+    """Grayscale, deskewed, cropped tiles of a page (settings default to the OCR_* values in config)"""
+    max_side = max_side or config.OCR_MAX_IMAGE_SIDE
+    deskew_max_angle = config.OCR_DESKEW_MAX_ANGLE if deskew_max_angle is None else deskew_max_angle
+    crop_margin = config.OCR_CROP_MARGIN if crop_margin is None else crop_margin
+    tile_max_aspect = config.OCR_TILE_MAX_ASPECT if tile_max_aspect is None else tile_max_aspect
+
+    image = ImageOps.exif_transpose(image).convert('L')
+    angle = estimate_skew(np.asarray(image), deskew_max_angle) if deskew_max_angle else 0.0
+    image = cap_size(crop_margins(image, crop_margin), max_side, tile_max_aspect)
+    if abs(angle) >= MIN_SKEW_ANGLE:
+        # the rotation adds blank corners, which are cropped again
+        image = crop_margins(deskew(image, angle), crop_margin)
+    return [cap_size(tile, max_side) for tile in split_tall_image(image, tile_max_aspect)]
+
+
+def preprocess_signature() -> str:
+    """Identifies the current preprocessing, so that OCR results of differently prepared pages are not mixed"""
+    if not config.OCR_PREPROCESS_ENABLED:
+        return 'preprocess off'
+    return (f"preprocess v{PREPROCESS_VERSION} max_side={config.OCR_MAX_IMAGE_SIDE} "
+            f"deskew={config.OCR_DESKEW_MAX_ANGLE} margin={config.OCR_CROP_MARGIN} tiles={config.OCR_TILE_MAX_ASPECT}")
+
+
+def load_page_images(image_path: str) -> list:
+    """Open a page image for OCR: the preprocessed tiles, or the image as-is when preprocessing is off"""
+    image = Image.open(image_path)
+    if not config.OCR_PREPROCESS_ENABLED:
+        return [image]
+    # JPEG phone photos are decoded at a reduced scale straight away (never below the size cap)
+    image.draft('L', (config.OCR_MAX_IMAGE_SIDE, config.OCR_MAX_IMAGE_SIDE))
+    return preprocess_image(image)
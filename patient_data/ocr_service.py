@@ -0,0 +1,528 @@
+"""
+Resident OCR service: loads the OCR models once and serves page images over a local socket.
+
+Run it next to the web app (the app also starts it on demand):
+    python patient_data/ocr_service.py
+"""
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import time
+import queue
+import fcntl
+import sqlite3
+import secrets
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
+from importlib import metadata
+from loguru import logger
+
+import config
+from config import Config
+from utils.ocr_cache import OCRResultCache
+from utils.job_queue import get_job_queue
+from utils.sqlite_store import hash_file
+
+# requests are tiny; a client that does not send one promptly is dropped
+_RECEIVE_TIMEOUT = 5
+
+
+class OCRBackend(ABC):
+    """
+    OCR engine run by the service: extract() returns the text of each page image, in page order.
+    Creating an engine whose packages are not installed raises ImportError or RuntimeError.
+    `version` changes whenever the engine could read the same image differently.
+    """
+    name = None
+    version = None
+
+    @abstractmethod
+    def extract(self, image_paths: list) -> list:
+        """The extracted text of each page image, in page order"""
+
+
+def _check_images(image_paths: list) -> None:
+    for image_path in image_paths:
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image file not found: {image_path}")
+
+
+class MockOCRBackend(OCRBackend):
+    """Returns the sample report for every page instead of running OCR (no OCR packages needed)"""
+    name = 'mock'
+    version = 'mock'
+
+    def extract(self, image_paths: list) -> list:
+        import surya_ocr_text_extract as ocr
+        return [ocr.process_extracted_text(ocr.get_mock_response())] * len(image_paths)
+
+
+def _init_cpu_worker(threads: int) -> None:
+    os.environ['TORCH_DEVICE'] = 'cpu'
+    import surya_ocr_text_extract as ocr
+    ocr.torch.set_num_threads(threads)
+    ocr.get_predictors()
+
+
+def _extract_page_on_cpu(image_path: str) -> str:
+    import surya_ocr_text_extract as ocr
+    return ocr.extract_text_with_surya(image_path)
+
+
+class SuryaOCRBackend(OCRBackend):
+    """
+    Surya OCR with the predictors loaded once. On the GPU pages are run through the predictors
+    in batches of `batch_size`; on CPU they are spread over `cpu_workers` processes instead.
+    """
+    name = 'surya'
+
+    def __init__(self, use_gpu: bool = True, batch_size: int = 8, cpu_workers: int = 1):
+        if not use_gpu:
+            # read by surya's settings when it is first imported
+            os.environ.setdefault('TORCH_DEVICE', 'cpu')
+        import surya_ocr_text_extract as ocr
+        if not ocr.SURYA_AVAILABLE:
+            raise RuntimeError("surya-ocr is not installed")
+        self._ocr = ocr
+        self.batch_size = batch_size
+        self.device = 'cuda' if use_gpu and ocr.torch.cuda.is_available() else 'cpu'
+        self.version = f"surya-ocr {metadata.version('surya-ocr')} ({self.device})"
+        self._cpu_pool = None
+        if self.device == 'cpu' and cpu_workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // cpu_workers)
+            self._cpu_pool = ProcessPoolExecutor(
+                max_workers=cpu_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_cpu_worker,
+                initargs=(threads,),
+            )
+        else:
+            ocr.get_predictors()
+        logger.info(f"Surya OCR backend ready on {self.device}")
+
+    def extract(self, image_paths: list) -> list:
+        _check_images(image_paths)
+        if self._cpu_pool is not None:
+            sorted_texts = list(self._cpu_pool.map(_extract_page_on_cpu, image_paths))
+        else:
+            sorted_texts = self._ocr.extract_texts_with_surya(image_paths, self.batch_size)
+        return [self._ocr.process_extracted_text(text) for text in sorted_texts]
+
+
+def _init_tesseract_worker() -> None:
+    # pages run in parallel across the workers, so each tesseract process uses a single thread
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def _extract_page_with_tesseract(image_path: str) -> str:
+    import pytesseract_text_extract as tesseract
+    return tesseract.extract_text_with_tesseract(image_path)
+
+
+class TesseractOCRBackend(OCRBackend):
+    """Tesseract on CPU, with the pages of a batch spread over `workers` processes"""
+    name = 'tesseract'
+
+    def __init__(self, workers: int = 1):
+        import pytesseract_text_extract as tesseract
+        if not tesseract.TESSERACT_AVAILABLE:
+            raise RuntimeError("tesseract is not installed")
+        self._tesseract = tesseract
+        self.version = f"tesseract {tesseract.pytesseract.get_tesseract_version()} {tesseract.TESSERACT_CONFIG}"
+        self._pool = None
+        if workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_tesseract_worker,
+            )
+        logger.info(f"Tesseract OCR backend ready with {workers} worker(s)")
+
+    def extract(self, image_paths: list) -> list:
+        _check_images(image_paths)
+        if self._pool is not None:
+            return list(self._pool.map(_extract_page_with_tesseract, image_paths))
+        return [self._tesseract.extract_text_with_tesseract(image_path) for image_path in image_paths]
+
+
+class CachedOCRBackend(OCRBackend):
+    """
+    Wraps an OCR engine with the OCRResultCache: pages whose image bytes were read before by the
+    same engine (and preprocessing) are answered from the cache, only the others are run.
+    """
+
+    def __init__(self, backend: OCRBackend, cache: OCRResultCache):
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+        self.version = backend.version
+
+    def extract(self, image_paths: list) -> list:
+        _check_images(image_paths)
+        image_hashes = [hash_file(image_path) for image_path in image_paths]
+        texts = self.cache.get_many(image_hashes)
+        cached_pages = sum(image_hash in texts for image_hash in image_hashes)
+        # identical pages within the request are read once
+        missing = {}
+        for image_hash, image_path in zip(image_hashes, image_paths):
+            if image_hash not in texts:
+                missing.setdefault(image_hash, image_path)
+        if missing:
+            new_texts = dict(zip(missing, self.backend.extract(list(missing.values()))))
+            self.cache.put_many(new_texts)
+            texts.update(new_texts)
+        logger.info(f"OCR cache | {cached_pages} of {len(image_paths)} page(s) cached")
+        return [texts[image_hash] for image_hash in image_hashes]
+
+
+def create_cached_ocr_backend(backend: OCRBackend) -> OCRBackend:
+    """Put the OCR result cache in front of an engine, unless caching is disabled"""
+    if not config.OCR_CACHE_ENABLED:
+        return backend
+    from patient_data.image_preprocess import preprocess_signature
+    try:
+        cache = OCRResultCache(config.OCR_CACHE_PATH, f"{backend.version}; {preprocess_signature()}",
+                               config.OCR_CACHE_MAX_ENTRIES, config.OCR_CACHE_MAX_BYTES)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"OCR cache | Unable to open {config.OCR_CACHE_PATH}, caching disabled: {e}")
+        return backend
+    return CachedOCRBackend(backend, cache)
+
+
+def _cuda_available() -> bool:
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def create_ocr_backend(name: str = None) -> OCRBackend:
+    """
+    Build the OCR backend named by config.OCR_BACKEND: 'surya', 'tesseract', 'mock', or 'auto'
+    (Surya on the GPU when Config.USE_GPU is set and CUDA is available, otherwise Tesseract,
+    otherwise Surya on CPU, otherwise the mock).
+    """
+    name = name or config.OCR_BACKEND
+    if name == 'mock':
+        return MockOCRBackend()
+    if name == 'surya':
+        return SuryaOCRBackend(Config.USE_GPU, config.OCR_BATCH_SIZE, config.OCR_CPU_WORKERS)
+    if name == 'tesseract':
+        return TesseractOCRBackend(config.OCR_CPU_WORKERS)
+
+    candidates = []
+    if Config.USE_GPU and _cuda_available():
+        candidates.append(('Surya (GPU)', lambda: SuryaOCRBackend(True, config.OCR_BATCH_SIZE, config.OCR_CPU_WORKERS)))
+    candidates.append(('Tesseract', lambda: TesseractOCRBackend(config.OCR_CPU_WORKERS)))
+    candidates.append(('Surya (CPU)', lambda: SuryaOCRBackend(False, config.OCR_BATCH_SIZE, config.OCR_CPU_WORKERS)))
+    for label, create in candidates:
+        try:
+            return create()
+        except (ImportError, RuntimeError) as e:
+            logger.warning(f"{label} OCR unavailable: {e}")
+    logger.warning("No OCR engine available, using the mock OCR backend")
+    return MockOCRBackend()
+
+
+class OCRService:
+    """
+    Accepts {'image_paths': [...], 'mmid': ...} requests on a Unix socket and answers
+    {'texts': [...]} (one text per page, in order) or {'error': ...}. One inference thread
+    runs the models; requests waiting in the queue are combined into batches of up to
+    `batch_size` pages.
+    """
+
+    def __init__(self, backend, address: str, authkey: bytes, batch_size: int = 1):
+        self.backend = backend
+        self.address = address
+        self.authkey = authkey
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        self._listener = None
+        self._stopped = threading.Event()
+
+    def _bind(self) -> Listener:
+        if os.path.exists(self.address):
+            try:
+                Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.address)  # left behind by a service that died
+            else:
+                raise RuntimeError(f"An OCR service is already listening on {self.address}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+        listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        # the connection unpickles what it receives: only the app user may even connect
+        os.chmod(self.address, 0o600)
+        return listener
+
+    def serve_forever(self) -> None:
+        self._listener = self._bind()
+        threading.Thread(target=self._inference_loop, name='ocr-inference', daemon=True).start()
+        logger.info(f"OCR service ({self.backend.name}) listening on {self.address}")
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn = self._listener.accept()
+                except Exception as e:
+                    if self._stopped.is_set():
+                        break
+                    # e.g. a client with the wrong authkey, or one that hung up during the handshake
+                    logger.warning(f"Rejected OCR client: {e}")
+                    continue
+                threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+        finally:
+            self._listener.close()
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def _receive(self, conn) -> None:
+        try:
+            if not conn.poll(_RECEIVE_TIMEOUT):
+                conn.close()
+                return
+            request = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            return
+        if request.get('op') == 'ping':
+            try:
+                conn.send({'backend': self.backend.name})
+            finally:
+                conn.close()
+            return
+        self.requests.put((conn, request, time.monotonic()))
+
+    def _next_batch(self) -> list:
+        batch = [self.requests.get()]
+        pages = len(batch[0][1]['image_paths'])
+        while pages < self.batch_size:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            pages += len(item[1]['image_paths'])
+        return batch
+
+    def _run_batch(self, batch: list) -> list:
+        """Replies for the requests of a batch, in the same order"""
+        image_paths = [path for _, request, _ in batch for path in request['image_paths']]
+        try:
+            texts = self.backend.extract(image_paths)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"OCR failed for {batch[0][1].get('mmid')}: {e}")
+                return [{'error': str(e)}]
+            # run the requests one by one so that a bad image only fails its own submission
+            return [reply for item in batch for reply in self._run_batch([item])]
+        replies = []
+        for _, request, _ in batch:
+            page_count = len(request['image_paths'])
+            replies.append({'texts': texts[:page_count]})
+            texts = texts[page_count:]
+        return replies
+
+    def _inference_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            start = time.monotonic()
+            replies = self._run_batch(batch)
+            elapsed = time.monotonic() - start
+            for (conn, request, received_at), reply in zip(batch, replies):
+                if 'texts' in reply:
+                    logger.info(
+                        f"OCR for {request.get('mmid')}: {len(request['image_paths'])} page(s) in a batch of "
+                        f"{len(batch)} request(s), {elapsed:.1f}s (queued {start - received_at:.1f}s)"
+                    )
+                try:
+                    conn.send(reply)
+                except OSError as e:
+                    logger.warning(f"Unable to return OCR result for {request.get('mmid')}: {e}")
+                finally:
+                    conn.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        # wake up the blocking accept()
+        try:
+            Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+        except (OSError, EOFError):
+            pass
+
+
+class OCRServiceError(Exception):
+    """The OCR service could not be reached or failed to process the images"""
+
+
+class OCRClient:
+    """Sends page images to the OCR service, starting the service first if it is not running"""
+
+    def __init__(self, address: str, authkey: bytes, timeout: float, autostart: bool, start_timeout: float):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.autostart = autostart
+        self.start_timeout = start_timeout
+
+    def _connect(self):
+        return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+
+    def _start_service(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+        # only one web worker starts the service; the others wait on the lock and find it running
+        with open(f'{self.address}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._connect().close()
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                pass
+            logger.info("Starting OCR service")
+            os.makedirs(Config.LOGS_DIR, exist_ok=True)
+            with open(Config.OCR_SERVICE_LOG, 'a') as log_handle:
+                subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__)],
+                    stdout=log_handle, stderr=subprocess.STDOUT,
+                    cwd=Config.BASE_DIR, start_new_session=True,
+                )
+            deadline = time.monotonic() + self.start_timeout
+            while time.monotonic() < deadline:
+                try:
+                    self._connect().close()
+                    return
+                except (ConnectionRefusedError, FileNotFoundError):
+                    time.sleep(0.5)
+        raise OCRServiceError(f"OCR service did not start within {self.start_timeout}s")
+
+    def extract_pages(self, image_paths: list, mmid: str = None) -> list:
+        """Return the extracted text of each page, in page order"""
+        try:
+            conn = self._connect()
+        except (ConnectionRefusedError, FileNotFoundError):
+            if not self.autostart:
+                raise OCRServiceError(f"OCR service is not running on {self.address}")
+            self._start_service()
+            conn = self._connect()
+        try:
+            conn.send({'image_paths': [os.path.abspath(path) for path in image_paths], 'mmid': mmid})
+            if not conn.poll(self.timeout):
+                raise OCRServiceError(f"OCR service did not answer within {self.timeout}s")
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            raise OCRServiceError(f"Lost connection to the OCR service: {e}")
+        finally:
+            conn.close()
+        if 'error' in reply:
+            raise OCRServiceError(reply['error'])
+        return reply['texts']
+
+    def extract_text(self, image_paths: list, mmid: str = None) -> str:
+        """Extracted text of all pages, one page after the other"""
+        return ''.join(text + '\n' for text in self.extract_pages(image_paths, mmid))
+
+
+def get_ocr_service_authkey(key_path: str = None) -> bytes:
+    """
+    Secret shared by the OCR service and its clients: OCR_SERVICE_AUTHKEY if set, otherwise a
+    random key created on first use in `key_path` (Config.OCR_SERVICE_AUTHKEY_FILE), readable by
+    the app user only.
+    """
+    if config.OCR_SERVICE_AUTHKEY:
+        return config.OCR_SERVICE_AUTHKEY.encode()
+    key_path = key_path or Config.OCR_SERVICE_AUTHKEY_FILE
+    try:
+        with open(key_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_mode & 0o077:
+                raise PermissionError(f"{key_path} must only be accessible by its owner (chmod 600)")
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(os.path.abspath(key_path)), exist_ok=True)
+    # written under a temporary name and linked into place, so that a concurrent reader never sees
+    # half a key and the first of several starting processes wins
+    tmp_path = f"{key_path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(secrets.token_bytes(32))
+        try:
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(tmp_path)
+    with open(key_path, 'rb') as f:
+        return f.read()
+
+
+def get_ocr_client() -> OCRClient:
+    return OCRClient(
+        Config.OCR_SERVICE_ADDRESS,
+        get_ocr_service_authkey(),
+        timeout=config.OCR_REQUEST_TIMEOUT,
+        autostart=config.OCR_SERVICE_AUTOSTART,
+        start_timeout=config.OCR_SERVICE_START_TIMEOUT,
+    )
+
+
+def get_page_images(unique_id: str) -> list:
+    """Uploaded page images of a submission, in page order ({unique_id}-01.png, {unique_id}-02.jpg, ...)"""
+    prefix = f"{unique_id}-"
+    return sorted(
+        os.path.join(Config.IMAGE_FOLDER, filename)
+        for filename in os.listdir(Config.IMAGE_FOLDER)
+        if filename.startswith(prefix) and filename[len(prefix):len(prefix) + 2].isdigit()
+    )
+
+
+def run_ocr_job(data_file: str, claim_token: str = None) -> None:
+    """
+    OCR job run by the job queue: extract the text of the submission's page images into
+    Config.EXTRACTED_TEXT/<data_file>, where the review page picks it up. With the job's
+    `claim_token`, the text is only published if no re-upload has queued the job again meanwhile.
+    """
+    unique_id = os.path.splitext(os.path.basename(data_file))[0]
+    image_paths = get_page_images(unique_id)
+    if not image_paths:
+        raise FileNotFoundError(f"No uploaded images found for {unique_id}")
+    extracted_text = get_ocr_client().extract_text(image_paths, unique_id)
+
+    # written under a temporary name so that a poll never reads half a file
+    file_path = os.path.join(Config.EXTRACTED_TEXT, os.path.basename(data_file))
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(extracted_text)
+    if claim_token is None:
+        os.replace(tmp_path, file_path)
+    elif not get_job_queue().publish(unique_id, 'ocr', claim_token, lambda: os.replace(tmp_path, file_path)):
+        os.remove(tmp_path)
+        logger.info(f"OCR extraction for {unique_id} was superseded by a newer upload, result discarded")
+        return
+    logger.info(f"OCR extraction completed for {unique_id}: {len(image_paths)} page(s)")
+
+
+def main(backend_name: str = None):
+    # when started by the web app, stdout/stderr already go to Config.OCR_SERVICE_LOG
+    service = OCRService(create_cached_ocr_backend(create_ocr_backend(backend_name)), Config.OCR_SERVICE_ADDRESS,
+                         get_ocr_service_authkey(), config.OCR_BATCH_SIZE)
+    try:
+        service.serve_forever()
+    except RuntimeError as e:
+        logger.info(str(e))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the resident OCR service.")
+    parser.add_argument("--backend", choices=['auto', 'surya', 'tesseract', 'mock'], default=None,
+                        help="OCR backend (defaults to OCR_BACKEND in config.py)")
+    args = parser.parse_args()
+
+    main(args.backend)
@@ -1,34 +1,49 @@
-# this script needs tesseract, pytesseract, opencv installation as a prerequisite
+# pre-requisites
+# this script needs the tesseract binary and the pytesseract package installed
+# (e.g. `apt install tesseract-ocr` and `pip install pytesseract`)
 
-from PIL import Image
-import pytesseract
-import cv2
+import sys
+import os
+import shutil
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-def extract_text_via_cv2():
-    image = cv2.imread('case1.png')
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+from loguru import logger
 
-    # Extract text using Tesseract
-    custom_config = r'--oem 3 --psm 1'  # Page segmentation mode for sparse text
-    extracted_text = pytesseract.image_to_string(gray_image, config=custom_config)
-    print("Extracted text: " + extracted_text)
+# Whether pytesseract and the tesseract binary are both available
+TESSERACT_AVAILABLE = False
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+    if not TESSERACT_AVAILABLE:
+        logger.warning(f"tesseract binary '{pytesseract.pytesseract.tesseract_cmd}' not found")
+except ImportError as e:
+    logger.warning(f"pytesseract not available: {e}")
 
-    lines = extracted_text.split('\t')
-    table_data = [line.split() for line in lines if line.strip()]
+# OCR engine mode 3 (default engine), page segmentation mode 1 (automatic, with orientation detection)
+TESSERACT_CONFIG = r'--oem 3 --psm 1'
 
-    # Output the structured data
-    for row in table_data:
-        print(row)
 
-def extract_text():
-    print(pytesseract.image_to_string(Image.open('case1.png')))
+def extract_text_with_tesseract(image_path: str) -> str:
+    """
+    Extract text from an image with Tesseract; the page is preprocessed (grayscale, deskewed,
+    tiled) first and the text of its tiles is joined in order
+    """
+    from patient_data.image_preprocess import load_page_images
+
+    texts = [pytesseract.image_to_string(tile, config=TESSERACT_CONFIG).strip() for tile in load_page_images(image_path)]
+    return '\n'.join(text for text in texts if text)
+
+
+def main(image_files: list):
+    print(pytesseract.get_tesseract_version())  # to make sure tesseract is installed
+    for image_file in image_files:
+        print(extract_text_with_tesseract(image_file))
 
-def main():
-    print(pytesseract.get_tesseract_version()) # to make sure tesseract is installed
-    # if installed and prog cannot find tesseract.exr, conside adding the following line to specify the tesseract.exe path from the env being used
-    pytesseract.pytesseract.tesseract_cmd = '<path to tesseract.exe>\tesseract.exe'
-    extract_text()
-    extract_text_via_cv2()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Extract text from image file(s) using tesseract.")
+    parser.add_argument("image_files", nargs='+', help="Image file(s) to extract text from")
+    args = parser.parse_args()
+
+    main(args.image_files)
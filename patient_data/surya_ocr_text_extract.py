@@ -6,6 +6,10 @@
 
 # Configuration: Set to False if running on non-GPU machine
 USE_GPU = True
+# Whether surya-ocr can be imported at all (it also runs on CPU, just slower)
+SURYA_AVAILABLE = False
+# Pages sent through detection and recognition together
+DEFAULT_BATCH_SIZE = 8
 
 # Always import typing for type hints
 from typing import List, TYPE_CHECKING
@@ -19,6 +23,7 @@ if USE_GPU:
         from surya.detection import DetectionPredictor
         from surya.recognition.schema import TextLine
         import torch
+        SURYA_AVAILABLE = True
         
         # Check if CUDA is available
         if not torch.cuda.is_available():
@@ -29,9 +34,14 @@ if USE_GPU:
         USE_GPU = False
 
 import argparse
+import bisect
+import itertools
 import os
+import sys
 import time
 import re
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 extracted_text_dir = 'incoming/extracted_text'
 image_to_be_extracted_dir = 'images'
@@ -42,57 +52,89 @@ logger.add("logs/surya_ocr_text_extract.log", rotation="10 MB", retention="10 da
 def sort_lines(lines, tolerance=10.0):
     '''
     rearranges the positioning of extracted text, so that words in same line are grouped together
-    '''
-    if not USE_GPU:
-        # Return empty string when not in GPU mode
-        return ""
-        
-    vertical_groups = []
-    for line in lines:
-        min_y = line.bbox[1] if hasattr(line, 'bbox') else line["bbox"][1]
-        found_group = False
-
-        #check for existing groups within y tolerance
-        for group in vertical_groups:
-            if abs(min_y - group[0]) <= tolerance:
-                group.append(line)
-                found_group = True
-                break
-
-        #if group not found,create a new one
-        if not found_group:
-            vertical_groups.append([min_y,line])   
-
-    sorted_text = []
-    for group in sorted(vertical_groups):
-        # Sort text boxes on the same line by their horizontal position
-        group_lines = sorted(group[1:], key=lambda x: x.bbox[0])
-        
-        # Join the text from all boxes on this line with a space
-        full_line = ' '.join(line.text for line in group_lines)
-        
-        # Append the now correctly-spaced line to the list
-        sorted_text.append(full_line)
-        
-        # Add a newline character to separate this line from the next
-        sorted_text.append("\n")
 
-    # Join all the complete lines together
-    return ''.join(sorted_text).strip()
+    Each box joins the earliest row whose first box starts within `tolerance` of its top edge,
+    otherwise it starts a new row; rows are then read top to bottom and each row left to right.
+    Row anchors are kept sorted by y, so finding a box's row is a binary search instead of a
+    scan over all rows.
+    '''
+    if not lines:
+        return ''
+    if hasattr(lines[0], 'bbox'):
+        bboxes = np.array([line.bbox[:2] for line in lines], dtype=float)
+        texts = [line.text for line in lines]
+    else:
+        bboxes = np.array([line["bbox"][:2] for line in lines], dtype=float)
+        texts = [line["text"] for line in lines]
+
+    # anchors are more than `tolerance` apart, so at most two of them are within reach of a box
+    # (the search starts one anchor early in case min_y - tolerance rounds past the first one)
+    anchor_ys = []      # y of each row's first box, ascending
+    anchor_rows = []    # row number (creation order) of each entry in anchor_ys
+    row_ys = []         # y of each row's first box, by row number
+    rows = []
+    for min_y in bboxes[:, 1].tolist():
+        start = max(0, bisect.bisect_left(anchor_ys, min_y - tolerance) - 1)
+        row = None
+        for anchor_y, anchor_row in zip(anchor_ys[start:start + 3], anchor_rows[start:start + 3]):
+            if abs(min_y - anchor_y) <= tolerance and (row is None or anchor_row < row):
+                row = anchor_row
+        if row is None:
+            row = len(row_ys)
+            insert_at = bisect.bisect_left(anchor_ys, min_y)
+            anchor_ys.insert(insert_at, min_y)
+            anchor_rows.insert(insert_at, row)
+            row_ys.append(min_y)
+        rows.append(row)
+
+    # rows top to bottom, boxes left to right within a row (stable, so ties keep their order)
+    order = np.lexsort((bboxes[:, 0], np.array(row_ys)[rows])).tolist()
+
+    # Join the text from all boxes on a line with a space, and the lines with newlines
+    return '\n'.join(
+        ' '.join(texts[index] for index in row_boxes)
+        for _, row_boxes in itertools.groupby(order, key=rows.__getitem__)
+    ).strip()
+
+_predictors = None
+
+def get_predictors():
+    """
+    Load the Surya recognition and detection predictors once per process
+    """
+    global _predictors
+    if _predictors is None:
+        start = time.time()
+        _predictors = (RecognitionPredictor(), DetectionPredictor())
+        logger.info(f"Loaded Surya predictors in {time.time() - start:.1f}s")
+    return _predictors
 
 def extract_text_with_surya(image_path: str) -> str:
     """
     Extract text from image using Surya OCR
     """
-    image = Image.open(image_path)
-    recognition_predictor = RecognitionPredictor()
-    detection_predictor = DetectionPredictor()
+    return extract_texts_with_surya([image_path])[0]
 
-    predictions = recognition_predictor([image], det_predictor=detection_predictor)
-    text_lines = predictions[0].text_lines
-    sorted_text = sort_lines(text_lines)
-    
-    return sorted_text
+def extract_texts_with_surya(image_paths: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> List[str]:
+    """
+    Extract text from several images, running up to batch_size preprocessed pages (or tiles of
+    tall pages) through the predictors at once. Texts are returned in the order of image_paths.
+    """
+    from patient_data.image_preprocess import load_page_images
+
+    recognition_predictor, detection_predictor = get_predictors()
+    # a tall page may be split into several tiles; their texts are joined back per page
+    tiles = ((page, tile) for page, image_path in enumerate(image_paths) for tile in load_page_images(image_path))
+    page_texts = [[] for _ in image_paths]
+    while True:
+        batch = list(itertools.islice(tiles, batch_size))
+        if not batch:
+            break
+        images = [tile.convert('RGB') for _, tile in batch]
+        predictions = recognition_predictor(images, det_predictor=detection_predictor)
+        for (page, _), prediction in zip(batch, predictions):
+            page_texts[page].append(sort_lines(prediction.text_lines))
+    return ['\n'.join(texts) for texts in page_texts]
 
 def get_mock_response() -> str:
     """
@@ -148,7 +190,7 @@ def process_extracted_text(text: str, clean_html: bool = True, decode_entities:
         text = decode_html_entities(text)
     return text
 
-def main(image_files: list[str], mmid: str):    
+def main(image_files: list[str], mmid: str, batch_size: int = DEFAULT_BATCH_SIZE):    
     combined_extracted_text = ""
     output_file_name = mmid
     
@@ -159,23 +201,24 @@ def main(image_files: list[str], mmid: str):
         logger.info("Mock OCR response generated and processed")
     else:
         logger.info("Running in GPU mode - using Surya OCR")
+        current_dir = os.path.dirname(__file__)
+        image_paths = []
         for image_file in image_files:
-            current_dir = os.path.dirname(__file__)
             image_path = os.path.abspath(os.path.join(current_dir, image_to_be_extracted_dir, image_file))
-            logger.info(f'Processing image file: {image_path}')
-            
-            if os.path.exists(image_path):
-                try:
-                    extracted_text = extract_text_with_surya(image_path)
-                    processed_text = process_extracted_text(extracted_text)
-                    combined_extracted_text += processed_text + "\n"
-                    logger.info(f"Successfully extracted text from {image_file}")
-                except Exception as e:
-                    logger.error(f"Error extracting text from {image_file}: {e}")
-                    raise Exception(f"OCR processing failed for {image_file}: {str(e)}")
-            else:
+            if not os.path.exists(image_path):
                 logger.warning(f"Image file not found: {image_path}")
                 raise FileNotFoundError(f"Image file not found: {image_path}")
+            image_paths.append(image_path)
+
+        logger.info(f'Processing {len(image_paths)} image file(s) in batches of {batch_size}')
+        try:
+            extracted_texts = extract_texts_with_surya(image_paths, batch_size)
+        except Exception as e:
+            logger.error(f"Error extracting text from {image_files}: {e}")
+            raise Exception(f"OCR processing failed for {image_files}: {str(e)}")
+        for extracted_text in extracted_texts:
+            combined_extracted_text += process_extracted_text(extracted_text) + "\n"
+        logger.info(f"Successfully extracted text from {len(image_files)} image file(s)")
 
     save_extracted_text(combined_extracted_text, output_file_name)
 
@@ -192,9 +235,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract text from image file(s) using surya-ocr.")
     parser.add_argument("args", nargs='+', help="Name of image file(s) followed by MMID. " \
     "The last argument will be considered as MatchMinerId and will be used to name the output file containing extracted text")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Pages per OCR batch")
     args = parser.parse_args()
 
     image_files = args.args[:-1]
     mmid = args.args[-1]
 
-    main(image_files, mmid)
\ No newline at end of file
+    main(image_files, mmid, args.batch_size)
\ No newline at end of file
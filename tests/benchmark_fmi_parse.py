@@ -0,0 +1,45 @@
+"""
+Micro-benchmark of the streaming Foundation Medicine XML scan against the document-wide XPath lookups
+it replaced.
+
+    python -m tests.benchmark_fmi_parse
+"""
+import os
+import re
+import tempfile
+import timeit
+
+from patient_data.get_patient_data_foundation_med import scan_foundation_med_xml
+from tests.test_foundation_med_ingest import make_report, reference_scan
+
+
+def make_large_report(variants: int) -> bytes:
+    genes = [f"GENE{i}" for i in range(variants)]
+    report = make_report("TRF0001", genes=genes)
+    # a report body padded with gene interpretations, as in real reports
+    filler = "".join(f"<Gene><Name>{gene}</Name><Interpretation>{'Interpretation text. ' * 20}</Interpretation></Gene>"
+                     for gene in genes)
+    return re.sub("</FinalReport>", f"<Genes>{filler}</Genes></FinalReport>", report).encode()
+
+
+def main():
+    print(f"{'variants':>9} {'KiB':>7} {'xpath (ms)':>11} {'scan (ms)':>10} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for variants in (10, 100, 1000, 5000):
+            xml_content = make_large_report(variants)
+            path = os.path.join(tmp_dir, f"report_{variants}.xml")
+            with open(path, "wb") as f:
+                f.write(xml_content)
+
+            def read_and_xpath():
+                with open(path, "rb") as f:
+                    return reference_scan(f.read())
+
+            assert scan_foundation_med_xml(path) == read_and_xpath()
+            repeat = max(1, 2000 // variants)
+            original = timeit.timeit(read_and_xpath, number=repeat) / repeat * 1000
+            current = timeit.timeit(lambda: scan_foundation_med_xml(path), number=repeat) / repeat * 1000
+            print(f"{variants:>9} {len(xml_content) // 1024:>7} {original:>11.2f} {current:>10.2f} {original / current:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Micro-benchmark of surya_ocr_text_extract.sort_lines against the original linear-scan grouping.
+
+    python -m tests.benchmark_sort_lines
+"""
+import timeit
+
+from patient_data.surya_ocr_text_extract import sort_lines
+from tests.test_sort_lines import reference_sort_lines, make_page
+
+
+def main():
+    print(f"{'boxes':>7} {'rows':>6} {'original (ms)':>14} {'sort_lines (ms)':>16} {'speed-up':>9}")
+    for rows, boxes_per_row in ((20, 5), (60, 6), (150, 6), (400, 5), (1000, 4)):
+        lines = make_page(rows, boxes_per_row)
+        assert sort_lines(lines) == reference_sort_lines(lines)
+        repeat = max(1, 2000 // rows)
+        original = timeit.timeit(lambda: reference_sort_lines(lines), number=repeat) / repeat * 1000
+        current = timeit.timeit(lambda: sort_lines(lines), number=repeat) / repeat * 1000
+        print(f"{len(lines):>7} {rows:>6} {original:>14.2f} {current:>16.2f} {original / current:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
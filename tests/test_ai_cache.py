@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import config
+import utils.ai_helper as ai
+from utils.ai_cache import AIResponseCache, make_cache_key
+
+
+def _req_body(prompt, model="model-a"):
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.5,
+        "max_tokens": 8192,
+    }
+
+
+class TestAIResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, "ai_cache.sqlite3")
+
+    def _cache(self, model="model-a", ttl_seconds=3600, max_entries=100, max_bytes=10 ** 6):
+        return AIResponseCache(self.db_path, model, ttl_seconds, max_entries, max_bytes)
+
+    def test_make_cache_key(self):
+        self.assertEqual(make_cache_key(_req_body("NSCLC")), make_cache_key(_req_body("NSCLC")))
+        self.assertNotEqual(make_cache_key(_req_body("NSCLC")), make_cache_key(_req_body("CRC")))
+        self.assertNotEqual(make_cache_key(_req_body("NSCLC")), make_cache_key(_req_body("NSCLC", "model-b")))
+
+    def test_get_put(self):
+        cache = self._cache()
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", {"choices": [1]})
+        self.assertEqual(cache.get("k"), {"choices": [1]})
+        stats = cache.stats()
+        self.assertEqual(stats["process"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["shared"]["hits"], 1)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_shared_between_instances(self):
+        self._cache().put("k", {"value": 1})
+        self.assertEqual(self._cache().get("k"), {"value": 1})
+
+    def test_ttl_expiry(self):
+        cache = self._cache(ttl_seconds=60)
+        cache.put("k", {"value": 1})
+        with mock.patch("utils.ai_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("k"))
+
+    def test_lru_eviction(self):
+        cache = self._cache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_model_change_invalidates(self):
+        self._cache(model="model-a").put("k", {"value": 1})
+        cache = self._cache(model="model-b")
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestSendAIRequestCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        patcher = mock.patch.multiple(
+            config, AI_CACHE_ENABLED=True, AI_CACHE_PATH=os.path.join(tmp_dir, "ai_cache.sqlite3"),
+            AI_STREAM_RESPONSES=False,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch("utils.ai_helper.get_ai_client")
+    def test_second_request_is_served_from_cache(self, get_ai_client):
+        post = get_ai_client.return_value.post
+        post.return_value.json.return_value = {"choices": [{"message": {"content": '{"oncotree_diagnosis": "Lung"}'}}]}
+        first = ai.send_ai_request("test", "NSCLC")
+        second = ai.send_ai_request("test", "NSCLC")
+        self.assertEqual(first, second)
+        self.assertEqual(post.call_count, 1)
+
+    @mock.patch("utils.ai_helper.get_ai_client")
+    def test_unusable_responses_are_not_cached(self, get_ai_client):
+        post = get_ai_client.return_value.post
+        for content in ("Sorry, I cannot answer that.", '```json\n{"oncotree_diagnosis": "Lu', "{}", ""):
+            with self.subTest(content=content):
+                post.reset_mock()
+                post.return_value.json.return_value = {"choices": [{"message": {"content": content}}]}
+                ai.send_ai_request("test", "NSCLC")
+                ai.send_ai_request("test", "NSCLC")
+                self.assertEqual(post.call_count, 2)
+
+    @mock.patch("utils.ai_helper.get_ai_client")
+    def test_errors_are_not_cached(self, get_ai_client):
+        post = get_ai_client.return_value.post
+        post.side_effect = ai.requests.exceptions.ConnectionError
+        self.assertEqual(ai.send_ai_request("test", "NSCLC")["error"], "connection_error")
+        self.assertEqual(ai.send_ai_request("test", "NSCLC")["error"], "connection_error")
+        self.assertEqual(post.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
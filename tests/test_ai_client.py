@@ -0,0 +1,158 @@
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+from utils.ai_client import AIClient, CircuitOpenError
+
+
+class _StubAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append(self.client_address)
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status = server.statuses.pop(0) if server.statuses else 200
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        payload = json.dumps({"echo": json.loads(body or b"{}")}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAIClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubAIHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.delay = 0
+        self.server.lock = threading.Lock()
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+
+    def _client(self, **overrides):
+        settings = dict(connect_timeout=1, read_timeout=1, pool_maxsize=2, max_retries=2,
+                        backoff=0.01, backoff_max=0.02, failure_threshold=3, reset_timeout=0.2)
+        settings.update(overrides)
+        return AIClient(**settings)
+
+    def test_post_reuses_connection(self):
+        client = self._client()
+        for _ in range(3):
+            response = client.post(self.url, json={"prompt": "NSCLC"})
+            self.assertEqual(response.json(), {"echo": {"prompt": "NSCLC"}})
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+    def test_retries_on_5xx(self):
+        self.server.statuses = [503, 502]
+        response = self._client().post(self.url, json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_returns_last_5xx_when_retries_exhausted(self):
+        self.server.statuses = [500, 500, 500]
+        response = self._client(failure_threshold=10).post(self.url, json={})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.statuses = [400]
+        response = self._client().post(self.url, json={})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_concurrency_is_capped(self):
+        self.server.delay = 0.1
+        client = self._client(max_concurrent=2)
+        threads = [threading.Thread(target=client.post, args=(self.url,), kwargs={"json": {}}) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.max_in_flight, 2)
+
+    def test_slot_is_released_while_backing_off(self):
+        self.server.statuses = [503, 503]
+        client = self._client(max_concurrent=1)
+        free_during_backoff = []
+
+        def sleep_before_retry(attempt):
+            free = client._concurrency.acquire(blocking=False)
+            if free:
+                client._concurrency.release()
+            free_during_backoff.append(free)
+
+        client._sleep_before_retry = sleep_before_retry
+        self.assertEqual(client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(free_during_backoff, [True, True])
+        # the slot of the final response is given back too
+        self.assertTrue(client._concurrency.acquire(blocking=False))
+
+    def test_read_timeout(self):
+        self.server.delay = 0.5
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self._client(read_timeout=0.1).post(self.url, json={})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_circuit_breaker_fails_fast_and_recovers(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_port = sock.getsockname()[1]
+        client = self._client(max_retries=0, failure_threshold=2)
+        down_url = f"http://127.0.0.1:{closed_port}/v1/chat/completions"
+
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.post(down_url, json={})
+        self.assertEqual(client.circuit_breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            client.post(self.url, json={})
+        self.assertEqual(self.server.requests, [])
+
+        time.sleep(0.25)
+        self.assertEqual(client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+
+    def test_other_request_error_ends_the_half_open_trial(self):
+        client = self._client(max_retries=0, failure_threshold=1, max_concurrent=1)
+        self.server.statuses = [503]
+        client.post(self.url, json={})
+        self.assertEqual(client.circuit_breaker.state, "open")
+
+        time.sleep(0.25)
+        with mock.patch.object(requests.Session, "post", side_effect=requests.exceptions.TooManyRedirects("loop")):
+            with self.assertRaises(requests.exceptions.TooManyRedirects):
+                client.post(self.url, json={})
+        # the failed trial opens the circuit again, and the next trial is let through
+        self.assertEqual(client.circuit_breaker.state, "open")
+        time.sleep(0.25)
+        self.assertEqual(client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+        self.assertTrue(client._concurrency.acquire(blocking=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import config
+import utils.ai_helper as ai
+from utils.ai_helper import JSONStreamExtractor
+
+
+def _sse(content):
+    return b"data: " + json.dumps({"choices": [{"delta": {"content": content}, "finish_reason": None}]}).encode() + b"\n\n"
+
+
+class _StubStreamingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in self.server.pieces:
+                self._write_chunk(_sse(piece))
+                self.server.sent += 1
+                time.sleep(0.02)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.disconnected = True
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestJSONStreamExtractor(unittest.TestCase):
+
+    def _feed_all(self, text, size=3):
+        extractor = JSONStreamExtractor()
+        for index in range(0, len(text), size):
+            result = extractor.feed(text[index:index + size])
+            if result is not None:
+                return result
+        return None
+
+    def test_fenced_json_after_think(self):
+        text = '<think>maybe {"x": 1} or [2]</think>\n```json\n{"oncotree_diagnosis": "Lung {x}"}\n```trailing'
+        self.assertEqual(self._feed_all(text), '{"oncotree_diagnosis": "Lung {x}"}')
+
+    def test_closing_think_without_opening_tag(self):
+        text = 'reasoning about [things\n</think>\n[{"a": "b\\"]"}, {"c": 1}] more text'
+        self.assertEqual(json.loads(self._feed_all(text)), [{"a": 'b"]'}, {"c": 1}])
+
+    def test_plain_json(self):
+        self.assertEqual(self._feed_all('  {"a": [1, 2, {"b": null}]}'), '{"a": [1, 2, {"b": null}]}')
+
+    def test_skips_invalid_candidate(self):
+        self.assertEqual(self._feed_all('</think> see [ref] then {"a": 1}'), '{"a": 1}')
+
+    def test_incomplete(self):
+        self.assertIsNone(self._feed_all('<think>still thinking {"a": 1}'))
+        self.assertIsNone(self._feed_all('</think>```json\n{"a": '))
+
+
+class TestStreamedAIRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubStreamingHandler)
+        self.server.sent = 0
+        self.server.disconnected = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        patcher = mock.patch.multiple(
+            config, GPU_SERVER_HOSTNAME="http://127.0.0.1", AI_PORT=self.server.server_port,
+            AI_STREAM_RESPONSES=True, AI_CACHE_ENABLED=False,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stream_stops_after_complete_json(self):
+        self.server.pieces = ["reasoning ", "...</think>", "\n```json\n", '{"oncotree_diagnosis": ', '"Breast"}', "\n```"] + ["padding "] * 50
+        ai_response = ai.send_ai_request("test", "Breast cancer")
+        self.assertEqual(ai.parse_ai_response(ai_response), {"oncotree_diagnosis": "Breast"})
+        self.assertEqual(ai_response["choices"][0]["finish_reason"], "stop_early")
+        time.sleep(0.2)
+        self.assertLess(self.server.sent, len(self.server.pieces))
+
+    def test_stream_without_json_returns_full_content(self):
+        self.server.pieces = ["</think>", "no json here"]
+        ai_response = ai.send_ai_request("test", "Breast cancer")
+        self.assertEqual(ai_response["choices"][0]["message"]["content"], "</think>no json here")
+        self.assertEqual(self.server.sent, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import config
+from app import app
+
+
+class TestOncoTreeDataEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        # a private copy of the OncoTree file, so that the test can change it
+        self.oncotree_path = os.path.join(self.tmp_dir, "oncotree_file.txt")
+        shutil.copyfile(config.ONCOTREE_TXT_FILE_PATH, self.oncotree_path)
+        patcher = mock.patch("config.ONCOTREE_TXT_FILE_PATH", self.oncotree_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return self.client.get("/api/oncotree-data", headers=headers)
+
+    def test_payload_with_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertIn("must-revalidate", response.headers["Cache-Control"])
+        self.assertTrue(response.headers["ETag"].startswith('"'))
+        self.assertTrue(json.loads(response.data))
+
+    def test_if_none_match_gives_304(self):
+        etag = self.get().headers["ETag"]
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.get(**{"If-None-Match": '"some-other-etag"'}).status_code, 200)
+
+    def test_gzip_variant(self):
+        plain = self.get()
+        response = self.get(**{"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+        self.assertEqual(self.get(**{"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+    def test_etag_goes_stale_when_the_oncotree_file_changes(self):
+        old = self.get()
+        with open(self.oncotree_path, "a") as f:
+            f.write("Test Tissue (TEST_TISSUE)\tTest Tumor (TEST_TUMOR)\t\t\t\t\tTest Cancer\tRed\t\t\t\n")
+        stat = os.stat(self.oncotree_path)
+        os.utime(self.oncotree_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        response = self.get(**{"If-None-Match": old.headers["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], old.headers["ETag"])
+        self.assertIn("Test Tumor", response.get_data(as_text=True))
+        self.assertEqual(self.get(**{"If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from utils import census
+
+CENSUS_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ref', 'census_gene_list.csv')
+
+
+class TestCensusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, 'census.csv')
+        self.cache_path = os.path.join(self.tmp_dir, 'cache', 'census.json')
+        with open(self.csv_path, 'w') as f:
+            f.write('Gene Symbol,Name,Synonyms\n'
+                    'TP53,tumor protein p53,"CCDS11118.1,NM_000546.5,NM_001276761.1,P04637"\n'
+                    'GOPC,golgi associated PDZ,"CAL,NM_020399.3"\n'
+                    'NOREF,no accession,\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index_keeps_all_accessions(self):
+        gene_to_ref_seq_ids, ref_seq_to_gene = census.load_census_ref_seq_index(self.csv_path, self.cache_path)
+        self.assertEqual(gene_to_ref_seq_ids, {'TP53': ['NM_000546.5', 'NM_001276761.1'], 'GOPC': ['NM_020399.3']})
+        self.assertEqual(ref_seq_to_gene, {'NM_000546': 'TP53', 'NM_001276761': 'TP53', 'NM_020399': 'GOPC'})
+
+    def test_cache_is_reused_until_csv_changes(self):
+        census.load_census_ref_seq_index(self.csv_path, self.cache_path)
+        with open(self.cache_path) as f:
+            cached = json.load(f)
+        cached['gene_to_ref_seq_ids'] = {'CACHED': ['NM_1']}
+        with open(self.cache_path, 'w') as f:
+            json.dump(cached, f)
+        gene_to_ref_seq_ids, _ = census.load_census_ref_seq_index(self.csv_path, self.cache_path)
+        self.assertEqual(gene_to_ref_seq_ids, {'CACHED': ['NM_1']})
+
+        with open(self.csv_path, 'a') as f:
+            f.write('ROS1,ROS proto-oncogene 1,NM_002944.2\n')
+        gene_to_ref_seq_ids, _ = census.load_census_ref_seq_index(self.csv_path, self.cache_path)
+        self.assertEqual(gene_to_ref_seq_ids['ROS1'], ['NM_002944.2'])
+        self.assertIn('TP53', gene_to_ref_seq_ids)
+
+    def test_corrupt_cache_is_rebuilt(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, 'w') as f:
+            f.write('{not json')
+        gene_to_ref_seq_ids, _ = census.load_census_ref_seq_index(self.csv_path, self.cache_path)
+        self.assertIn('GOPC', gene_to_ref_seq_ids)
+
+    def test_real_census_list(self):
+        gene_to_ref_seq_ids, ref_seq_to_gene = census.load_census_ref_seq_index(
+            CENSUS_CSV, os.path.join(self.tmp_dir, 'real.json'))
+        self.assertEqual(ref_seq_to_gene['NM_002944'], 'ROS1')
+        self.assertEqual(len(ref_seq_to_gene), 691)
+
+
+if __name__ == "__main__":
+    unittest.main()
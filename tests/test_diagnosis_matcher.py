@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+
+import utils.diagnosis_matcher as dm
+import utils.oncotree as onct
+from patient_data import get_patient_clinical_data as clinical
+
+
+class TestDiagnosisMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = dm.DiagnosisMatcher(
+            onct.get_oncotree_index(),
+            [("Lung Adenocarcinoma", "Lung Adenocarcinoma"), ("Lung ADC", "Lung Adenocarcinoma")],
+        )
+
+    def test_match_oncotree_code(self):
+        match = self.matcher.best_match("NSCLC")
+        self.assertEqual(match["term"], "Non-Small Cell Lung Cancer")
+        self.assertEqual(match["score"], 1.0)
+        self.assertEqual(match["path"], ["Lung", "Non-Small Cell Lung Cancer"])
+
+    def test_match_reordered_tokens(self):
+        match = self.matcher.best_match("Adenocarcinoma of the lung")
+        self.assertEqual(match["term"], "Lung Adenocarcinoma")
+        self.assertEqual(match["score"], 1.0)
+
+    def test_match_reviewed_alias(self):
+        match = self.matcher.best_match("lung adc")
+        self.assertEqual(match["term"], "Lung Adenocarcinoma")
+        self.assertEqual(match["source"], "reviewed")
+        self.assertEqual(self.matcher.priors["Lung Adenocarcinoma"], 2)
+
+    def test_match_metamaintype(self):
+        match = self.matcher.best_match("Breast Cancer")
+        self.assertEqual(match["term"], "Breast")
+        self.assertLess(match["score"], 1.0)
+        self.assertEqual(self.matcher.match_level1("Breast Cancer", 0.6), "Breast")
+
+    def test_confident_match(self):
+        match = self.matcher.confident_match("Adenocarcinoma of the lung", 0.85, 0.15)
+        self.assertEqual(match["term"], "Lung Adenocarcinoma")
+        # level-1 terms are left to the level-1 step
+        self.assertIsNone(self.matcher.confident_match("Breast Cancer", 0.85, 0.15))
+
+    def test_ambiguous_inputs_are_not_accepted(self):
+        # each scores above the threshold, but close to a term on another branch
+        for text in ("urothelial carcinoma", "clear cell carcinoma", "large cell carcinoma"):
+            with self.subTest(text=text):
+                self.assertGreaterEqual(self.matcher.best_match(text)["score"], 0.85)
+                self.assertIsNone(self.matcher.confident_match(text, 0.85, 0.15))
+
+    def test_match_empty(self):
+        self.assertEqual(self.matcher.match(""), [])
+        self.assertIsNone(self.matcher.best_match("   "))
+
+    def test_get_diagnosis_matcher_is_shared(self):
+        self.assertIs(dm.get_diagnosis_matcher(), dm.get_diagnosis_matcher())
+
+
+class TestOncotreeDiagnosisPaths(unittest.TestCase):
+
+    def setUp(self):
+        dm.match_stats.clear()
+
+    @mock.patch.object(clinical.ai, "get_level1_diagnosis_from_free_text")
+    def test_local_match_skips_ai(self, level1_ai):
+        result = clinical.get_oncotree_diagnosis("test", "Adenocarcinoma of the lung")
+        self.assertEqual(result["primary_diagnosis"], "Lung Adenocarcinoma")
+        level1_ai.assert_not_called()
+        self.assertEqual(dm.get_match_stats(), {"local": 1})
+
+    @mock.patch.object(clinical.ai, "get_child_level_diagnosis_from_clinical_condition",
+                       return_value={"oncotree_diagnosis": "Invasive Breast Carcinoma"})
+    @mock.patch.object(clinical.ai, "get_level1_diagnosis_from_free_text")
+    def test_local_level1_skips_level1_ai(self, level1_ai, child_ai):
+        result = clinical.get_oncotree_diagnosis("test", "Breast cancer")
+        self.assertEqual(result["primary_diagnosis"], "Invasive Breast Carcinoma")
+        level1_ai.assert_not_called()
+        child_ai.assert_called_once()
+        self.assertEqual(dm.get_match_stats(), {"local_level1": 1})
+
+    @mock.patch.object(clinical.ai, "get_child_level_diagnosis_from_clinical_condition",
+                       return_value={"oncotree_diagnosis": "Renal Clear Cell Carcinoma"})
+    @mock.patch.object(clinical.ai, "get_level1_diagnosis_from_free_text", return_value={"oncotree_diagnosis": "Kidney"})
+    def test_ambiguous_match_is_left_to_ai(self, level1_ai, child_ai):
+        result = clinical.get_oncotree_diagnosis("test", "clear cell carcinoma")
+        self.assertEqual(result["primary_diagnosis"], "Renal Clear Cell Carcinoma")
+        child_ai.assert_called_once()
+        self.assertNotIn("local", dm.get_match_stats())
+
+    @mock.patch.object(clinical.ai, "get_level1_diagnosis_from_free_text", return_value={"oncotree_diagnosis": ""})
+    def test_unmatched_falls_back_to_ai(self, level1_ai):
+        self.assertIsNone(clinical.get_oncotree_diagnosis("test", "xyzzy"))
+        level1_ai.assert_called_once()
+        self.assertEqual(dm.get_match_stats(), {"ai": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.diagnosis_memo import DiagnosisMemo, normalize_diagnosis
+
+
+def resolve_in_worker(db_path: str, log_path: str, value: str):
+    def slow_resolver(diagnosis):
+        with open(log_path, "a") as f:
+            f.write(f"{diagnosis}\n")
+        time.sleep(0.2)
+        return {"primary_diagnosis": diagnosis.title()}
+
+    return DiagnosisMemo(db_path, "v1").resolve(value, slow_resolver)
+
+
+class TestDiagnosisMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, "memo.sqlite3")
+        self.calls = []
+
+    def resolver(self, value):
+        self.calls.append(value)
+        return {"primary_diagnosis": value.strip()} if "unknown" not in value else None
+
+    def test_each_normalized_diagnosis_is_resolved_once(self):
+        self.assertEqual(normalize_diagnosis("  Lung   ADENOCARCINOMA "), "lung adenocarcinoma")
+        memo = DiagnosisMemo(self.db_path, "v1")
+        for value in ("Lung adenocarcinoma", "lung  adenocarcinoma ", "unknown primary", "Unknown primary"):
+            memo.resolve(value, self.resolver)
+        self.assertEqual(self.calls, ["Lung adenocarcinoma", "unknown primary"])
+
+        # another process (or run) with the same db file reuses the results, including None
+        other = DiagnosisMemo(self.db_path, "v1")
+        self.assertEqual(other.resolve("LUNG ADENOCARCINOMA", self.resolver), {"primary_diagnosis": "Lung adenocarcinoma"})
+        self.assertIsNone(other.resolve("unknown primary", self.resolver))
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual((other.stats()["hits"], other.stats()["entries"]), (2, 2))
+
+        # a new OncoTree version starts over
+        DiagnosisMemo(self.db_path, "v2").resolve("Lung adenocarcinoma", self.resolver)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_failures_are_not_memoized(self):
+        memo = DiagnosisMemo(self.db_path, "v1")
+
+        def failing(value):
+            raise RuntimeError("AI service error")
+
+        with self.assertRaises(RuntimeError):
+            memo.resolve("Melanoma", failing)
+        self.assertEqual(memo.resolve("Melanoma", self.resolver), {"primary_diagnosis": "Melanoma"})
+
+    def test_claim_of_a_dead_process_is_taken_over(self):
+        memo = DiagnosisMemo(self.db_path, "v1")
+        process = multiprocessing.get_context("spawn").Process(target=time.sleep, args=(0,))
+        process.start()
+        process.join()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO diagnoses (key, version, state, owner_pid, result, updated_at) VALUES (?, ?, ?, ?, NULL, ?)",
+                ("melanoma", "v1", "pending", process.pid, time.time()),
+            )
+        self.assertEqual(memo.resolve("Melanoma", self.resolver), {"primary_diagnosis": "Melanoma"})
+        self.assertEqual(self.calls, ["Melanoma"])
+
+    def test_expired_claim_is_taken_over(self):
+        # a crashed run's claim whose PID now belongs to a live process (here: this one)
+        memo = DiagnosisMemo(self.db_path, "v1", claim_timeout=60)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO diagnoses (key, version, state, owner_pid, result, updated_at) VALUES (?, ?, ?, ?, NULL, ?)",
+                ("melanoma", "v1", "pending", os.getpid(), time.time() - 61),
+            )
+        self.assertEqual(memo.resolve("Melanoma", self.resolver), {"primary_diagnosis": "Melanoma"})
+        self.assertEqual(self.calls, ["Melanoma"])
+
+    def test_concurrent_workers_resolve_once(self):
+        log_path = os.path.join(self.tmp_dir, "calls.log")
+        DiagnosisMemo(self.db_path, "v1")
+        values = ["Breast carcinoma", "breast Carcinoma", "Colon cancer"] * 3
+        with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(resolve_in_worker, [self.db_path] * len(values), [log_path] * len(values), values))
+        with open(log_path) as f:
+            self.assertEqual(sorted(normalize_diagnosis(line) for line in f), ["breast carcinoma", "colon cancer"])
+        self.assertEqual(results[1], {"primary_diagnosis": "Breast Carcinoma"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from patient_data import export_reviewed_corpus as erc
+
+
+class TestExportReviewedCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.clinical_dir = os.path.join(self.tmp_dir, "clinical")
+        self.genomic_dir = os.path.join(self.tmp_dir, "genomic")
+        self.export_dir = os.path.join(self.tmp_dir, "export")
+        os.makedirs(self.clinical_dir)
+        os.makedirs(self.genomic_dir)
+        self.mtime = 1_700_000_000
+        for i in range(3):
+            self.write_sample(f"S{i}", tmb=float(i), genes=["TP53", "KRAS"][:i])
+
+    def write_sample(self, sample_id, tmb=1.0, genes=("TP53",)):
+        self.mtime += 10
+        clinical = {"SAMPLE_ID": sample_id, "REPORT_VERSION": "0", "TUMOR_MUTATIONAL_BURDEN_PER_MEGABASE": tmb}
+        genomic = [{"WILDTYPE": False, "TRUE_HUGO_SYMBOL": gene, "VARIANT_CATEGORY": "MUTATION"} for gene in genes]
+        for directory, data in ((self.clinical_dir, clinical), (self.genomic_dir, genomic)):
+            path = os.path.join(directory, f"{sample_id}.json")
+            with open(path, "w") as f:
+                json.dump(data, f, indent=4)
+            os.utime(path, ns=(self.mtime * 10 ** 9, self.mtime * 10 ** 9))
+
+    def export(self, **kwargs):
+        return erc.export_reviewed_corpus(self.clinical_dir, self.genomic_dir, self.export_dir, **kwargs)
+
+    def corpus(self):
+        return list(erc.iter_corpus(os.path.join(self.export_dir, erc.NDJSON_FILE)))
+
+    def test_export_packs_one_line_per_sample(self):
+        self.assertEqual(self.export(), {"parsed": 3, "reused": 0, "removed": 0, "failed": 0})
+        records = self.corpus()
+        self.assertEqual([record["sample_id"] for record in records], ["S0", "S1", "S2"])
+        self.assertEqual(records[2]["clinical"]["TUMOR_MUTATIONAL_BURDEN_PER_MEGABASE"], 2.0)
+        self.assertEqual([variant["TRUE_HUGO_SYMBOL"] for variant in records[2]["genomic"]], ["TP53", "KRAS"])
+        with open(os.path.join(self.export_dir, erc.NDJSON_FILE)) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_rebuild_reads_only_changed_files(self):
+        self.export()
+        ndjson_path = os.path.join(self.export_dir, erc.NDJSON_FILE)
+        written_at = os.stat(ndjson_path).st_mtime_ns
+        self.assertEqual(self.export(), {"parsed": 0, "reused": 3, "removed": 0, "failed": 0})
+        self.assertEqual(os.stat(ndjson_path).st_mtime_ns, written_at)
+
+        self.write_sample("S1", tmb=9.5)
+        self.write_sample("S3")
+        os.remove(os.path.join(self.clinical_dir, "S0.json"))
+        os.remove(os.path.join(self.genomic_dir, "S0.json"))
+        self.assertEqual(self.export(), {"parsed": 2, "reused": 1, "removed": 1, "failed": 0})
+        records = {record["sample_id"]: record for record in self.corpus()}
+        self.assertEqual(sorted(records), ["S1", "S2", "S3"])
+        self.assertEqual(records["S1"]["clinical"]["TUMOR_MUTATIONAL_BURDEN_PER_MEGABASE"], 9.5)
+
+        self.assertEqual(self.export(full=True)["parsed"], 3)
+
+    def test_sample_with_one_half_missing_or_broken(self):
+        os.remove(os.path.join(self.genomic_dir, "S1.json"))
+        with open(os.path.join(self.clinical_dir, "S2.json"), "w") as f:
+            f.write("{broken")
+        self.assertEqual(self.export(), {"parsed": 2, "reused": 0, "removed": 0, "failed": 1})
+        self.assertEqual([(record["sample_id"], record["genomic"]) for record in self.corpus()], [("S0", []), ("S1", [])])
+
+    def test_columnar_tables(self):
+        self.write_sample("S3")
+        self.export()
+        records = self.corpus()
+        records[3]["clinical"]["REPORT_VERSION"] = 1
+        samples, variants = erc._columnar(records)
+        self.assertEqual(list(samples["SAMPLE_ID"]), ["S0", "S1", "S2", "S3"])
+        self.assertEqual(list(samples["REPORT_VERSION"]), ["0", "0", "0", "1"])
+        self.assertEqual(list(variants["SAMPLE_ID"]), ["S1", "S2", "S2", "S3"])
+        self.assertEqual(list(variants["TRUE_HUGO_SYMBOL"]), ["TP53", "TP53", "KRAS", "TP53"])
+
+    @unittest.skipUnless(erc.PARQUET_AVAILABLE, "pyarrow is not installed")
+    def test_parquet_files(self):
+        import pandas as pd
+
+        self.export()
+        samples = pd.read_parquet(os.path.join(self.export_dir, erc.SAMPLES_PARQUET_FILE))
+        variants = pd.read_parquet(os.path.join(self.export_dir, erc.VARIANTS_PARQUET_FILE))
+        self.assertEqual((len(samples), len(variants)), (3, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
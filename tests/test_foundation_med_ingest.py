@@ -0,0 +1,211 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from lxml import etree
+
+from patient_data import get_patient_data_foundation_med as fmi
+
+# an exact OncoTree term resolves without the AI service
+DIAGNOSIS = "Adrenocortical Carcinoma"
+
+
+def make_report(report_id: str, genes=("TP53", "KRAS")) -> str:
+    variants = "".join(
+        f'<short-variant gene="{gene}" functional-effect="missense" cds-effect="c.{i}A&gt;T"/>'
+        for i, gene in enumerate(genes)
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rr:ResultsReport xmlns:rr="http://integration.foundationmedicine.com/reporting">
+  <rr:ResultsPayload>
+    <FinalReport>
+      <PMI>
+        <ReportId>{report_id}</ReportId>
+        <DOB>1960-05-04</DOB>
+        <Gender>Female</Gender>
+        <SubmittedDiagnosis>{DIAGNOSIS}</SubmittedDiagnosis>
+        <Pathologist>Dr. Smith</Pathologist>
+        <ReceivedDate>2024-02-01</ReceivedDate>
+      </PMI>
+      <VariantProperties>
+        <VariantProperty geneName="KRAS" isVUS="true"/>
+      </VariantProperties>
+    </FinalReport>
+    <variant-report xmlns="http://foundationmedicine.com/compbio/variant-report-external">
+      <biomarkers>
+        <tumor-mutation-burden score="12.5"/>
+        <microsatellite-instability status="MSS"/>
+      </biomarkers>
+      <short-variants>{variants}</short-variants>
+      <copy-number-alterations>
+        <copy-number-alteration gene="ERBB2" type="amplification" copy-number="8"/>
+      </copy-number-alterations>
+    </variant-report>
+  </rr:ResultsPayload>
+</rr:ResultsReport>
+"""
+
+
+def make_edge_case_report(report_id: str) -> str:
+    """A report with mixed-content PMI fields, stray VariantProperties and a rearrangement"""
+    report = make_report(report_id)
+    report = report.replace(f"<ReportId>{report_id}</ReportId>", f"<ReportId><!-- id -->{report_id}<b/>x</ReportId>")
+    report = report.replace("</rr:ResultsPayload>", (
+        "<FinalReport><VariantProperties><VariantProperty geneName='TP53' isVUS='true'/></VariantProperties></FinalReport>"
+        "</rr:ResultsPayload><VariantProperties><VariantProperty geneName='ERBB2' isVUS='true'/></VariantProperties>"
+    ))
+    return report.replace("<copy-number-alterations>",
+                          "<rearrangements><rearrangement targeted-gene='ALK'/></rearrangements><copy-number-alterations>")
+
+
+def reference_scan(xml_content: bytes) -> dict:
+    """The XPath lookups the parser ran over the whole document before it streamed it"""
+    ns = fmi.NAMESPACES
+    root = etree.fromstring(xml_content)
+    biomarkers = root.xpath('//variant:variant-report/variant:biomarkers', namespaces=ns)
+    return {
+        "pmi": {tag: root.xpath(f'//PMI/{tag}/text()') for tag in fmi._PMI_TAGS},
+        "biomarkers": {
+            "tmb_score": biomarkers[0].xpath('.//variant:tumor-mutation-burden/@score', namespaces=ns),
+            "msi_status": biomarkers[0].xpath('.//variant:microsatellite-instability/@status', namespaces=ns),
+        } if biomarkers else None,
+        "gene_vus_mapping": {vp.get('geneName'): vp.get('isVUS') for vp in root.xpath(
+            '//rr:ResultsPayload//FinalReport//VariantProperties/VariantProperty', namespaces=ns)},
+        "variants": {
+            fmi._SHORT_VARIANT: [dict(e.attrib) for e in root.xpath('//variant:short-variant', namespaces=ns)],
+            fmi._COPY_NUMBER_ALTERATION: [dict(e.attrib) for e in root.xpath('//variant:copy-number-alteration', namespaces=ns)],
+            fmi._REARRANGEMENT: [dict(e.attrib) for e in root.xpath('//variant:rearrangement', namespaces=ns)],
+        },
+    }
+
+
+def read_tree(root: str) -> dict:
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+class TestFoundationMedIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.xml_dir = os.path.join(self.tmp_dir, "xml")
+        os.makedirs(self.xml_dir)
+        for i in range(6):
+            with open(os.path.join(self.xml_dir, f"report_{i}.xml"), "w") as f:
+                f.write(make_report(f"TRF{i:04d}"))
+        # same sample as report_0: the later file wins in both modes
+        with open(os.path.join(self.xml_dir, "report_6.xml"), "w") as f:
+            f.write(make_report("TRF0000", genes=("BRAF",)))
+        with open(os.path.join(self.xml_dir, "report_7.xml"), "w") as f:
+            f.write("<not-xml")
+        self.xml_files = sorted(os.path.join(self.xml_dir, name) for name in os.listdir(self.xml_dir))
+        patcher = mock.patch("config.FMI_MANIFEST_PATH", os.path.join(self.tmp_dir, "manifest.sqlite3"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_extract_xml_file(self):
+        sample_id, clinical, genomic = fmi.extract_xml_file(self.xml_files[1])
+        self.assertEqual(sample_id, "TRF0001")
+        self.assertEqual(clinical["ONCOTREE_PRIMARY_DIAGNOSIS_NAME"], "Adrenocortical Carcinoma")
+        self.assertEqual(clinical["TUMOR_MUTATIONAL_BURDEN_PER_MEGABASE"], 12.5)
+        self.assertEqual([(v["TRUE_HUGO_SYMBOL"], v.get("TIER")) for v in genomic],
+                         [("TP53", None), ("KRAS", 4), ("ERBB2", None)])
+
+    def test_scan_matches_xpath_lookups(self):
+        for report in (make_report("TRF1"), make_report("TRF2", genes=()), make_edge_case_report("TRF3")):
+            xml_content = report.encode()
+            self.assertEqual(fmi.scan_foundation_med_xml(xml_content), reference_scan(xml_content))
+        scan = fmi.scan_foundation_med_xml(make_edge_case_report("TRF3").encode())
+        self.assertEqual(scan["pmi"]["ReportId"], ["TRF3", "x"])
+        self.assertEqual(scan["gene_vus_mapping"], {"KRAS": "true", "TP53": "true"})
+        with self.assertRaises(etree.ParseError):
+            fmi.scan_foundation_med_xml(b"<not-xml")
+
+    def test_scan_streams_from_the_file(self):
+        # biomarker values outside the biomarkers element, and a second variant-report, are ignored
+        report = make_report("TRF4").replace("<biomarkers>", '<tumor-mutation-burden score="99"/><biomarkers>')
+        report = report.replace("</rr:ResultsPayload>", (
+            '<variant-report xmlns="http://foundationmedicine.com/compbio/variant-report-external">'
+            '<biomarkers><microsatellite-instability status="MSI-H"/></biomarkers></variant-report></rr:ResultsPayload>'
+        ))
+        path = os.path.join(self.tmp_dir, "report.xml")
+        with open(path, "w") as f:
+            f.write(report)
+        scan = fmi.scan_foundation_med_xml(path)
+        self.assertEqual(scan, reference_scan(report.encode()))
+        self.assertEqual(scan["biomarkers"], {"tmb_score": ["12.5"], "msi_status": ["MSS"]})
+        with open(path, "rb") as f:
+            self.assertEqual(fmi.scan_foundation_med_xml(f), scan)
+
+    def test_parallel_run_matches_serial_run(self):
+        serial_dir = os.path.join(self.tmp_dir, "serial")
+        parallel_dir = os.path.join(self.tmp_dir, "parallel")
+        serial = fmi.ingest_xml_files(self.xml_files, workers=1, output_dir=serial_dir)
+        parallel = fmi.ingest_xml_files(self.xml_files, workers=3, output_dir=parallel_dir, ai_concurrency=2)
+
+        self.assertEqual(read_tree(serial_dir), read_tree(parallel_dir))
+        self.assertEqual(len(read_tree(serial_dir)), 12)
+        for summary in (serial, parallel):
+            self.assertEqual([row["file"] for row in summary], [os.path.basename(p) for p in self.xml_files])
+            self.assertEqual([row["status"] for row in summary], ["ok"] * 7 + ["failed"])
+            self.assertEqual(summary[0]["sample_id"], "TRF0000")
+            self.assertIsNotNone(summary[-1]["error"])
+        self.assertEqual([row["sample_id"] for row in serial], [row["sample_id"] for row in parallel])
+
+    def test_diagnosis_is_resolved_once_per_batch(self):
+        from patient_data import get_patient_clinical_data
+
+        resolve = get_patient_clinical_data.get_oncotree_diagnosis
+        with mock.patch.object(get_patient_clinical_data, "get_oncotree_diagnosis", side_effect=resolve) as resolver:
+            summary = fmi.ingest_xml_files(self.xml_files, output_dir=os.path.join(self.tmp_dir, "out"))
+        self.assertEqual([row["status"] for row in summary], ["ok"] * 7 + ["failed"])
+        self.assertEqual(resolver.call_count, 1)
+        self.assertIsNone(fmi._diagnosis_memo)
+
+    def test_unchanged_reports_are_skipped(self):
+        output_dir = os.path.join(self.tmp_dir, "out")
+        fmi.ingest_xml_files(self.xml_files, output_dir=output_dir)
+        expected = read_tree(output_dir)
+
+        summary = fmi.ingest_xml_files(self.xml_files, output_dir=output_dir)
+        self.assertEqual([row["status"] for row in summary], ["skipped"] * 7 + ["failed"])
+        self.assertEqual(summary[1]["sample_id"], "TRF0001")
+
+        # changed content, a deleted output and a new parser version are reprocessed
+        with open(self.xml_files[2], "a") as f:
+            f.write("<!-- amended -->")
+        os.remove(os.path.join(output_dir, "genomic_json", "TRF0003.json"))
+        summary = fmi.ingest_xml_files(self.xml_files, output_dir=output_dir)
+        self.assertEqual([row["status"] for row in summary[:5]], ["skipped", "skipped", "ok", "ok", "skipped"])
+        self.assertEqual(read_tree(output_dir), expected)
+
+        self.assertEqual({row["status"] for row in fmi.ingest_xml_files(self.xml_files[:7], output_dir=output_dir, force=True)},
+                         {"ok"})
+        with mock.patch.object(fmi, "FMI_PARSER_VERSION", fmi.FMI_PARSER_VERSION + 1):
+            self.assertEqual({row["status"] for row in fmi.ingest_xml_files(self.xml_files[:7], output_dir=output_dir)},
+                             {"ok"})
+
+    def test_skipped_report_overwritten_in_the_same_run_is_reprocessed(self):
+        output_dir = os.path.join(self.tmp_dir, "out")
+        fmi.ingest_xml_files(self.xml_files, output_dir=output_dir)
+        expected = read_tree(output_dir)
+
+        # report_0 changes and rewrites TRF0000, which the unchanged report_6 has to restore
+        with open(self.xml_files[0], "a") as f:
+            f.write("<!-- amended -->")
+        summary = fmi.ingest_xml_files(self.xml_files, workers=2, output_dir=output_dir)
+        self.assertEqual((summary[0]["status"], summary[6]["status"]), ("ok", "ok"))
+        self.assertEqual(summary[1]["status"], "skipped")
+        self.assertEqual(read_tree(output_dir), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
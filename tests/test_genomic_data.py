@@ -0,0 +1,134 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'patient_data'))
+
+import config
+from patient_data import get_patient_genomic_data as genomic
+
+REPORT = """ARFRP1 R177H NM_003224.3: c.530G>A(p.R177H), 530G>A, chr20:62331871 38.07%
+MRE11
+Q582* NM_005590.3: c.1744C>T(p.Q582*), 1744C>T, chr11:94180424 48.54%
+(MRE11A)
+ROST fusion GOPC(NM_020399)-ROS1(NM_002944) fusion (G8; R35)
+TP53 R337C NM_000546.4: c.1009C>T(p.R337C), 1009C>T, chr17:7574018 46.45%
+L93fs*30 NM_000546.4: c.277del(p.L93Cfs*30), 277deIC, chr17:7579409-7579410 45.74%"""
+
+
+class TestCensusAnnotation(unittest.TestCase):
+
+    def test_ref_seq_index(self):
+        self.assertEqual(genomic.gene_to_ref_seq_ids["TP53"], ["NM_001276761.1"])
+        self.assertEqual(genomic.ref_seq_to_gene["NM_001276761"], "TP53")
+
+    def test_get_and_append_gene_from_census(self):
+        annotated = genomic.get_and_append_gene_from_census(
+            "ROST fusion GOPC(NM_020399)-ROS1(NM_002944) fusion\nTP53 V272M NM_001276761.2: c.814G>A\n426"
+        )
+        self.assertEqual(annotated.split("\n"), [
+            "ROST fusion GOPC(NM_020399)-ROS1(NM_002944) fusion Possible Gene(s): GOPC, ROS1",
+            "TP53 V272M NM_001276761.2: c.814G>A Possible Gene(s): TP53",
+            "426",
+        ])
+
+
+class TestGenomicChunking(unittest.TestCase):
+
+    def test_split_into_variant_chunks(self):
+        chunks = genomic.split_into_variant_chunks(REPORT, 2)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith("ARFRP1"))
+        self.assertTrue(chunks[0].endswith("48.54%"))
+        self.assertTrue(chunks[1].startswith("(MRE11A)"))
+        self.assertEqual(chunks[2].split("\n"), [REPORT.split("\n")[-1]])
+
+    def test_merge_genomic_results(self):
+        tp53 = {"TRUE_HUGO_SYMBOL": "TP53", "VARIANT_CATEGORY": "MUTATION", "TRUE_PROTEIN_CHANGE": "p.R337C"}
+        idh1 = {"WILDTYPE": True, "TRUE_HUGO_SYMBOL": "IDH1"}
+        merged = genomic.merge_genomic_results([
+            [[tp53, idh1]],
+            {"variants": [dict(tp53), {"TRUE_HUGO_SYMBOL": "TP53", "VARIANT_CATEGORY": "MUTATION", "TRUE_PROTEIN_CHANGE": "p.L93Cfs*30"}]},
+            idh1,
+            {},
+        ])
+        self.assertEqual(
+            [(entry["TRUE_HUGO_SYMBOL"], entry.get("TRUE_PROTEIN_CHANGE")) for entry in merged],
+            [("TP53", "p.R337C"), ("IDH1", None), ("TP53", "p.L93Cfs*30")],
+        )
+
+    @mock.patch.object(config, "GENOMIC_RULE_PARSER_ENABLED", False)
+    @mock.patch.object(genomic.ai, "get_patient_genomic_criteria", return_value=[])
+    def test_short_report_uses_single_request(self, criteria):
+        genomic.get_patent_genomic_data(REPORT, "test", "IDH_WILDTYPE: True")
+        criteria.assert_called_once_with("test", REPORT + "\nIDH_WILDTYPE: True")
+
+    @mock.patch.object(config, "GENOMIC_RULE_PARSER_ENABLED", False)
+    @mock.patch.object(config, "GENOMIC_CHUNK_SIZE", 2)
+    def test_long_report_is_chunked(self):
+        def criteria(file_name, prompt):
+            return [{"TRUE_HUGO_SYMBOL": line.split()[0], "VARIANT_CATEGORY": "MUTATION"} for line in prompt.split("\n")]
+
+        with mock.patch.object(genomic.ai, "get_patient_genomic_criteria", side_effect=criteria) as mocked:
+            result = genomic.get_patent_genomic_data(REPORT, "test", "IDH_WILDTYPE: True")
+        self.assertEqual(mocked.call_count, 4)
+        self.assertEqual(
+            [entry["TRUE_HUGO_SYMBOL"] for entry in result],
+            ["ARFRP1", "MRE11", "Q582*", "(MRE11A)", "ROST", "TP53", "L93fs*30", "IDH_WILDTYPE:"],
+        )
+
+    @mock.patch.object(config, "GENOMIC_RULE_PARSER_ENABLED", False)
+    @mock.patch.object(config, "GENOMIC_CHUNK_SIZE", 2)
+    def test_failed_chunk_fails_the_conversion(self):
+        def criteria(file_name, prompt):
+            if prompt.startswith("ARFRP1"):
+                raise Exception("AI service error")
+            return [{"TRUE_HUGO_SYMBOL": line.split()[0], "VARIANT_CATEGORY": "MUTATION"} for line in prompt.split("\n")]
+
+        with mock.patch.object(genomic.ai, "get_patient_genomic_criteria", side_effect=criteria):
+            with self.assertRaisesRegex(Exception, "AI service error"):
+                genomic.get_patent_genomic_data(REPORT, "test", "IDH_WILDTYPE: True")
+
+    @mock.patch.object(config, "GENOMIC_RULE_PARSER_ENABLED", False)
+    @mock.patch.object(genomic.ai, "get_patient_genomic_criteria", side_effect=Exception("AI service error"))
+    def test_failed_conversion_writes_no_json(self, criteria):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for name in ("extracted_text_dir", "clinical_txt_dir", "genomic_json_dir"):
+            os.makedirs(os.path.join(tmp_dir, name))
+            patcher = mock.patch.object(genomic, name, os.path.join(tmp_dir, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(os.path.join(tmp_dir, "extracted_text_dir", "m1.txt"), "w") as f:
+            f.write(REPORT)
+
+        with self.assertRaises(Exception):
+            genomic.main("m1.txt")
+        self.assertEqual(os.listdir(os.path.join(tmp_dir, "genomic_json_dir")), [])
+
+    @mock.patch.object(genomic.ai, "get_patient_genomic_criteria", return_value=[])
+    def test_only_unparsed_lines_go_to_ai(self, criteria):
+        result = genomic.get_patent_genomic_data(REPORT, "test", "IDH_WILDTYPE: True")
+        criteria.assert_called_once_with("test", "\n".join(REPORT.split("\n")[1:5]) + "\n")
+        self.assertEqual(
+            [entry["TRUE_HUGO_SYMBOL"] for entry in result],
+            ["ARFRP1", "TP53", "TP53", "IDH1", "IDH2"],
+        )
+
+    @mock.patch.object(genomic.ai, "get_patient_genomic_criteria")
+    def test_fully_parsed_report_skips_ai(self, criteria):
+        lines = REPORT.split("\n")
+        fusion = "ROS1 fusion GOPC(NM_020399)-ROS1(NM_002944) fusion (G8; R35)"
+        result = genomic.get_patent_genomic_data("\n".join(lines[:1] + [fusion] + lines[5:]), "test")
+        criteria.assert_not_called()
+        self.assertEqual(
+            [(entry["TRUE_HUGO_SYMBOL"], entry["VARIANT_CATEGORY"]) for entry in result],
+            [("ARFRP1", "MUTATION"), ("ROS1", "SV"), ("TP53", "MUTATION"), ("TP53", "MUTATION")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'patient_data'))
+
+from patient_data import genomic_variant_parser as gvp
+from patient_data.surya_ocr_text_extract import get_mock_response, clean_html_tags, decode_html_entities
+
+
+class TestClassifyHgvs(unittest.TestCase):
+
+    def test_classifications(self):
+        cases = [
+            ("530G>A", "p.R177H", "Missense_Mutation"),
+            ("530G>A", "p.Arg177His", "Missense_Mutation"),
+            ("531G>A", "p.R177=", "Silent"),
+            ("1744C>T", "p.Q582*", "Nonsense_Mutation"),
+            ("1285del", "p.H429Tfs*39", "Frame_Shift_Del"),
+            ("811_814del", "p.S271Rfs*2", "Frame_Shift_Del"),
+            ("1304dup", "p.N435Kfs*4", "Frame_Shift_Ins"),
+            ("2235_2249del", "p.E746_A750del", "In_Frame_Del"),
+            ("2310_2311insGGT", "p.D770_N771insG", "In_Frame_Ins"),
+            ("2271_2272delinsTTTA", "p.R757*", "Nonsense_Mutation"),
+            ("4715+1G>A", "p.?", "Splice_Site"),
+            ("4715+5G>A", None, "Splice_Region"),
+            ("-124C>T", None, "5'Flank"),
+            ("1A>G", "p.M1?", "Translation_Start_Site"),
+        ]
+        for cdna, protein, expected in cases:
+            with self.subTest(cdna=cdna, protein=protein):
+                self.assertEqual(gvp.classify_hgvs(cdna, protein), expected)
+
+    def test_ambiguous_changes_are_not_classified(self):
+        self.assertIsNone(gvp.classify_hgvs("2235_2236delinsAT", "p.E746delinsD"))
+        self.assertIsNone(gvp.classify_hgvs("530G>A", None))
+
+
+class TestParseGenomicReport(unittest.TestCase):
+
+    def test_parse_variant_line(self):
+        entries = gvp.parse_variant_line("TP53 R337C NM_000546.4: c.1009C>T(p.R337C), 1009C>T, chr17:7574018 46.45%")
+        self.assertEqual(entries, [{
+            "WILDTYPE": False,
+            "TRUE_HUGO_SYMBOL": "TP53",
+            "VARIANT_CATEGORY": "MUTATION",
+            "TRUE_VARIANT_CLASSIFICATION": "Missense_Mutation",
+            "TRUE_PROTEIN_CHANGE": "p.R337C",
+        }])
+
+    def test_fusion_is_one_entry_for_the_reported_gene(self):
+        entries = gvp.parse_variant_line("ROS1 fusion GOPC(NM_020399)-ROS1(NM_002944) fusion (G8; R35)")
+        self.assertEqual(entries, [{
+            "WILDTYPE": False,
+            "TRUE_HUGO_SYMBOL": "ROS1",
+            "VARIANT_CATEGORY": "SV",
+            "LEFT_PARTNER_GENE": "GOPC",
+            "RIGHT_PARTNER_GENE": "ROS1",
+        }])
+        # an OCR'd gene name that matches neither partner is left to the AI
+        self.assertIsNone(gvp.parse_variant_line(
+            "ROST fusion GOPC(NM_020399)-ROS1(NM_002944) fusion (G8; R35) Possible Gene(s): GOPC, ROS1"))
+
+    def test_mock_report(self):
+        text = decode_html_entities(clean_html_tags(get_mock_response()))
+        entries, unparsed = gvp.parse_genomic_report(text)
+
+        self.assertEqual(len(entries), 11)
+        by_change = {entry.get("TRUE_PROTEIN_CHANGE"): entry for entry in entries}
+        # continuation lines take the gene of the line above
+        self.assertEqual(by_change["p.S271Rfs*2"]["TRUE_HUGO_SYMBOL"], "MSH2")
+        self.assertEqual(by_change["p.L93Cfs*30"]["TRUE_HUGO_SYMBOL"], "TP53")
+        self.assertEqual(by_change[None]["TRUE_HUGO_SYMBOL"], "SETD2")
+        # MRE11 is not a known gene symbol, so its variant is left to the AI together with the gene line
+        self.assertEqual(unparsed.split("\n")[0], "MRE11")
+        self.assertTrue(unparsed.split("\n")[1].startswith("Q582*"))
+        # so is the fusion listed under the misread "ROST"
+        self.assertIn("ROST fusion GOPC(NM_020399)-ROS1(NM_002944) fusion", unparsed)
+
+    def test_clinical_idh_wildtype(self):
+        self.assertEqual(
+            gvp.parse_clinical_genomic_fields("AGE: 54\nIDH_WILDTYPE: False\n"),
+            [{"WILDTYPE": False, "TRUE_HUGO_SYMBOL": "IDH1"}, {"WILDTYPE": False, "TRUE_HUGO_SYMBOL": "IDH2"}],
+        )
+        self.assertEqual(gvp.parse_clinical_genomic_fields("AGE: 54"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
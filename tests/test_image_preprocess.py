@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from patient_data import image_preprocess as ip
+
+
+def make_page(width=1200, rows=12, row_gap=60, margin=80, mode='RGB') -> Image.Image:
+    """White page with rows of black 'words'"""
+    height = margin * 2 + rows * row_gap
+    image = Image.new(mode, (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for row in range(rows):
+        y = margin + row * row_gap
+        for x in range(margin, width - margin - 140, 170):
+            draw.rectangle((x, y, x + 140, y + 18), fill='black')
+    return image
+
+
+class TestImagePreprocess(unittest.TestCase):
+
+    def test_skew_is_estimated_and_corrected(self):
+        page = make_page(mode='L')
+        for angle in (-3, 2):
+            with self.subTest(angle=angle):
+                skewed = page.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+                self.assertAlmostEqual(ip.estimate_skew(np.asarray(skewed), 5), -angle, delta=0.25)
+                fixed = ip.deskew(skewed, ip.estimate_skew(np.asarray(skewed), 5))
+                self.assertAlmostEqual(ip.estimate_skew(np.asarray(fixed), 5), 0, delta=0.25)
+        self.assertIs(ip.deskew(page, ip.estimate_skew(np.asarray(page), 5)), page)
+
+    def test_margins_are_cropped(self):
+        cropped = ip.crop_margins(make_page(mode='L'), 16)
+        # six 141px words 170px apart on each of twelve 19px rows 60px apart, plus the margins
+        self.assertEqual(cropped.size, (170 * 5 + 141 + 32, 60 * 11 + 19 + 32))
+        blank = Image.new('L', (50, 50), 255)
+        self.assertIs(ip.crop_margins(blank, 16), blank)
+
+    def test_tall_page_is_cut_between_text_rows(self):
+        page = make_page(width=600, rows=60, row_gap=50, mode='L')
+        tiles = ip.split_tall_image(page, 2.0)
+        self.assertEqual(len(tiles), int(np.ceil(page.height / 1200)))
+        self.assertEqual(sum(tile.height for tile in tiles), page.height)
+        for tile in tiles:
+            ink = np.asarray(tile) < ip.INK_THRESHOLD
+            # no word is cut: the first and last rows of every tile are blank
+            self.assertFalse(ink[0].any() or ink[-1].any())
+        self.assertEqual(ip.split_tall_image(page, 0), [page])
+
+    def test_preprocess_gives_bounded_grayscale_tiles(self):
+        tiles = ip.preprocess_image(make_page(width=4000, rows=20, row_gap=120), max_side=1024,
+                                    deskew_max_angle=5, crop_margin=16, tile_max_aspect=2.0)
+        self.assertEqual(len(tiles), 1)
+        self.assertEqual(tiles[0].mode, 'L')
+        self.assertEqual(max(tiles[0].size), 1024)
+
+        # a skewed, tall page: levelled, then tiles no larger than the cap
+        page = make_page(width=1600, rows=80, row_gap=60).rotate(2, expand=True, fillcolor='white')
+        tiles = ip.preprocess_image(page, max_side=1024, deskew_max_angle=5, crop_margin=16, tile_max_aspect=2.0)
+        self.assertGreater(len(tiles), 1)
+        for tile in tiles:
+            self.assertLessEqual(max(tile.size), 1024)
+            self.assertAlmostEqual(ip.estimate_skew(np.asarray(tile), 5), 0, delta=0.25)
+
+    def test_load_page_images_respects_switch(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'page.png')
+            make_page().save(path)
+            self.assertEqual([tile.mode for tile in ip.load_page_images(path)], ['L'])
+            with mock.patch('config.OCR_PREPROCESS_ENABLED', False):
+                images = ip.load_page_images(path)
+            self.assertEqual((images[0].mode, images[0].size), ('RGB', make_page().size))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
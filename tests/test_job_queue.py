@@ -0,0 +1,167 @@
+import os
+import time
+import importlib
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+import config
+from utils.job_queue import JobQueue, JobDispatcher
+from utils.job_runner import JOB_MODULES, _init_worker, _run_job
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp_dir, 'jobs.sqlite3'), max_attempts=2,
+                              backoff=10, backoff_max=60, lease_seconds=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_job_lifecycle(self):
+        self.queue.enqueue('250101-0001', 'genomic', '250101-0001.txt')
+        self.assertEqual(self.queue.get_jobs('250101-0001')[0]['state'], 'queued')
+
+        job, = self.queue.claim('genomic', limit=5, max_running=5)
+        self.assertEqual((job['data_file'], job['attempts']), ('250101-0001.txt', 1))
+        self.assertEqual(self.queue.get_jobs('250101-0001')[0]['state'], 'running')
+        self.assertEqual(self.queue.claim('genomic', limit=5, max_running=5), [])
+
+        self.queue.complete(job, 1.5)
+        status, = self.queue.get_jobs('250101-0001')
+        self.assertEqual((status['state'], status['duration'], status['attempts']), ('succeeded', 1.5, 1))
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        self.queue.enqueue('m1', 'clinical', 'm1.txt')
+        job, = self.queue.claim('clinical', 1, 1)
+        self.queue.fail(job, 'AI service unavailable')
+        self.assertEqual(self.queue.get_jobs('m1')[0]['state'], 'queued')
+        # not due before the backoff has passed
+        self.assertEqual(self.queue.claim('clinical', 1, 1), [])
+
+        with mock.patch('utils.job_queue.time.time', return_value=time.time() + 11):
+            job, = self.queue.claim('clinical', 1, 1)
+        self.assertEqual(job['attempts'], 2)
+        self.queue.fail(job, 'AI service unavailable')
+        status, = self.queue.get_jobs('m1')
+        self.assertEqual((status['state'], status['error']), ('failed', 'AI service unavailable'))
+
+    def test_max_running_is_shared(self):
+        for mmid in ('a', 'b', 'c'):
+            self.queue.enqueue(mmid, 'genomic', f'{mmid}.txt')
+        self.assertEqual(len(self.queue.claim('genomic', limit=5, max_running=2)), 2)
+        self.assertEqual(self.queue.claim('genomic', limit=5, max_running=2), [])
+
+    def test_abandoned_job_is_requeued(self):
+        self.queue.enqueue('m1', 'genomic', 'm1.txt')
+        job, = self.queue.claim('genomic', 1, 1)
+        with mock.patch('utils.job_queue.process_alive', return_value=False):
+            reclaimed, = self.queue.claim('genomic', 1, 1)
+        self.assertEqual(reclaimed['attempts'], 2)
+        # the lost attempt can no longer record a result
+        self.queue.complete(job, 1.0)
+        self.assertEqual(self.queue.get_jobs('m1')[0]['state'], 'running')
+
+    def test_publish_only_for_the_current_claim(self):
+        self.queue.enqueue('m1', 'ocr', 'm1.txt')
+        stale, = self.queue.claim('ocr', 1, 1)
+        self.queue.enqueue('m1', 'ocr', 'm1.txt')
+        current, = self.queue.claim('ocr', 1, 1)
+        installed = []
+        self.assertFalse(self.queue.publish('m1', 'ocr', stale['claim_token'], lambda: installed.append('stale')))
+        self.assertTrue(self.queue.publish('m1', 'ocr', current['claim_token'], lambda: installed.append('current')))
+        self.assertEqual(installed, ['current'])
+
+    def test_resubmission_resets_job(self):
+        self.queue.enqueue('m1', 'genomic', 'm1.txt')
+        job, = self.queue.claim('genomic', 1, 1)
+        self.queue.fail(job, 'error')
+        self.queue.enqueue('m1', 'genomic', 'm1.txt')
+        status, = self.queue.get_jobs('m1')
+        self.assertEqual((status['state'], status['attempts'], status['error']), ('queued', 0, None))
+
+
+class FakeRunner:
+    max_workers = {'genomic': 1}
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, job_type, unique_id, data_file, claim_token=None):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+class InlineRunner:
+    """Runs the real job module in the calling thread"""
+    max_workers = {'genomic': 1}
+
+    def submit(self, job_type, unique_id, data_file, claim_token=None):
+        future = Future()
+        try:
+            future.set_result(_run_job(JOB_MODULES[job_type], data_file))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class TestJobDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp_dir, 'jobs.sqlite3'), max_attempts=1,
+                              backoff=10, backoff_max=60, lease_seconds=3600)
+        self.runner = FakeRunner()
+        self.dispatcher = JobDispatcher(self.queue, self.runner, {'genomic': 5}, poll_interval=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_dispatch_respects_worker_slots_and_records_results(self):
+        self.queue.enqueue('a', 'genomic', 'a.txt')
+        self.queue.enqueue('b', 'genomic', 'b.txt')
+        self.dispatcher.dispatch()
+        self.assertEqual(len(self.runner.futures), 1)
+
+        self.runner.futures[0].set_result(2.0)
+        self.assertEqual(self.queue.get_jobs('a')[0]['state'], 'succeeded')
+        self.dispatcher.dispatch()
+        self.runner.futures[1].set_exception(ValueError('bad report'))
+        status, = self.queue.get_jobs('b')
+        self.assertEqual((status['state'], status['error']), ('failed', 'bad report'))
+
+
+    @mock.patch.object(config, 'GENOMIC_RULE_PARSER_ENABLED', False)
+    def test_ai_error_in_genomic_conversion_requeues_the_job(self):
+        # as in a worker process of the genomic pool
+        _init_worker(JOB_MODULES['genomic'])
+        genomic = importlib.import_module(JOB_MODULES['genomic'])
+
+        queue = JobQueue(os.path.join(self.tmp_dir, 'retry.sqlite3'), max_attempts=3,
+                         backoff=10, backoff_max=60, lease_seconds=3600)
+        dispatcher = JobDispatcher(queue, InlineRunner(), {'genomic': 1}, poll_interval=60)
+        for name in ('extracted_text_dir', 'clinical_txt_dir', 'genomic_json_dir'):
+            os.makedirs(os.path.join(self.tmp_dir, name))
+            patcher = mock.patch.object(genomic, name, os.path.join(self.tmp_dir, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(os.path.join(self.tmp_dir, 'extracted_text_dir', 'm1.txt'), 'w') as f:
+            f.write('TP53 R337C NM_000546.4: c.1009C>T(p.R337C)')
+
+        queue.enqueue('m1', 'genomic', 'm1.txt')
+        ai_error = Exception('AI service error: Unable to connect to AI service.')
+        with mock.patch.object(genomic.ai, 'get_patient_genomic_criteria', side_effect=ai_error):
+            dispatcher.dispatch()
+        status, = queue.get_jobs('m1')
+        self.assertEqual((status['state'], status['attempts']), ('queued', 1))
+        self.assertIn('AI service error', status['error'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'genomic_json_dir')), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.job_runner import JobRunner
+
+
+def main(data_file):
+    """Conversion stand-in run inside the worker processes: records the worker's pid"""
+    if data_file.endswith('fail.txt'):
+        raise ValueError("conversion failed")
+    with open(data_file, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.runner = JobRunner({'test': 1}, {'test': __name__})
+
+    def tearDown(self):
+        self.runner.shutdown()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_jobs_reuse_the_worker_process(self):
+        paths = [os.path.join(self.tmp_dir, f'{i}.txt') for i in range(3)]
+        futures = [self.runner.submit('test', str(i), path) for i, path in enumerate(paths)]
+        for future in futures:
+            self.assertGreaterEqual(future.result(timeout=60), 0)
+
+        pids = set()
+        for path in paths:
+            with open(path) as f:
+                pids.add(f.read())
+        self.assertEqual(len(pids), 1)
+        self.assertNotEqual(pids, {str(os.getpid())})
+
+    def test_failed_job_raises_from_future(self):
+        future = self.runner.submit('test', 'x', os.path.join(self.tmp_dir, 'fail.txt'))
+        with self.assertRaises(ValueError):
+            future.result(timeout=60)
+
+    def test_shutdown_waits_and_rejects_new_jobs(self):
+        path = os.path.join(self.tmp_dir, 'last.txt')
+        future = self.runner.submit('test', 'x', path)
+        self.runner.shutdown()
+        self.assertTrue(future.done())
+        self.assertTrue(os.path.exists(path))
+        with self.assertRaises(RuntimeError):
+            self.runner.submit('test', 'y', path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from utils.ocr_cache import OCRResultCache
+from utils.sqlite_store import hash_file
+
+
+class TestOCRResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, "ocr_cache.sqlite3")
+
+    def _cache(self, engine="engine-a", max_entries=100, max_bytes=10 ** 6):
+        return OCRResultCache(self.db_path, engine, max_entries, max_bytes)
+
+    def test_hash_file(self):
+        paths = []
+        for name, content in (("a.png", b"page"), ("b.png", b"page"), ("c.png", b"other page")):
+            paths.append(os.path.join(self.tmp_dir, name))
+            with open(paths[-1], "wb") as f:
+                f.write(content)
+        hashes = [hash_file(path) for path in paths]
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertNotEqual(hashes[0], hashes[2])
+        self.assertEqual(len(hashes[0]), 64)
+
+    def test_get_put(self):
+        cache = self._cache()
+        self.assertEqual(cache.get_many(["h1", "h2"]), {})
+        cache.put_many({"h1": "TP53 R337C", "h2": "KRAS G12C"})
+        self.assertEqual(self._cache().get_many(["h1", "h3", "h1"]), {"h1": "TP53 R337C"})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (0, 2, 2))
+
+    def test_other_engine_versions_are_dropped(self):
+        self._cache("engine-a").put_many({"h1": "text"})
+        cache = self._cache("engine-b")
+        self.assertEqual(cache.get_many(["h1"]), {})
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_lru_eviction_by_entries_and_size(self):
+        cache = self._cache(max_entries=2)
+        cache.put_many({"a": "1"})
+        with mock.patch("utils.ocr_cache.time.time", return_value=time.time() + 1):
+            cache.put_many({"b": "2"})
+        with mock.patch("utils.ocr_cache.time.time", return_value=time.time() + 2):
+            cache.get_many(["a"])
+        with mock.patch("utils.ocr_cache.time.time", return_value=time.time() + 3):
+            cache.put_many({"c": "3"})
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": "1", "c": "3"})
+
+        cache = self._cache("engine-small", max_bytes=10)
+        cache.put_many({"x": "12345"})
+        with mock.patch("utils.ocr_cache.time.time", return_value=time.time() + 1):
+            cache.put_many({"y": "123456"})
+        self.assertEqual(cache.get_many(["x", "y"]), {"y": "123456"})
+
+
+if __name__ == "__main__":
+    unittest.main()
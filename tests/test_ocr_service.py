@@ -0,0 +1,328 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from config import Config
+from patient_data import ocr_service
+from patient_data.ocr_service import (OCRService, OCRClient, OCRServiceError, MockOCRBackend, TesseractOCRBackend,
+                                      CachedOCRBackend, create_ocr_backend, run_ocr_job)
+from utils.job_queue import JobQueue
+from utils.ocr_cache import OCRResultCache
+import pytesseract_text_extract
+
+
+class PageNameBackend:
+    """Returns each image's file name as its text"""
+    name = 'test'
+
+    def __init__(self):
+        self.calls = []
+
+    def extract(self, image_paths):
+        self.calls.append(image_paths)
+        if any(path.endswith('bad.png') for path in image_paths):
+            raise ValueError('unreadable image')
+        return [os.path.basename(path) for path in image_paths]
+
+
+class TestOCRService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp_dir, 'ocr.sock')
+        self.backend = PageNameBackend()
+        self.service = OCRService(self.backend, self.address, b'test', batch_size=4)
+        self.thread = threading.Thread(target=self.service.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = OCRClient(self.address, b'test', timeout=10, autostart=False, start_timeout=0)
+        for _ in range(100):
+            if os.path.exists(self.address):
+                break
+            threading.Event().wait(0.05)
+
+    def tearDown(self):
+        self.service.stop()
+        self.thread.join(5)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_pages_come_back_in_order(self):
+        self.assertEqual(self.client.extract_pages(['p-01.png', 'p-02.png', 'p-03.png'], 'm1'),
+                         ['p-01.png', 'p-02.png', 'p-03.png'])
+        self.assertEqual(self.client.extract_text(['p-01.png', 'p-02.png']), 'p-01.png\np-02.png\n')
+
+    def test_backend_stays_loaded_across_requests(self):
+        for _ in range(3):
+            self.client.extract_pages(['p-01.png'])
+        self.assertEqual(len(self.backend.calls), 3)
+
+    def test_backend_error_is_raised_by_client(self):
+        with self.assertRaisesRegex(OCRServiceError, 'unreadable image'):
+            self.client.extract_pages(['bad.png'])
+        # the service keeps serving afterwards
+        self.assertEqual(self.client.extract_pages(['ok.png']), ['ok.png'])
+
+    def test_queued_requests_are_batched(self):
+        # hold the inference thread on a first request while two more queue up
+        started, release = threading.Event(), threading.Event()
+        original_extract = self.backend.extract
+
+        def slow_extract(image_paths):
+            if [os.path.basename(path) for path in image_paths] == ['first.png']:
+                started.set()
+                release.wait(5)
+            return original_extract(image_paths)
+
+        self.backend.extract = slow_extract
+        results = {}
+
+        def submit(name, pages):
+            results[name] = self.client.extract_pages(pages, name)
+
+        threads = [threading.Thread(target=submit, args=('first', ['first.png']))]
+        threads[0].start()
+        started.wait(5)
+        for queued, (name, pages) in enumerate((('a', ['a-01.png', 'a-02.png']), ('b', ['b-01.png'])), 1):
+            threads.append(threading.Thread(target=submit, args=(name, pages)))
+            threads[-1].start()
+            # wait for each request to be queued so that they are batched in submission order
+            for _ in range(500):
+                if self.service.requests.qsize() == queued:
+                    break
+                threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(results, {'first': ['first.png'], 'a': ['a-01.png', 'a-02.png'], 'b': ['b-01.png']})
+        self.assertEqual([os.path.basename(path) for path in self.backend.calls[-1]], ['a-01.png', 'a-02.png', 'b-01.png'])
+
+    def test_failed_batch_is_retried_per_request(self):
+        replies = self.service._run_batch([
+            (None, {'image_paths': ['ok.png']}, 0),
+            (None, {'image_paths': ['bad.png']}, 0),
+        ])
+        self.assertEqual(replies, [{'texts': ['ok.png']}, {'error': 'unreadable image'}])
+
+    def test_ocr_job_writes_extracted_text_of_the_submission_pages(self):
+        image_dir = os.path.join(self.tmp_dir, 'images')
+        text_dir = os.path.join(self.tmp_dir, 'extracted_text')
+        os.makedirs(image_dir)
+        os.makedirs(text_dir)
+        for name in ('m1-02.jpg', 'm1-01.png', 'm10-01.png', 'm1-notes.txt'):
+            open(os.path.join(image_dir, name), 'w').close()
+
+        with mock.patch.object(Config, 'IMAGE_FOLDER', image_dir), \
+                mock.patch.object(Config, 'EXTRACTED_TEXT', text_dir), \
+                mock.patch('patient_data.ocr_service.get_ocr_client', return_value=self.client):
+            run_ocr_job('m1.txt')
+            with self.assertRaises(FileNotFoundError):
+                run_ocr_job('m2.txt')
+
+        with open(os.path.join(text_dir, 'm1.txt')) as f:
+            self.assertEqual(f.read(), 'm1-01.png\nm1-02.jpg\n')
+        self.assertEqual(os.listdir(text_dir), ['m1.txt'])
+
+    def test_stale_ocr_job_does_not_overwrite_newer_text(self):
+        image_dir = os.path.join(self.tmp_dir, 'images')
+        text_dir = os.path.join(self.tmp_dir, 'extracted_text')
+        os.makedirs(image_dir)
+        os.makedirs(text_dir)
+        open(os.path.join(image_dir, 'm1-01.png'), 'w').close()
+        queue = JobQueue(os.path.join(self.tmp_dir, 'jobs.sqlite3'), max_attempts=1,
+                         backoff=10, backoff_max=60, lease_seconds=3600)
+        queue.enqueue('m1', 'ocr', 'm1.txt')
+        stale_job, = queue.claim('ocr', 1, 1)
+        # the images are uploaded again while the first job runs
+        queue.enqueue('m1', 'ocr', 'm1.txt')
+        current_job, = queue.claim('ocr', 1, 1)
+
+        with mock.patch.object(Config, 'IMAGE_FOLDER', image_dir), \
+                mock.patch.object(Config, 'EXTRACTED_TEXT', text_dir), \
+                mock.patch('patient_data.ocr_service.get_job_queue', return_value=queue), \
+                mock.patch('patient_data.ocr_service.get_ocr_client') as get_client:
+            get_client.return_value.extract_text.return_value = 'new upload\n'
+            run_ocr_job('m1.txt', current_job['claim_token'])
+            get_client.return_value.extract_text.return_value = 'old upload\n'
+            run_ocr_job('m1.txt', stale_job['claim_token'])
+
+        with open(os.path.join(text_dir, 'm1.txt')) as f:
+            self.assertEqual(f.read(), 'new upload\n')
+        self.assertEqual(os.listdir(text_dir), ['m1.txt'])
+
+    def test_wrong_authkey_is_rejected(self):
+        client = OCRClient(self.address, b'wrong', timeout=10, autostart=False, start_timeout=0)
+        with self.assertRaises(Exception):
+            client.extract_pages(['p-01.png'])
+        self.assertEqual(self.client.extract_pages(['ok.png']), ['ok.png'])
+
+    def test_socket_is_private_to_the_owner(self):
+        self.assertEqual(os.stat(self.address).st_mode & 0o777, 0o600)
+
+    def test_service_stops_and_removes_socket(self):
+        self.service.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.address))
+        with self.assertRaises(OCRServiceError):
+            self.client.extract_pages(['p-01.png'])
+
+
+class TestOCRServiceAuthkey(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.key_path = os.path.join(self.tmp_dir, 'cache', 'ocr_service.key')
+        patcher = mock.patch('config.OCR_SERVICE_AUTHKEY', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_random_key_is_created_once_with_owner_only_access(self):
+        key = ocr_service.get_ocr_service_authkey(self.key_path)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(os.stat(self.key_path).st_mode & 0o777, 0o600)
+        self.assertEqual(ocr_service.get_ocr_service_authkey(self.key_path), key)
+        self.assertEqual(os.listdir(os.path.dirname(self.key_path)), ['ocr_service.key'])
+        other_path = os.path.join(self.tmp_dir, 'other.key')
+        self.assertNotEqual(ocr_service.get_ocr_service_authkey(other_path), key)
+
+    def test_readable_key_file_is_refused(self):
+        ocr_service.get_ocr_service_authkey(self.key_path)
+        os.chmod(self.key_path, 0o644)
+        with self.assertRaises(PermissionError):
+            ocr_service.get_ocr_service_authkey(self.key_path)
+
+    def test_key_from_the_environment(self):
+        with mock.patch('config.OCR_SERVICE_AUTHKEY', 'from-env'):
+            self.assertEqual(ocr_service.get_ocr_service_authkey(self.key_path), b'from-env')
+        self.assertFalse(os.path.exists(self.key_path))
+
+
+class TestOCRBackend(unittest.TestCase):
+
+    def test_backend_without_extract_cannot_be_created(self):
+        class IncompleteBackend(ocr_service.OCRBackend):
+            name = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+
+class TestMockOCRBackend(unittest.TestCase):
+
+    def test_sample_report_per_page(self):
+        texts = MockOCRBackend().extract(['p-01.png', 'p-02.png'])
+        self.assertEqual(len(texts), 2)
+        self.assertTrue(texts[0].startswith('ARFRP1 R177H'))
+        self.assertEqual(texts[0], texts[1])
+
+
+class FakePytesseract:
+
+    @staticmethod
+    def image_to_string(image, config=''):
+        return f"{image.mode} {image.width}x{image.height}\n"
+
+    @staticmethod
+    def get_tesseract_version():
+        return '5.3.0'
+
+
+class TestTesseractOCRBackend(unittest.TestCase):
+
+    def test_pages_are_preprocessed_and_read_in_order(self):
+        from PIL import Image
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for index, size in enumerate(((300, 200), (200, 1000)), 1):
+                paths.append(os.path.join(tmp_dir, f'p-{index:02d}.png'))
+                Image.new('RGB', size, 'black').save(paths[-1])
+            with mock.patch.object(pytesseract_text_extract, 'TESSERACT_AVAILABLE', True), \
+                    mock.patch.object(pytesseract_text_extract, 'pytesseract', FakePytesseract, create=True):
+                texts = TesseractOCRBackend(workers=1).extract(paths)
+                with self.assertRaises(FileNotFoundError):
+                    TesseractOCRBackend(workers=1).extract([os.path.join(tmp_dir, 'missing.png')])
+            # the tall page is read as tiles, joined in order
+            self.assertEqual(texts, ['L 300x200', 'L 200x333\nL 200x333\nL 200x334'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_unavailable_without_tesseract(self):
+        with mock.patch.object(pytesseract_text_extract, 'TESSERACT_AVAILABLE', False):
+            with self.assertRaises(RuntimeError):
+                TesseractOCRBackend()
+
+
+class TestCachedOCRBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.backend = PageNameBackend()
+        self.backend.version = 'test 1'
+        cache = OCRResultCache(os.path.join(self.tmp_dir, 'ocr_cache.sqlite3'), 'test 1', 100, 10 ** 6)
+        self.cached = CachedOCRBackend(self.backend, cache)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_identical_images_are_read_once(self):
+        first = [self.write('m1-01.png', b'page one'), self.write('m1-02.png', b'page two')]
+        self.assertEqual(self.cached.extract(first), ['m1-01.png', 'm1-02.png'])
+
+        # re-upload under new names with one changed page: only that page is read
+        second = [self.write('m2-01.png', b'page one'), self.write('m2-02.png', b'page 2 corrected'),
+                  self.write('m2-03.png', b'page 2 corrected')]
+        self.assertEqual(self.cached.extract(second), ['m1-01.png', 'm2-02.png', 'm2-02.png'])
+        self.assertEqual([[os.path.basename(path) for path in call] for call in self.backend.calls],
+                         [['m1-01.png', 'm1-02.png'], ['m2-02.png']])
+
+        self.assertEqual(self.cached.extract(first[:1]), ['m1-01.png'])
+        self.assertEqual(len(self.backend.calls), 2)
+
+    def test_missing_image_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.cached.extract([os.path.join(self.tmp_dir, 'missing.png')])
+
+
+class TestCreateOCRBackend(unittest.TestCase):
+
+    def create(self, use_gpu, cuda, available):
+        def engine(name):
+            def create(*args):
+                if name not in available:
+                    raise RuntimeError(f'{name} is not installed')
+                return (name, args)
+            return create
+
+        with mock.patch.object(Config, 'USE_GPU', use_gpu), \
+                mock.patch.object(ocr_service, '_cuda_available', return_value=cuda), \
+                mock.patch.object(ocr_service, 'SuryaOCRBackend', side_effect=engine('surya')), \
+                mock.patch.object(ocr_service, 'TesseractOCRBackend', side_effect=engine('tesseract')):
+            backend = create_ocr_backend('auto')
+        return backend if isinstance(backend, MockOCRBackend) else (backend[0], backend[1][0])
+
+    def test_auto_detection(self):
+        both = ('surya', 'tesseract')
+        self.assertEqual(self.create(True, True, both), ('surya', True))
+        self.assertEqual(self.create(False, True, both), ('tesseract', ocr_service.config.OCR_CPU_WORKERS))
+        self.assertEqual(self.create(True, False, both)[0], 'tesseract')
+        self.assertEqual(self.create(True, False, ('surya',)), ('surya', False))
+        self.assertIsInstance(self.create(True, True, ()), MockOCRBackend)
+
+    def test_named_backends(self):
+        self.assertIsInstance(create_ocr_backend('mock'), MockOCRBackend)
+        with mock.patch.object(pytesseract_text_extract, 'TESSERACT_AVAILABLE', False):
+            with self.assertRaises(RuntimeError):
+                create_ocr_backend('tesseract')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
 import unittest
 from pprint import pprint
+from unittest import mock
+
+import config
 
 from utils.oncotree import (
     _get_level_columns,
@@ -11,6 +17,8 @@ from utils.oncotree import (
     resolve_diagnosis_hierarchy,
     build_diagnosis_result_from_path,
     canonicalize_term,
+    get_oncotree_index,
+    OncoTreeIndex,
 )
 
 
@@ -84,6 +92,38 @@ class TestOncotree(unittest.TestCase):
         self.assertEqual(canonicalize_term("breast", {"Breast", "Lung"}), "Breast")
         self.assertIsNone(canonicalize_term("Unknown", {"Breast", "Lung"}))
 
+    def test_oncotree_index_is_shared(self):
+        self.assertIs(get_oncotree_index(), get_oncotree_index())
+
+    def test_oncotree_index_lookups(self):
+        index = get_oncotree_index()
+        self.assertIsInstance(index, OncoTreeIndex)
+        self.assertIn("Adult-Type Diffuse Glioma", index.get_children("diffuse glioma"))
+        self.assertEqual(
+            index.get_path("Glioblastoma, IDH-Wildtype"),
+            ["CNS/Brain", "Diffuse Glioma", "Adult-Type Diffuse Glioma", "Glioblastoma, IDH-Wildtype"],
+        )
+        self.assertIsNone(index.get_path("Unknown"))
+
+    def test_oncotree_index_reloads_on_mtime_change(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        tmp_file = os.path.join(tmp_dir, "oncotree_file.txt")
+        shutil.copy(config.ONCOTREE_TXT_FILE_PATH, tmp_file)
+
+        with mock.patch.object(config, "ONCOTREE_TXT_FILE_PATH", tmp_file):
+            first = get_oncotree_index()
+            self.assertIs(first, get_oncotree_index())
+
+            with open(tmp_file, "a") as f:
+                f.write("Test Tissue (TEST)\tTest Child (TC)\t\t\t\t\t\t\t\t\t\n")
+            stat = os.stat(tmp_file)
+            os.utime(tmp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+            second = get_oncotree_index()
+            self.assertIsNot(first, second)
+            self.assertEqual(get_children_of_term("Test Tissue"), ["Test Child"])
+
 
 if __name__ == "__main__":
     unittest.main()
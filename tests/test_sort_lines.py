@@ -0,0 +1,76 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from patient_data.surya_ocr_text_extract import sort_lines, get_mock_response, clean_html_tags
+
+
+def reference_sort_lines(lines, tolerance=10.0):
+    """The original linear-scan grouping, kept to check that sort_lines gives the same text"""
+    vertical_groups = []
+    for line in lines:
+        min_y = line.bbox[1]
+        for group in vertical_groups:
+            if abs(min_y - group[0]) <= tolerance:
+                group.append(line)
+                break
+        else:
+            vertical_groups.append([min_y, line])
+
+    sorted_text = []
+    for group in sorted(vertical_groups, key=lambda group: group[0]):
+        group_lines = sorted(group[1:], key=lambda x: x.bbox[0])
+        sorted_text.append(' '.join(line.text for line in group_lines))
+        sorted_text.append("\n")
+    return ''.join(sorted_text).strip()
+
+
+def make_page(rows: int, boxes_per_row: int, seed: int = 0, jitter: float = 6.0, row_height: float = 14.0) -> list:
+    """Text boxes laid out in rows with some vertical jitter, in shuffled (detector-like) order"""
+    rng = random.Random(seed)
+    lines = []
+    for row in range(rows):
+        for column in range(boxes_per_row):
+            x = column * 80 + rng.uniform(0, 20)
+            y = row * row_height + rng.uniform(0, jitter)
+            lines.append(SimpleNamespace(bbox=[x, y, x + 60, y + 12], text=f"r{row}c{column}"))
+    rng.shuffle(lines)
+    return lines
+
+
+class TestSortLines(unittest.TestCase):
+
+    def test_report_boxes_are_joined_into_lines(self):
+        report_lines = [line for line in clean_html_tags(get_mock_response()).split('\n')]
+        boxes = []
+        for row, text in enumerate(report_lines):
+            for column, word in enumerate(text.split(' ')):
+                boxes.append(SimpleNamespace(bbox=[column * 50, row * 20 + column % 3, column * 50 + 40, row * 20 + 15], text=word))
+        random.Random(1).shuffle(boxes)
+        self.assertEqual(sort_lines(boxes), '\n'.join(report_lines))
+
+    def test_matches_original_grouping(self):
+        for seed in range(50):
+            rng = random.Random(seed)
+            lines = make_page(rng.randint(1, 40), rng.randint(1, 8), seed,
+                              jitter=rng.choice([0, 5, 12, 25]), row_height=rng.choice([8, 14, 30]))
+            for tolerance in (0.0, 5.0, 10.0):
+                with self.subTest(seed=seed, tolerance=tolerance):
+                    self.assertEqual(sort_lines(lines, tolerance), reference_sort_lines(lines, tolerance))
+
+    def test_ties_keep_detection_order(self):
+        lines = [
+            SimpleNamespace(bbox=[10, 0, 20, 10], text='b'),
+            SimpleNamespace(bbox=[10, 4, 20, 14], text='a'),
+            SimpleNamespace(bbox=[0, 30, 5, 40], text='c'),
+        ]
+        self.assertEqual(sort_lines(lines), 'b a\nc')
+        self.assertEqual(sort_lines(lines), reference_sort_lines(lines))
+
+    def test_dict_boxes_and_empty_page(self):
+        self.assertEqual(sort_lines([{'bbox': [5, 0, 9, 9], 'text': 'y'}, {'bbox': [0, 2, 4, 9], 'text': 'x'}]), 'x y')
+        self.assertEqual(sort_lines([]), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from utils.sqlite_store import SQLiteStore, process_alive
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY);"
+
+
+class RowStore(SQLiteStore):
+    row_factory = sqlite3.Row
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, "nested", "store.sqlite3")
+
+    def test_schema_and_wal_mode(self):
+        store = SQLiteStore(self.db_path, _SCHEMA)
+        conn = store._connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 0)
+        self.assertIsInstance(RowStore(self.db_path, _SCHEMA)._connection().execute("SELECT 1 AS one").fetchone(),
+                              sqlite3.Row)
+
+    def test_transaction_commits_or_rolls_back(self):
+        store = SQLiteStore(self.db_path, _SCHEMA)
+        with store._transaction() as conn:
+            conn.execute("INSERT INTO items VALUES ('a')")
+        with self.assertRaises(ValueError):
+            with store._transaction() as conn:
+                conn.execute("INSERT INTO items VALUES ('b')")
+                raise ValueError
+        self.assertEqual(store._connection().execute("SELECT name FROM items").fetchall(), [("a",)])
+
+    def test_connection_per_thread_and_process(self):
+        store = SQLiteStore(self.db_path, _SCHEMA)
+        conn = store._connection()
+        self.assertIs(store._connection(), conn)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(store._connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+        # after a fork the child opens its own connection
+        with mock.patch("utils.sqlite_store.os.getpid", return_value=os.getpid() + 1):
+            self.assertIsNot(store._connection(), conn)
+
+    def test_process_alive(self):
+        self.assertTrue(process_alive(os.getpid()))
+        with mock.patch("utils.sqlite_store.os.kill", side_effect=ProcessLookupError):
+            self.assertFalse(process_alive(12345))
+
+
+if __name__ == "__main__":
+    unittest.main()
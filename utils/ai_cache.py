@@ -0,0 +1,164 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from loguru import logger
+import config
+from utils.sqlite_store import SQLiteStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def make_cache_key(req_body: dict) -> str:
+    """
+    Content address of an AI request: hash of the model, messages, temperature and max_tokens.
+    """
+    key_fields = {field: req_body.get(field) for field in ('model', 'messages', 'temperature', 'max_tokens')}
+    return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AIResponseCache(SQLiteStore):
+    """
+    SQLite-backed cache of AI responses, shared by every process using the same db file.
+    Entries expire after `ttl_seconds`; the least recently used ones are evicted beyond
+    `max_entries` rows or `max_bytes` of stored responses. Entries of other models are
+    dropped when the cache is opened.
+    """
+
+    def __init__(self, db_path: str, model: str, ttl_seconds: float, max_entries: int, max_bytes: int):
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        super().__init__(db_path, _SCHEMA)
+        with self._transaction() as conn:
+            removed = conn.execute("DELETE FROM responses WHERE model != ?", (model,)).rowcount
+        if removed:
+            logger.info(f"AI cache | Invalidated {removed} entries from previous models")
+
+    def get(self, key: str):
+        """Return the cached response for key, or None on a miss"""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT response FROM responses WHERE key = ? AND model = ? AND created_at >= ?",
+                    (key, self.model, now - self.ttl_seconds),
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._increment(conn, 'hits' if row else 'misses')
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache | Lookup failed, treating as miss: {e}")
+            row = None
+
+        if row:
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response) -> None:
+        """Store a response and evict expired / least recently used entries"""
+        now = time.time()
+        payload = json.dumps(response)
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, self.model, payload, len(payload), now, now),
+                )
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                evicted = conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM ("
+                    "  SELECT key,"
+                    "   ROW_NUMBER() OVER (ORDER BY accessed_at DESC) AS position,"
+                    "   SUM(size) OVER (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING) AS running_size"
+                    "  FROM responses)"
+                    " WHERE position > ? OR running_size > ?)",
+                    (self.max_entries, self.max_bytes),
+                ).rowcount
+                if evicted:
+                    self._increment(conn, 'evictions', evicted)
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache | Failed to store response: {e}")
+
+    @staticmethod
+    def _increment(conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute(
+            "INSERT INTO metrics (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and for all processes sharing the db file"""
+        conn = self._connection()
+        shared = dict(conn.execute("SELECT name, value FROM metrics").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            'process': {'hits': self.hits, 'misses': self.misses},
+            'shared': {
+                'hits': shared.get('hits', 0),
+                'misses': shared.get('misses', 0),
+                'evictions': shared.get('evictions', 0),
+            },
+            'entries': entries,
+            'size_bytes': size,
+            'model': self.model,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_cache():
+    """
+    Return the process-wide AIResponseCache, or None when caching is disabled.
+    The cache is reopened (dropping stale entries) if config.LLM_AI_MODEL changes.
+    """
+    global _cache
+    if not config.AI_CACHE_ENABLED:
+        return None
+    cache = _cache
+    if cache is not None and cache.model == config.LLM_AI_MODEL and cache.db_path == config.AI_CACHE_PATH:
+        return cache
+    with _cache_lock:
+        if _cache is None or _cache.model != config.LLM_AI_MODEL or _cache.db_path != config.AI_CACHE_PATH:
+            try:
+                _cache = AIResponseCache(
+                    config.AI_CACHE_PATH,
+                    config.LLM_AI_MODEL,
+                    config.AI_CACHE_TTL_SECONDS,
+                    config.AI_CACHE_MAX_ENTRIES,
+                    config.AI_CACHE_MAX_BYTES,
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"AI cache | Unable to open {config.AI_CACHE_PATH}, caching disabled: {e}")
+                return None
+        return _cache
@@ -0,0 +1,208 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import time
+import random
+import threading
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+import config
+
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without contacting the AI service while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout`
+    seconds. After that one trial request is let through: success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_request(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError("AI service circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"AI circuit breaker opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class AIClient:
+    """
+    Keep-alive HTTP client for the AI service: pooled connections, bounded connect/read
+    timeouts, jittered exponential retries on 5xx and connection errors, and a circuit breaker.
+    At most `max_concurrent` requests per process are in flight towards the GPU server; a request
+    waiting to retry does not count.
+    """
+
+    def __init__(self, connect_timeout: float, read_timeout: float, pool_maxsize: int,
+                 max_retries: int, backoff: float, backoff_max: float,
+                 failure_threshold: int, reset_timeout: float, max_concurrent: int = 4):
+        self.timeout = (connect_timeout, read_timeout)
+        self._concurrency = threading.BoundedSemaphore(max_concurrent)
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        # requests.Session is not thread-safe, and its sockets must not be shared across a fork
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            self._local.pid = os.getpid()
+        return session
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """
+        POST with retries. Returns the last response (possibly a 5xx once retries are exhausted)
+        or raises the last connection error / timeout.
+        """
+        response = self._post_with_retries(url, **kwargs)
+        self._concurrency.release()
+        return response
+
+    @contextmanager
+    def stream(self, url: str, **kwargs):
+        """
+        Streaming POST. The concurrency slot is held until the caller stops reading; leaving
+        the block closes the connection, which makes the server abort the generation.
+        """
+        response = self._post_with_retries(url, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+            self._concurrency.release()
+
+    def _post_with_retries(self, url: str, **kwargs) -> requests.Response:
+        """
+        Each attempt takes a concurrency slot, which is released before backing off, so a failing
+        request does not keep other callers waiting. The slot of the returned response is still
+        held: the caller releases it.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_request()
+            self._concurrency.acquire()
+            keep_slot = False
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.exceptions.ReadTimeout:
+                # the server accepted the request; retrying would only queue more work on it
+                self.circuit_breaker.record_failure()
+                raise
+            except requests.exceptions.ConnectionError as e:
+                self.circuit_breaker.record_failure()
+                last_error = e
+                logger.warning(f"AI request connection error (attempt {attempt + 1}/{self.max_retries + 1}): {e}")
+            except requests.exceptions.RequestException:
+                # e.g. ChunkedEncodingError, TooManyRedirects: not retried, but a half-open circuit
+                # must not be left waiting for a trial that already ended
+                self.circuit_breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.circuit_breaker.record_success()
+                    keep_slot = True
+                    return response
+                self.circuit_breaker.record_failure()
+                logger.warning(
+                    f"AI request returned {response.status_code} (attempt {attempt + 1}/{self.max_retries + 1})"
+                )
+                if attempt == self.max_retries:
+                    keep_slot = True
+                    return response
+                response.close()
+            finally:
+                if not keep_slot:
+                    self._concurrency.release()
+
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt)
+        raise last_error
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ai_client() -> AIClient:
+    """Return the process-wide AIClient configured from config.py"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AIClient(
+                    connect_timeout=config.AI_CONNECT_TIMEOUT,
+                    read_timeout=config.AI_READ_TIMEOUT,
+                    pool_maxsize=config.AI_POOL_MAXSIZE,
+                    max_retries=config.AI_MAX_RETRIES,
+                    backoff=config.AI_RETRY_BACKOFF,
+                    backoff_max=config.AI_RETRY_BACKOFF_MAX,
+                    failure_threshold=config.AI_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=config.AI_CIRCUIT_RESET_TIMEOUT,
+                    max_concurrent=config.AI_MAX_CONCURRENT_REQUESTS,
+                )
+    return _client
+
+
+def use_shared_concurrency_limit(semaphore) -> None:
+    """
+    Take this process's AI request slots from `semaphore` (e.g. a multiprocessing.BoundedSemaphore
+    handed to the workers of a batch job), so that the limit holds across processes
+    """
+    get_ai_client()._concurrency = semaphore
@@ -2,7 +2,17 @@ import json
 import config
 import requests
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, Future
 from loguru import logger
+from utils.ai_cache import get_ai_cache, make_cache_key
+from utils.ai_client import get_ai_client
+
+# Runs independent AI calls side by side; AIClient caps how many reach the GPU server at once
+_ai_executor = ThreadPoolExecutor(max_workers=config.AI_MAX_CONCURRENT_REQUESTS, thread_name_prefix='ai')
+
+def submit_ai_call(fn, *args, **kwargs) -> Future:
+    """Start an AI-bound call (e.g. get_additional_info) without blocking the caller"""
+    return _ai_executor.submit(fn, *args, **kwargs)
 
 def get_patient_genomic_criteria(id:str, genomic_data: str) -> dict:    
     prompt = get_ai_prompt_for_patient_genomic_criteria(genomic_data)        
@@ -41,6 +51,13 @@ def parse_ai_response(ai_response):
         logger.error(f"Unexpected response format: {ex=}, {type(ex)=}")
     return oncotree_diagnoses_dict
 
+def _is_cacheable(ai_response) -> bool:
+    # empty, truncated or non-JSON generations are not replayed to later identical prompts
+    try:
+        return bool(parse_ai_response(ai_response))
+    except Exception:
+        return False
+
 def send_ai_request(id, prompt):
     req_body = {
         "model": config.LLM_AI_MODEL,
@@ -55,19 +72,34 @@ def send_ai_request(id, prompt):
         "response_format": {
             "type": "json_object"
         },
-        "stream": False
+        "stream": config.AI_STREAM_RESPONSES
     }
+    cache = get_ai_cache()
+    cache_key = make_cache_key(req_body)
+    if cache is not None:
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            logger.debug(f"AI response (cached) | ID:{id} | key:{cache_key[:12]}")
+            return cached_response
+
     req_body_json = json.dumps(req_body)
     logger.debug(f"AI request | ID:{id} | {req_body_json}")
     endpoint_url = f'{urllib.parse.urljoin(f"{config.GPU_SERVER_HOSTNAME}:{config.AI_PORT}", config.CHAT_ENDPOINT)}'
-    print(endpoint_url)
 
     try:
-        response = requests.post(endpoint_url, data=req_body_json, headers={"Content-Type": "application/json"})
-        response.raise_for_status()
-        print(response.status_code)
-        ai_response = response.json()
+        if config.AI_STREAM_RESPONSES:
+            with get_ai_client().stream(endpoint_url, data=req_body_json, headers={"Content-Type": "application/json"}) as response:
+                response.raise_for_status()
+                logger.debug(f"AI response status | ID:{id} | {endpoint_url} | {response.status_code} (streamed)")
+                ai_response = read_streamed_response(id, response)
+        else:
+            response = get_ai_client().post(endpoint_url, data=req_body_json, headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+            logger.debug(f"AI response status | ID:{id} | {endpoint_url} | {response.status_code}")
+            ai_response = response.json()
         logger.debug(f"AI response | ID:{id} | {ai_response}")
+        if cache is not None and _is_cacheable(ai_response):
+            cache.put(cache_key, ai_response)
         return ai_response
     except requests.exceptions.ConnectionError:
         logger.error(f"Connection error while making AI request | ID:{id}")
@@ -76,6 +108,123 @@ def send_ai_request(id, prompt):
         logger.error(f"Request error while making AI request | ID:{id} | Error: {str(e)}")
         return {"error": "request_error", "message": f"Error communicating with AI service: {str(e)}"}
 
+class JSONStreamExtractor:
+    """
+    Incrementally scans streamed model output for the first complete JSON object/array
+    after the ```json fence or the </think> boundary (or at the very start when the model
+    answers with JSON directly).
+    """
+
+    def __init__(self):
+        self.content = ''
+        self._search_from = 0
+        self._start = None
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str):
+        """Append a chunk; return the JSON text once a complete value has been parsed, else None"""
+        self.content += text
+        while True:
+            if self._start is None and not self._locate_start():
+                return None
+            json_text = self._scan()
+            if json_text is None:
+                return None
+            try:
+                json.loads(json_text)
+                return json_text
+            except json.JSONDecodeError:
+                # not valid JSON after all (e.g. a bracket in prose); look for the next candidate
+                self._search_from = self._start + 1
+                self._start = None
+
+    def _locate_start(self) -> bool:
+        content = self.content
+        think_end = content.find('</think>')
+        if think_end == -1 and '<think>' in content:
+            return False
+        base = think_end + len('</think>') if think_end > -1 else 0
+        fence = content.find('```json', base)
+        if fence > -1:
+            search_from = fence + len('```json')
+        elif think_end > -1 or content[base:].lstrip()[:1] in ('{', '['):
+            search_from = base
+        else:
+            return False
+        search_from = max(search_from, self._search_from)
+
+        positions = [pos for pos in (content.find('{', search_from), content.find('[', search_from)) if pos > -1]
+        if not positions:
+            return False
+        self._start = self._pos = min(positions)
+        self._depth = 0
+        self._in_string = self._escape = False
+        return True
+
+    def _scan(self):
+        content = self.content
+        for index in range(self._pos, len(content)):
+            char = content[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos = index + 1
+                    return content[self._start:index + 1]
+        self._pos = len(content)
+        return None
+
+def read_streamed_response(id, response) -> dict:
+    """
+    Consume an SSE chat completion stream and stop as soon as a complete JSON value is available.
+    Returns a dict shaped like a non-streaming chat completion so parse_ai_response works unchanged.
+    """
+    extractor = JSONStreamExtractor()
+    finish_reason = None
+    content = None
+    for line in response.iter_lines():
+        if not line or not line.startswith(b'data:'):
+            continue
+        data = line[len(b'data:'):].strip()
+        if data == b'[DONE]':
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"AI stream | ID:{id} | Skipping malformed chunk: {data[:200]}")
+            continue
+        choices = chunk.get('choices') or []
+        if not choices:
+            continue
+        finish_reason = choices[0].get('finish_reason') or finish_reason
+        json_text = extractor.feed(safe_get(choices[0], ['delta', 'content']) or '')
+        if json_text is not None:
+            logger.debug(f"AI stream | ID:{id} | Complete JSON after {len(extractor.content)} chars, closing stream")
+            content = f"```json\n{json_text}\n```"
+            finish_reason = 'stop_early'
+            break
+
+    return {
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": extractor.content if content is None else content},
+            "finish_reason": finish_reason,
+        }]
+    }
+
 def get_ai_prompt_for_patient_genomic_criteria(genomic_data):
     prompt = f"""Task: Convert the following text about genomic report of a patient sample into JSON format as described below:
     Text: {genomic_data}
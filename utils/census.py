@@ -1,21 +1,69 @@
-import pandas as pd
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
 import re
+import csv
+import json
+import hashlib
+from loguru import logger
+import config
 
-def load_gene_to_ref_seq_mapping():
-    df = pd.read_csv('./ref/census_gene_list.csv')
-    subset = df[['Gene Symbol', 'Synonyms']]
-
-    gene_to_ref_seq_id_mapping = {}
-    for index, row in subset.iterrows():
-        synonyms = row['Synonyms']
-        if isinstance(synonyms, str):
-            synonyms = synonyms.split(',')
-        else:
-            synonyms = []
-        nm_pattern = re.compile(r'NM_\d+\.\d+')
-        nm_matches = [s.strip() for s in synonyms if nm_pattern.match(s.strip())]
-        if nm_matches:
-            ref_seq_id = nm_matches[0]
-            gene_to_ref_seq_id_mapping[row['Gene Symbol']] = ref_seq_id
-    return gene_to_ref_seq_id_mapping
+nm_pattern = re.compile(r'NM_\d+(?:\.\d+)?')
+
+def _parse_census_csv(file_path):
+    gene_to_ref_seq_ids = {}
+    with open(file_path, newline='') as f:
+        for row in csv.DictReader(f):
+            synonyms = (s.strip() for s in (row['Synonyms'] or '').split(','))
+            nm_matches = [s for s in synonyms if nm_pattern.fullmatch(s)]
+            if nm_matches:
+                gene_to_ref_seq_ids[row['Gene Symbol']] = nm_matches
+    return gene_to_ref_seq_ids
+
+def _load_cached(cache_path, csv_hash):
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('csv_sha256') != csv_hash:
+        return None
+    return cached['gene_to_ref_seq_ids']
 
+def _write_cache(cache_path, csv_hash, gene_to_ref_seq_ids):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'csv_sha256': csv_hash, 'gene_to_ref_seq_ids': gene_to_ref_seq_ids}, f, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Unable to write census cache {cache_path}: {e}")
+
+def load_census_ref_seq_index(file_path=None, cache_path=None):
+    """
+    Returns (gene -> all NM_ accessions listed in its census synonyms,
+             unversioned NM_ accession -> gene). The first gene listing an accession wins.
+    The parsed gene -> accessions mapping is cached in a JSON file keyed on the CSV's SHA-256.
+    """
+    file_path = file_path or config.CENSUS_GENE_LIST_FILE_PATH
+    cache_path = cache_path or config.CENSUS_CACHE_PATH
+    with open(file_path, 'rb') as f:
+        csv_hash = hashlib.sha256(f.read()).hexdigest()
+
+    gene_to_ref_seq_ids = _load_cached(cache_path, csv_hash)
+    if gene_to_ref_seq_ids is None:
+        gene_to_ref_seq_ids = _parse_census_csv(file_path)
+        _write_cache(cache_path, csv_hash, gene_to_ref_seq_ids)
+
+    ref_seq_to_gene = {}
+    for gene, ref_seq_ids in gene_to_ref_seq_ids.items():
+        for ref_seq_id in ref_seq_ids:
+            ref_seq_to_gene.setdefault(ref_seq_id.split('.')[0], gene)
+    return gene_to_ref_seq_ids, ref_seq_to_gene
+
+def load_gene_to_ref_seq_mapping():
+    gene_to_ref_seq_ids, _ = load_census_ref_seq_index()
+    return {gene: ref_seq_ids[0] for gene, ref_seq_ids in gene_to_ref_seq_ids.items()}
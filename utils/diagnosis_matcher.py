@@ -0,0 +1,233 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import re
+import glob
+import json
+import threading
+from collections import Counter, defaultdict
+
+from loguru import logger
+import config
+import utils.oncotree as onct
+
+_STOPWORDS = {'of', 'the', 'and', 'with', 'in', 'nos'}
+
+# Alias source -> weight applied to its similarity score.
+# metamaintype aliases point at a broader node than the text names, so they never score a perfect 1.0
+ALIAS_WEIGHTS = {
+    'term': 1.0,
+    'code': 1.0,
+    'reviewed': 1.0,
+    'metamaintype': 0.9,
+}
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def _tokens(normalized):
+    return frozenset(token for token in normalized.split() if token not in _STOPWORDS)
+
+
+def _trigrams(normalized):
+    padded = f'  {normalized} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _common_prefix(paths):
+    prefix = list(paths[0])
+    for path in paths[1:]:
+        length = 0
+        while length < min(len(prefix), len(path)) and prefix[length] == path[length]:
+            length += 1
+        prefix = prefix[:length]
+    return prefix
+
+
+def load_reviewed_diagnoses(reviewed_dir=None):
+    """
+    Yield (diagnosis name, OncoTree diagnosis) pairs recorded in the reviewed clinical JSONs.
+    """
+    reviewed_dir = reviewed_dir or config.REVIEWED_CLINICAL_DIR
+    for file_path in sorted(glob.glob(os.path.join(reviewed_dir, '*.json'))):
+        try:
+            with open(file_path) as f:
+                clinical_data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Skipping reviewed clinical file {file_path}: {e}")
+            continue
+        name = clinical_data.get('ONCOTREE_PRIMARY_DIAGNOSIS_NAME')
+        diagnosis = clinical_data.get('ONCOTREE_PRIMARY_DIAGNOSIS')
+        if name and diagnosis:
+            yield name, diagnosis
+
+
+class DiagnosisMatcher:
+    """
+    Trigram/token index over OncoTree term names, OncoTree codes, the metamaintype column
+    and diagnoses mined from the reviewed corpus.
+    """
+
+    def __init__(self, index, reviewed_diagnoses=()):
+        self.index = index
+        self.priors = Counter()
+        self._codes = {}
+        self._aliases = []
+        self._postings = defaultdict(list)
+
+        for path in index.term_paths.values():
+            self._add_alias(path[-1], path[-1], 'term')
+
+        for code, term in index.codes.items():
+            self._codes.setdefault(_normalize(code), term)
+
+        for metamaintype, paths in index.metamaintypes.items():
+            common_path = _common_prefix(paths)
+            if common_path:
+                self._add_alias(metamaintype, common_path[-1], 'metamaintype')
+
+        for name, diagnosis in reviewed_diagnoses:
+            path = index.get_path(diagnosis)
+            if not path:
+                continue
+            self.priors[path[-1]] += 1
+            if _normalize(name) != _normalize(diagnosis):
+                self._add_alias(name, path[-1], 'reviewed')
+
+    def _add_alias(self, alias, term, source):
+        normalized = _normalize(alias)
+        if not normalized:
+            return
+        alias_id = len(self._aliases)
+        trigrams = _trigrams(normalized)
+        self._aliases.append((trigrams, _tokens(normalized), term, source))
+        for trigram in trigrams:
+            self._postings[trigram].append(alias_id)
+
+    def _build_match(self, term, score, source):
+        return {
+            'term': term,
+            'path': self.index.get_path(term),
+            'score': round(score, 4),
+            'source': source,
+        }
+
+    def match(self, text, limit=5):
+        """
+        Rank OncoTree terms for a free-text diagnosis.
+        Returns up to `limit` candidates, best first, each with its score in [0, 1].
+        """
+        normalized = _normalize(text or '')
+        if not normalized:
+            return []
+
+        code_term = self._codes.get(normalized)
+        if code_term:
+            return [self._build_match(code_term, ALIAS_WEIGHTS['code'], 'code')]
+
+        query_trigrams = _trigrams(normalized)
+        query_tokens = _tokens(normalized)
+
+        shared = Counter()
+        for trigram in query_trigrams:
+            for alias_id in self._postings.get(trigram, ()):
+                shared[alias_id] += 1
+
+        best_by_term = {}
+        for alias_id, shared_count in shared.items():
+            trigrams, tokens, term, source = self._aliases[alias_id]
+            score = 2 * shared_count / (len(query_trigrams) + len(trigrams))
+            if query_tokens and tokens:
+                score = max(score, len(query_tokens & tokens) / len(query_tokens | tokens))
+            score *= ALIAS_WEIGHTS[source]
+            if term not in best_by_term or score > best_by_term[term][0]:
+                best_by_term[term] = (score, source)
+
+        ranked = sorted(
+            best_by_term.items(),
+            key=lambda item: (item[1][0], self.priors[item[0]]),
+            reverse=True,
+        )
+        return [self._build_match(term, score, source) for term, (score, source) in ranked[:limit]]
+
+    def best_match(self, text):
+        candidates = self.match(text, limit=1)
+        return candidates[0] if candidates else None
+
+    def confident_match(self, text, threshold, margin):
+        """
+        Return the best candidate when it can be accepted without the AI, or None: its score must
+        reach `threshold`, it must name a level-2+ term, and it must beat the next candidate on
+        another branch of the tree by at least `margin`.
+        """
+        candidates = self.match(text, limit=20)
+        if not candidates:
+            return None
+        best = candidates[0]
+        if best['score'] < threshold or len(best['path']) < 2:
+            return None
+        for candidate in candidates[1:]:
+            # an ancestor or descendant of the best term does not compete with it
+            if _common_prefix([candidate['path'], best['path']]) in (candidate['path'], best['path']):
+                continue
+            if best['score'] - candidate['score'] < margin:
+                return None
+            break
+        return best
+
+    def match_level1(self, text, threshold, margin=0.1):
+        """
+        Return the level-1 term implied by the best candidates, or None when it is ambiguous
+        (top score below `threshold`, or another level-1 term within `margin` of it).
+        """
+        best_by_level1 = {}
+        for candidate in self.match(text, limit=20):
+            level1 = candidate['path'][0]
+            best_by_level1[level1] = max(best_by_level1.get(level1, 0), candidate['score'])
+
+        if not best_by_level1:
+            return None
+        ranked = sorted(best_by_level1.items(), key=lambda item: item[1], reverse=True)
+        level1, score = ranked[0]
+        if score < threshold:
+            return None
+        if len(ranked) > 1 and score - ranked[1][1] < margin:
+            return None
+        return level1
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+# How often each resolution path is taken in this process: exact / local / local_level1 / ai
+match_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_diagnosis_matcher():
+    """
+    Return the shared DiagnosisMatcher, rebuilt whenever the OncoTree index is reloaded.
+    """
+    global _matcher
+    index = onct.get_oncotree_index()
+    matcher = _matcher
+    if matcher is not None and matcher.index is index:
+        return matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher.index is not index:
+            _matcher = DiagnosisMatcher(index, load_reviewed_diagnoses())
+        return _matcher
+
+
+def record_match_path(path):
+    with _stats_lock:
+        match_stats[path] += 1
+
+
+def get_match_stats():
+    with _stats_lock:
+        return dict(match_stats)
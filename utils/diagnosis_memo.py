@@ -0,0 +1,105 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import json
+import time
+from typing import Callable, Optional
+from loguru import logger
+from utils.sqlite_store import SQLiteStore, process_alive
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS diagnoses (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    state TEXT NOT NULL,
+    owner_pid INTEGER,
+    result TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+_PENDING = 'pending'
+_DONE = 'done'
+
+
+def normalize_diagnosis(value: str) -> str:
+    """Memo key of a free-text diagnosis: case and whitespace do not matter"""
+    return ' '.join(value.split()).lower()
+
+
+class DiagnosisMemo(SQLiteStore):
+    """
+    SQLite-backed map of normalized free-text diagnosis -> OncoTree result, shared by every process
+    of a batch that opens the same db file. Each distinct diagnosis is resolved exactly once: the
+    first process to ask claims it, the others wait for its result. A claim whose process died, or
+    that is older than `claim_timeout` seconds (e.g. left by a crashed run whose PID was reused), is
+    taken over. Results of another `version` (OncoTree file, matcher settings) are dropped on open.
+    """
+
+    def __init__(self, db_path: str, version: str, poll_interval: float = 0.05, claim_timeout: float = 900):
+        self.version = version
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        super().__init__(db_path, _SCHEMA)
+
+        with self._transaction() as conn:
+            removed = conn.execute("DELETE FROM diagnoses WHERE version != ?", (version,)).rowcount
+        if removed:
+            logger.info(f"Diagnosis memo | Invalidated {removed} diagnoses of other OncoTree versions")
+
+    def _claim(self, key: str):
+        """(True, result) if the diagnosis is resolved, (False, None) once this process owns it"""
+        while True:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT state, owner_pid, result, updated_at FROM diagnoses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] == _DONE:
+                    return True, json.loads(row[2])
+                if row is None or not process_alive(row[1]) or time.time() - row[3] > self.claim_timeout:
+                    if row is not None:
+                        logger.warning(f"Diagnosis memo | Taking over the abandoned claim of {key!r} (pid {row[1]})")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO diagnoses (key, version, state, owner_pid, result, updated_at) "
+                        "VALUES (?, ?, ?, ?, NULL, ?)",
+                        (key, self.version, _PENDING, os.getpid(), time.time()),
+                    )
+                    return False, None
+            time.sleep(self.poll_interval)
+
+    def resolve(self, value: str, resolver: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """The memoized result of `resolver(value)`; exceptions are not memoized"""
+        key = normalize_diagnosis(value)
+        if key in self._results:
+            self.hits += 1
+            return self._results[key]
+
+        found, result = self._claim(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                result = resolver(value)
+            except BaseException:
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM diagnoses WHERE key = ? AND owner_pid = ?", (key, os.getpid()))
+                raise
+            with self._transaction() as conn:
+                conn.execute(
+                    "UPDATE diagnoses SET state = ?, result = ?, updated_at = ? WHERE key = ?",
+                    (_DONE, json.dumps(result), time.time(), key),
+                )
+        self._results[key] = result
+        return result
+
+    def stats(self) -> dict:
+        entries = self._connection().execute(
+            "SELECT COUNT(*) FROM diagnoses WHERE state = ?", (_DONE,)
+        ).fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'version': self.version}
@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import time
+import sqlite3
+from typing import Optional
+from loguru import logger
+from utils.sqlite_store import SQLiteStore, hash_file
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    content_hash TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    parser_version INTEGER NOT NULL,
+    clinical_path TEXT NOT NULL,
+    clinical_hash TEXT NOT NULL,
+    genomic_path TEXT NOT NULL,
+    genomic_hash TEXT NOT NULL,
+    processed_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, output_dir)
+);
+"""
+
+
+class IngestManifest(SQLiteStore):
+    """
+    SQLite record of the reports an ingest has already turned into JSON: for each report's content
+    hash and output directory, the parser version and the outputs it wrote (with their hashes).
+    """
+
+    def __init__(self, db_path: str, parser_version: int):
+        self.parser_version = parser_version
+        super().__init__(db_path, _SCHEMA)
+
+    def lookup(self, content_hash: str, output_dir: str) -> Optional[dict]:
+        """
+        The entry of a report processed by the current parser version, or None. 'intact' tells
+        whether its outputs are still on disk as it wrote them.
+        """
+        row = self._connection().execute(
+            "SELECT sample_id, parser_version, clinical_path, clinical_hash, genomic_path, genomic_hash "
+            "FROM reports WHERE content_hash = ? AND output_dir = ?",
+            (content_hash, os.path.abspath(output_dir)),
+        ).fetchone()
+        if row is None:
+            return None
+        sample_id, parser_version, clinical_path, clinical_hash, genomic_path, genomic_hash = row
+        if parser_version != self.parser_version:
+            return None
+        try:
+            intact = hash_file(clinical_path) == clinical_hash and hash_file(genomic_path) == genomic_hash
+        except OSError:
+            intact = False
+        return {'sample_id': sample_id, 'clinical_path': clinical_path, 'genomic_path': genomic_path, 'intact': intact}
+
+    def record(self, content_hash: str, output_dir: str, source_file: str, sample_id: str,
+               clinical_path: str, genomic_path: str) -> None:
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (content_hash, output_dir, source_file, sample_id, "
+                    "parser_version, clinical_path, clinical_hash, genomic_path, genomic_hash, processed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (content_hash, os.path.abspath(output_dir), source_file, sample_id, self.parser_version,
+                     os.path.abspath(clinical_path), hash_file(clinical_path),
+                     os.path.abspath(genomic_path), hash_file(genomic_path), time.time()),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Ingest manifest | Failed to record {source_file}: {e}")
@@ -0,0 +1,277 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import time
+import uuid
+import sqlite3
+import threading
+from loguru import logger
+import config
+from config import Config
+from utils.job_runner import get_job_runner
+from utils.sqlite_store import SQLiteStore, process_alive
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mmid TEXT NOT NULL,
+    job_type TEXT NOT NULL,
+    data_file TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    next_run_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    owner_pid INTEGER,
+    claim_token TEXT,
+    lease_expires_at REAL,
+    UNIQUE (mmid, job_type)
+);
+CREATE INDEX IF NOT EXISTS jobs_state_next_run_at ON jobs (state, next_run_at);
+"""
+
+JOB_FIELDS = ('mmid', 'job_type', 'state', 'attempts', 'error', 'created_at',
+              'started_at', 'finished_at', 'duration')
+
+
+class JobQueue(SQLiteStore):
+    """
+    SQLite-backed queue of OCR and conversion jobs (one row per MMID and job type), shared by all
+    web workers. States: queued -> running -> succeeded | failed. Failed attempts are retried
+    with exponential backoff up to `max_attempts`; running jobs whose owner process died or
+    whose lease expired are queued again.
+    """
+
+    row_factory = sqlite3.Row
+
+    def __init__(self, db_path: str, max_attempts: int, backoff: float, backoff_max: float, lease_seconds: float):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        super().__init__(db_path, _SCHEMA)
+
+    def enqueue(self, mmid: str, job_type: str, data_file: str) -> None:
+        """Queue a job; resubmitting an MMID queues its job again from scratch"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (mmid, job_type, data_file, state, created_at, next_run_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?) "
+                "ON CONFLICT (mmid, job_type) DO UPDATE SET data_file = excluded.data_file, state = 'queued', "
+                " attempts = 0, error = NULL, created_at = excluded.created_at, next_run_at = excluded.next_run_at, "
+                " started_at = NULL, finished_at = NULL, duration = NULL, owner_pid = NULL, claim_token = NULL, "
+                " lease_expires_at = NULL",
+                (mmid, job_type, data_file, now, now),
+            )
+
+    def _requeue_abandoned(self, conn: sqlite3.Connection, now: float) -> None:
+        for row in conn.execute("SELECT id, mmid, job_type, owner_pid, lease_expires_at FROM jobs WHERE state = 'running'").fetchall():
+            if row['lease_expires_at'] < now or not process_alive(row['owner_pid']):
+                logger.warning(f"Requeueing abandoned {row['job_type']} job for {row['mmid']}")
+                conn.execute(
+                    "UPDATE jobs SET state = 'queued', next_run_at = ?, owner_pid = NULL, claim_token = NULL "
+                    "WHERE id = ?",
+                    (now, row['id']),
+                )
+
+    def claim(self, job_type: str, limit: int, max_running: int) -> list:
+        """
+        Mark up to `limit` due jobs of `job_type` as running for this process, keeping at most
+        `max_running` of them running across all processes. Returns the claimed rows as dicts.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_abandoned(conn, now)
+            running = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'running' AND job_type = ?", (job_type,)
+            ).fetchone()[0]
+            limit = min(limit, max_running - running)
+            if limit <= 0:
+                return []
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' AND job_type = ? AND next_run_at <= ? "
+                "ORDER BY next_run_at, id LIMIT ?",
+                (job_type, now, limit),
+            ).fetchall()
+            claimed = []
+            for row in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET state = 'running', attempts = attempts + 1, started_at = ?, finished_at = NULL, "
+                    "owner_pid = ?, claim_token = ?, lease_expires_at = ? WHERE id = ?",
+                    (now, os.getpid(), token, now + self.lease_seconds, row['id']),
+                )
+                claimed.append(dict(row, attempts=row['attempts'] + 1, claim_token=token))
+            return claimed
+
+    def complete(self, job: dict, duration: float) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'succeeded', error = NULL, finished_at = ?, duration = ?, claim_token = NULL "
+                "WHERE id = ? AND claim_token = ?",
+                (time.time(), duration, job['id'], job['claim_token']),
+            )
+
+    def fail(self, job: dict, error: str) -> None:
+        """Record a failed attempt: queue a retry after a backoff, or fail the job for good"""
+        now = time.time()
+        if job['attempts'] < self.max_attempts:
+            delay = min(self.backoff_max, self.backoff * (2 ** (job['attempts'] - 1)))
+            state, next_run_at = 'queued', now + delay
+            logger.warning(f"{job['job_type']} job for {job['mmid']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {error}")
+        else:
+            state, next_run_at = 'failed', now
+            logger.error(f"{job['job_type']} job for {job['mmid']} failed after {job['attempts']} attempts: {error}")
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, next_run_at = ?, finished_at = ?, claim_token = NULL "
+                "WHERE id = ? AND claim_token = ?",
+                (state, error, next_run_at, now, job['id'], job['claim_token']),
+            )
+
+    def publish(self, mmid: str, job_type: str, claim_token: str, install) -> bool:
+        """
+        Run `install()` (e.g. move the job's output into place) only if the attempt holding
+        `claim_token` is still the current one; a resubmission or requeue in the meantime makes
+        the attempt stale. Returns whether the output was installed.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT claim_token FROM jobs WHERE mmid = ? AND job_type = ?", (mmid, job_type)
+            ).fetchone()
+            if row is None or row['claim_token'] != claim_token:
+                return False
+            install()
+        return True
+
+    def get_job(self, mmid: str, job_type: str):
+        row = self._connection().execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE mmid = ? AND job_type = ?", (mmid, job_type)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_jobs(self, mmid: str) -> list:
+        rows = self._connection().execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE mmid = ? ORDER BY job_type", (mmid,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class JobDispatcher:
+    """
+    Background thread of a web worker that claims queued jobs, runs them on the JobRunner pools
+    and records the outcome in the JobQueue.
+    """
+
+    def __init__(self, queue: JobQueue, job_runner, max_running: dict, poll_interval: float):
+        self.queue = queue
+        self.job_runner = job_runner
+        self.max_running = max_running
+        self.poll_interval = poll_interval
+        self._in_flight = {job_type: 0 for job_type in max_running}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.dispatch()
+            except Exception as e:
+                logger.error(f"Job dispatcher error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def dispatch(self) -> None:
+        for job_type, max_running in self.max_running.items():
+            with self._lock:
+                free = self.job_runner.max_workers[job_type] - self._in_flight[job_type]
+            if free <= 0:
+                continue
+            for job in self.queue.claim(job_type, free, max_running):
+                self._submit(job)
+
+    def _submit(self, job: dict) -> None:
+        job_type = job['job_type']
+        try:
+            future = self.job_runner.submit(job_type, job['mmid'], job['data_file'], job['claim_token'])
+        except Exception as e:
+            self.queue.fail(job, str(e))
+            return
+        with self._lock:
+            self._in_flight[job_type] += 1
+
+        def on_done(done) -> None:
+            with self._lock:
+                self._in_flight[job_type] -= 1
+            try:
+                if done.cancelled():
+                    self.queue.fail(job, 'cancelled')
+                elif done.exception() is not None:
+                    self.queue.fail(job, str(done.exception()))
+                else:
+                    self.queue.complete(job, done.result())
+            except sqlite3.Error as e:
+                logger.error(f"Unable to record {job_type} job result for {job['mmid']}: {e}")
+            # a worker slot is free again
+            self.wake()
+
+        future.add_done_callback(on_done)
+
+
+_queue = None
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _dispatcher_lock:
+        if _queue is None or _queue.db_path != Config.JOB_QUEUE_PATH:
+            _queue = JobQueue(
+                Config.JOB_QUEUE_PATH,
+                max_attempts=config.JOB_MAX_ATTEMPTS,
+                backoff=config.JOB_RETRY_BACKOFF,
+                backoff_max=config.JOB_RETRY_BACKOFF_MAX,
+                lease_seconds=config.JOB_LEASE_SECONDS,
+            )
+        return _queue
+
+
+def get_job_dispatcher() -> JobDispatcher:
+    """Return this process's JobDispatcher, starting it on first use (after a fork, too)"""
+    global _dispatcher, _dispatcher_pid
+    queue = get_job_queue()
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != os.getpid():
+            _dispatcher = JobDispatcher(
+                queue,
+                get_job_runner(),
+                max_running={
+                    'ocr': config.OCR_MAX_RUNNING_JOBS,
+                    'clinical': config.CLINICAL_MAX_RUNNING_JOBS,
+                    'genomic': config.GENOMIC_MAX_RUNNING_JOBS,
+                },
+                poll_interval=config.JOB_POLL_INTERVAL,
+            )
+            _dispatcher_pid = os.getpid()
+            _dispatcher.start()
+        return _dispatcher
@@ -0,0 +1,133 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import time
+import atexit
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+import config
+
+# Job type -> 'module' whose main(data_file) runs it, or 'module:function'
+JOB_MODULES = {
+    'clinical': 'patient_data.get_patient_clinical_data',
+    'genomic': 'patient_data.get_patient_genomic_data',
+    'ocr': 'patient_data.ocr_service:run_ocr_job',
+}
+
+# Job types whose function also takes the job's claim token, to publish its output only while
+# the attempt is current (JobQueue.publish)
+CLAIM_TOKEN_JOBS = {'ocr'}
+
+_PATIENT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'patient_data')
+
+
+def _init_worker(target: str) -> None:
+    # the conversion scripts import their sibling modules as top-level modules
+    sys.path.append(_PATIENT_DATA_DIR)
+    importlib.import_module(target.partition(':')[0])
+
+
+def _run_job(target: str, data_file: str, claim_token: str = None) -> float:
+    module_name, _, function_name = target.partition(':')
+    function = getattr(importlib.import_module(module_name), function_name or 'main')
+    start = time.monotonic()
+    if claim_token is None:
+        function(data_file)
+    else:
+        function(data_file, claim_token)
+    return time.monotonic() - start
+
+
+class JobRunner:
+    """
+    Long-lived worker processes for the OCR, clinical and genomic jobs. Each job type has its
+    own pool whose workers import the job's module (census table, OncoTree file, ...) once,
+    so a submission costs a function call instead of a new interpreter.
+    """
+
+    def __init__(self, max_workers: dict, job_modules: dict = None):
+        self.max_workers = max_workers
+        self.job_modules = job_modules or JOB_MODULES
+        self._executors = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _executor(self, job_type: str) -> ProcessPoolExecutor:
+        executor = self._executors.get(job_type)
+        if executor is None:
+            # spawn: the web worker has threads running, which must not be forked
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers[job_type],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.job_modules[job_type],),
+            )
+            self._executors[job_type] = executor
+        return executor
+
+    def submit(self, job_type: str, unique_id: str, data_file: str, claim_token: str = None) -> Future:
+        """Queue a conversion; the returned future resolves to the job duration in seconds"""
+        submitted_at = time.monotonic()
+        args = (self.job_modules[job_type], data_file, claim_token if job_type in CLAIM_TOKEN_JOBS else None)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Job runner is shut down")
+            try:
+                future = self._executor(job_type).submit(_run_job, *args)
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM killed); start a fresh pool
+                logger.warning(f"Restarting broken {job_type} worker pool")
+                self._executors.pop(job_type).shutdown(wait=False)
+                future = self._executor(job_type).submit(_run_job, *args)
+
+        def log_result(done: Future) -> None:
+            total = time.monotonic() - submitted_at
+            if done.cancelled():
+                logger.warning(f"{job_type.capitalize()} data conversion for {unique_id} was cancelled")
+            elif done.exception() is not None:
+                logger.error(f"{job_type.capitalize()} data conversion for {unique_id} failed after {total:.1f}s: {done.exception()}")
+            else:
+                logger.info(
+                    f"Completed {job_type} data conversion for {unique_id} in {done.result():.1f}s "
+                    f"(queued {total - done.result():.1f}s)"
+                )
+
+        future.add_done_callback(log_result)
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting jobs and let the running ones finish (queued ones too when wait=True)"""
+        with self._lock:
+            self._closed = True
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+_runner = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """
+    Return this process's JobRunner. It is created on first use, so a preloading gunicorn master
+    never owns worker processes, and it is shut down gracefully when the process exits.
+    """
+    global _runner, _runner_pid
+    with _runner_lock:
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = JobRunner({
+                'ocr': config.OCR_JOB_WORKERS,
+                'clinical': config.CLINICAL_CONVERSION_WORKERS,
+                'genomic': config.GENOMIC_CONVERSION_WORKERS,
+            })
+            _runner_pid = os.getpid()
+            atexit.register(_runner.shutdown)
+        return _runner
@@ -0,0 +1,93 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import time
+import sqlite3
+from loguru import logger
+from utils.sqlite_store import SQLiteStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    image_hash TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+"""
+
+
+class OCRResultCache(SQLiteStore):
+    """
+    SQLite-backed cache of the extracted text of page images, keyed by the SHA-256 of the image
+    bytes. Entries of other OCR engines (or engine/preprocessing versions) are dropped when the
+    cache is opened; the least recently used ones are evicted beyond `max_entries` pages or
+    `max_bytes` of stored text.
+    """
+
+    def __init__(self, db_path: str, engine: str, max_entries: int, max_bytes: int):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        super().__init__(db_path, _SCHEMA)
+
+        with self._transaction() as conn:
+            removed = conn.execute("DELETE FROM pages WHERE engine != ?", (engine,)).rowcount
+        if removed:
+            logger.info(f"OCR cache | Invalidated {removed} pages from other OCR engines")
+
+    def get_many(self, image_hashes: list) -> dict:
+        """Return {image_hash: text} for the pages found in the cache"""
+        now = time.time()
+        unique_hashes = list(dict.fromkeys(image_hashes))
+        try:
+            with self._transaction() as conn:
+                placeholders = ', '.join('?' * len(unique_hashes))
+                found = dict(conn.execute(
+                    f"SELECT image_hash, text FROM pages WHERE engine = ? AND image_hash IN ({placeholders})",
+                    [self.engine] + unique_hashes,
+                ).fetchall())
+                conn.executemany("UPDATE pages SET accessed_at = ? WHERE image_hash = ?",
+                                 [(now, image_hash) for image_hash in found])
+        except sqlite3.Error as e:
+            logger.warning(f"OCR cache | Lookup failed, treating as miss: {e}")
+            found = {}
+        self.hits += len(found)
+        self.misses += len(unique_hashes) - len(found)
+        return found
+
+    def put_many(self, texts: dict) -> None:
+        """Store {image_hash: text} and evict the least recently used pages beyond the limits"""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pages (image_hash, engine, text, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(image_hash, self.engine, text, len(text.encode('utf-8')), now, now)
+                     for image_hash, text in texts.items()],
+                )
+                conn.execute(
+                    "DELETE FROM pages WHERE image_hash IN ("
+                    " SELECT image_hash FROM ("
+                    "  SELECT image_hash,"
+                    "   ROW_NUMBER() OVER (ORDER BY accessed_at DESC) AS position,"
+                    "   SUM(size) OVER (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING) AS running_size"
+                    "  FROM pages)"
+                    " WHERE position > ? OR running_size > ?)",
+                    (self.max_entries, self.max_bytes),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"OCR cache | Failed to store pages: {e}")
+
+    def stats(self) -> dict:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size_bytes': size, 'engine': self.engine}
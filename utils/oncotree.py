@@ -4,6 +4,8 @@ import os
 sys.path.append(os.path.abspath('../'))
 
 import csv
+import re
+import threading
 from collections import defaultdict
 import config
 
@@ -21,8 +23,15 @@ def _parse_level_value(value):
     return value.split('(')[0].strip()
 
 
-def _read_oncotree_rows():
-    with open(config.ONCOTREE_TXT_FILE_PATH) as f:
+def _parse_level_code(value):
+    if not value:
+        return ''
+    match = re.search(r'\(([^()]+)\)\s*$', value)
+    return match.group(1).strip() if match else ''
+
+
+def _read_oncotree_rows(file_path=None):
+    with open(file_path or config.ONCOTREE_TXT_FILE_PATH) as f:
         reader = csv.DictReader(f, delimiter='\t')
         level_columns = _get_level_columns(reader.fieldnames)
         rows = list(reader)
@@ -41,22 +50,114 @@ def _normalize_term(term):
     return term.strip().lower()
 
 
-def get_all_oncotree_data():
-    rows, level_columns = _read_oncotree_rows()
+class OncoTreeIndex:
+    """
+    In-memory lookup structures derived from the OncoTree file.
+    Built once per file version and shared by all lookups in this module.
+    """
+
+    def __init__(self, rows, level_columns, mtime=None):
+        self.level_columns = level_columns
+        self.mtime = mtime
+        self.paths = []
+        self.level_1_list = set()
+        self.mapping_l1_all = defaultdict(set)
+        self.mapping_l1_l2 = defaultdict(set)
+        # normalized term -> sorted child terms / deepest root-to-node path
+        self.children = {}
+        self.term_paths = {}
+        # unique (parent, child) edges in file order, for client-side autocomplete
+        self.autocomplete_data = []
+        # OncoTree code (e.g. NSCLC) -> term, metamaintype -> paths of its rows
+        self.codes = {}
+        self.metamaintypes = defaultdict(list)
+
+        children = defaultdict(set)
+        seen_edges = set()
+        for row in rows:
+            path = _row_path(row, level_columns)
+            self.paths.append(path)
+
+            for col in level_columns:
+                code = _parse_level_code(row[col])
+                if code:
+                    self.codes.setdefault(code.lower(), _parse_level_value(row[col]))
+            metamaintype = (row.get('metamaintype') or '').strip()
+            if metamaintype and path:
+                self.metamaintypes[metamaintype].append(path)
+
+            for index in range(1, len(path)):
+                edge = (path[index - 1], path[index])
+                if edge in seen_edges:
+                    continue
+                seen_edges.add(edge)
+                self.autocomplete_data.append({
+                    'parent': path[index - 1],
+                    'type': f'level{index + 1}',
+                    'value': path[index]
+                })
+
+            level_1 = _parse_level_value(row[level_columns[0]])
+            self.level_1_list.add(level_1)
+            self.mapping_l1_all[level_1].update(
+                _parse_level_value(row[col]) for col in level_columns[1:]
+            )
+            if len(level_columns) > 1:
+                level_2 = _parse_level_value(row[level_columns[1]])
+                if level_2:
+                    self.mapping_l1_l2[level_1].add(level_2)
+
+            for index, term in enumerate(path):
+                normalized = _normalize_term(term)
+                if index + 1 < len(path):
+                    children[normalized].add(path[index + 1])
+                # keep the first deepest occurrence, as the row scan used to
+                best_path = self.term_paths.get(normalized)
+                if best_path is None or index + 1 > len(best_path):
+                    self.term_paths[normalized] = tuple(path[: index + 1])
+
+        for values in self.mapping_l1_all.values():
+            values.discard('')
+        self.children = {term: sorted(values) for term, values in children.items()}
+
+    @classmethod
+    def from_file(cls, file_path):
+        mtime = os.stat(file_path).st_mtime_ns
+        rows, level_columns = _read_oncotree_rows(file_path)
+        return cls(rows, level_columns, mtime)
+
+    def get_children(self, parent_term):
+        return list(self.children.get(_normalize_term(parent_term), []))
+
+    def get_path(self, term):
+        path = self.term_paths.get(_normalize_term(term))
+        return list(path) if path else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_oncotree_index():
+    """
+    Return the shared OncoTreeIndex, rebuilding it when the file's mtime changes.
+    """
+    global _index
+    file_path = config.ONCOTREE_TXT_FILE_PATH
+    mtime = os.stat(file_path).st_mtime_ns
+    index = _index
+    if index is not None and index.mtime == mtime:
+        return index
+    with _index_lock:
+        if _index is None or _index.mtime != mtime:
+            _index = OncoTreeIndex.from_file(file_path)
+        return _index
 
-    level_1_list = set()
-    mapping_l1_all = defaultdict(set)
 
-    for row in rows:
-        level_1 = _parse_level_value(row[level_columns[0]])
-        level_1_list.add(level_1)
-        mapping_l1_all[level_1].update(
-            _parse_level_value(row[col]) for col in level_columns[1:]
-        )
-
-    for values in mapping_l1_all.values():
-        values.discard('')
-    return level_1_list, mapping_l1_all
+def get_all_oncotree_data():
+    index = get_oncotree_index()
+    mapping_l1_all = defaultdict(set, {key: set(values) for key, values in index.mapping_l1_all.items()})
+    return set(index.level_1_list), mapping_l1_all
 
 
 def get_all_diagnosis_terms():
@@ -93,52 +194,15 @@ def canonicalize_term(term, candidates):
 
 
 def get_children_of_term(parent_term):
-    rows, level_columns = _read_oncotree_rows()
-    parent_normalized = _normalize_term(parent_term)
-    children = set()
-
-    for row in rows:
-        path = _row_path(row, level_columns)
-        for index, term in enumerate(path):
-            if _normalize_term(term) == parent_normalized and index + 1 < len(path):
-                children.add(path[index + 1])
-
-    return sorted(children)
+    return get_oncotree_index().get_children(parent_term)
 
 
 def resolve_diagnosis_hierarchy(diagnosis_value):
-    rows, level_columns = _read_oncotree_rows()
-    target_normalized = _normalize_term(diagnosis_value)
-
-    best_path = None
-    best_depth = -1
-
-    for row in rows:
-        path = _row_path(row, level_columns)
-        for index, term in enumerate(path):
-            if _normalize_term(term) == target_normalized and index > best_depth:
-                best_depth = index
-                best_path = path[: index + 1]
-
-    return build_diagnosis_result_from_path(best_path) if best_path else None
+    path = get_oncotree_index().get_path(diagnosis_value)
+    return build_diagnosis_result_from_path(path) if path else None
 
 
 def get_l1_l2_oncotree_data():
-    print(config.ONCOTREE_TXT_FILE_PATH)
-    rows, level_columns = _read_oncotree_rows()
-
-    level_1_list = set()
-    mapping_l1_l2 = defaultdict(set)
-
-    for row in rows:
-        level_1 = _parse_level_value(row[level_columns[0]])
-        level_1_list.add(level_1)
-        if len(level_columns) > 1:
-            level_2 = _parse_level_value(row[level_columns[1]])
-            if level_2:
-                mapping_l1_l2[level_1].add(level_2)
-
-    for values in mapping_l1_l2.values():
-        values.discard('')
-
-    return level_1_list, mapping_l1_l2
+    index = get_oncotree_index()
+    mapping_l1_l2 = defaultdict(set, {key: set(values) for key, values in index.mapping_l1_l2.items()})
+    return set(index.level_1_list), mapping_l1_l2
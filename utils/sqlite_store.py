@@ -0,0 +1,72 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath('../'))
+
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of the file's bytes (the content key of the OCR cache and the ingest manifest)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def process_alive(pid: int) -> bool:
+    """Whether a process (e.g. the owner of a claimed row) is still running on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteStore:
+    """
+    Base of the SQLite files shared by the web workers and background processes (job queue,
+    caches, manifests). The database runs in WAL mode; every thread of every process gets its own
+    connection, and writes go through `_transaction()`.
+    """
+
+    # e.g. sqlite3.Row
+    row_factory = None
+
+    def __init__(self, db_path: str, schema: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(schema)
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction (BEGIN IMMEDIATE), rolled back if the block raises"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")